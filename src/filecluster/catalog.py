@@ -0,0 +1,194 @@
+"""Per-library catalog of the cluster info.
+
+Reading thousands of small .cluster.ini files is slow, especially over SMB. The
+catalog (an SQLite file in the library root) keeps the cluster info of all event
+folders together with the mtime and size of the ini file each row was read from.
+
+The ini files stay the source of truth: a catalog row is used only if its ini
+file was not modified since. Other folders are read as before and the catalog
+is updated with their rows.
+"""
+
+from __future__ import annotations
+
+import os
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+
+from filecluster import logger
+from filecluster.configuration import default_settings
+from filecluster.filecluster_types import ClusterRow
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS clusters (
+    event_dir TEXT PRIMARY KEY,
+    ini_mtime_ns INTEGER NOT NULL,
+    ini_size INTEGER NOT NULL,
+    start_date TEXT,
+    end_date TEXT,
+    is_continuous INTEGER NOT NULL,
+    median TEXT,
+    file_count INTEGER NOT NULL
+)
+"""
+
+
+def _to_text(value: datetime | str | None) -> str | None:
+    return None if value is None else str(value)
+
+
+def _to_datetime(value: str | None) -> datetime | None:
+    return None if value is None else datetime.fromisoformat(value)
+
+
+def _event_key(event_dir: str | Path) -> str:
+    return Path(event_dir).as_posix()
+
+
+class LibraryCatalog:
+    """SQLite catalog of the event folders of a single library."""
+
+    def __init__(self, library_path: str | Path):
+        self.library_path = Path(library_path)
+        self.path = self.library_path / default_settings.library_catalog_filename
+        self.conn = sqlite3.connect(self.path)
+        self.conn.execute(_SCHEMA)
+        self._stored = self._load()
+
+    def __enter__(self) -> LibraryCatalog:
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Close the database connection."""
+        self.conn.close()
+
+    def _ini_stat(self, event_dir: str) -> tuple[int, int] | None:
+        ini_path = self.library_path / event_dir / default_settings.ini_filename
+        try:
+            st = os.stat(ini_path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def _load(self) -> dict[str, tuple]:
+        return {
+            row[0]: row[1:]
+            for row in self.conn.execute(
+                "SELECT event_dir, ini_mtime_ns, ini_size, start_date, end_date, "
+                "is_continuous, median, file_count FROM clusters"
+            )
+        }
+
+    def get_unchanged(self, event_dir: str) -> ClusterRow | None:
+        """Get the catalog row of a folder if its ini file did not change.
+
+        Rows are read once, when the catalog is opened, so this method does not
+        touch the database and can be called from other threads.
+
+        Args:
+            event_dir: event folder name relative to the library root
+
+        Returns:
+            Cluster info or None if the folder has to be read from the ini file.
+        """
+        row = self._stored.get(_event_key(event_dir))
+        if row is None or self._ini_stat(event_dir) != tuple(row[:2]):
+            return None
+        start, end, is_continuous, median, file_count = row[2:]
+        return ClusterRow(
+            start_date=_to_datetime(start),
+            end_date=_to_datetime(end),
+            is_continuous=bool(is_continuous),
+            median=_to_datetime(median),
+            file_count=file_count,
+            path=self.library_path / event_dir,
+        )
+
+    def split_unchanged(
+        self, event_dirs: list[str]
+    ) -> tuple[list[ClusterRow], list[str]]:
+        """Get catalog rows of folders with unchanged ini files.
+
+        Args:
+            event_dirs: event folder names relative to the library root
+
+        Returns:
+            Tuple of:
+                - cluster rows of the folders whose ini file did not change
+                - event folders that have to be read from the ini files
+        """
+        rows, to_read = [], []
+        for event_dir in event_dirs:
+            if (row := self.get_unchanged(event_dir)) is not None:
+                rows.append(row)
+            else:
+                to_read.append(event_dir)
+        return rows, to_read
+
+    def _records(self, rows: list[ClusterRow]) -> list[tuple]:
+        records = []
+        for row in rows:
+            event_dir = Path(row.path).relative_to(self.library_path)
+            ini_stat = self._ini_stat(str(event_dir))
+            if ini_stat is None:
+                continue
+            records.append(
+                (
+                    _event_key(event_dir),
+                    *ini_stat,
+                    _to_text(row.start_date),
+                    _to_text(row.end_date),
+                    int(row.is_continuous),
+                    _to_text(row.median),
+                    int(row.file_count),
+                )
+            )
+        return records
+
+    def upsert(self, rows: list[ClusterRow]) -> None:
+        """Store rows of (re)written ini files, keep the other rows."""
+        records = self._records(rows)
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO clusters VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                records,
+            )
+        self._stored = self._load()
+
+    def update(self, rows: list[ClusterRow], event_dirs: list[str]) -> None:
+        """Store rows read from the ini files and forget removed folders.
+
+        Args:
+            rows: cluster rows read from the ini files
+            event_dirs: all event folders currently present in the library
+        """
+        records = self._records(rows)
+        present = {_event_key(d) for d in event_dirs}
+        with self.conn:
+            removed = [
+                (key,)
+                for (key,) in self.conn.execute("SELECT event_dir FROM clusters")
+                if key not in present
+            ]
+            self.conn.executemany("DELETE FROM clusters WHERE event_dir = ?", removed)
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO clusters VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                records,
+            )
+        self._stored = self._load()
+        logger.debug(
+            f"Catalog {self.path}: {len(records)} rows updated, {len(removed)} removed"
+        )
+
+
+def open_library_catalog(library_path: str | Path) -> LibraryCatalog | None:
+    """Open the catalog of the library, None if it can't be used."""
+    try:
+        return LibraryCatalog(library_path)
+    except sqlite3.Error as e:
+        logger.warning(f"Cannot open library catalog in {library_path}: {e}")
+        return None
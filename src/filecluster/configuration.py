@@ -56,13 +56,53 @@ class CopyMode(Enum):
     NOP = 3
 
 
+class CopyMethod(Enum):
+    """How the files are copied in the COPY mode.
+
+    Attributes:
+        COPY: copy the file data
+        HARDLINK: create a hard link (source and destination share the inode)
+        REFLINK: clone the file, sharing data blocks until one of the copies
+            is modified (copy-on-write filesystems, e.g. btrfs, xfs)
+
+    Links are possible only within one filesystem, files on other devices are
+    copied.
+    """
+
+    COPY = 1
+    HARDLINK = 2
+    REFLINK = 3
+
+
 class Status(Enum):
-    """Cluster status."""
+    """Cluster status.
+
+    DUPLICATE - the file already exists in a library
+    INBOX_DUPLICATE - the same file is in the inbox under another name
+    """
 
     UNKNOWN = 0
     NEW_CLUSTER = 1
     EXISTING_CLUSTER = 2
     DUPLICATE = 3
+    INBOX_DUPLICATE = 4
+
+
+class FolderIssue(Enum):
+    """Problem with a library folder found by the library validator.
+
+    UNKNOWN_TYPE - folder does not follow the year/event/sel/sub-event layout
+    EMPTY - folder without any files or subfolders
+    NON_COMPLIANT - folder contains subfolders but no media files
+    DISCONTINUOUS - event with gaps between its media files (from .cluster.ini)
+    CORRUPT_INI - event with .cluster.ini file that can't be read
+    """
+
+    UNKNOWN_TYPE = "unknown_type"
+    EMPTY = "empty"
+    NON_COMPLIANT = "non_compliant"
+    DISCONTINUOUS = "discontinuous"
+    CORRUPT_INI = "corrupt_ini"
 
 
 class FileClusterSettings(BaseSettings):
@@ -73,6 +113,10 @@ class FileClusterSettings(BaseSettings):
 
     # Common file settings
     ini_filename: str = ".cluster.ini"
+    library_filter_filename: str = ".library.bloom"
+    library_phash_filename: str = ".library.phash"
+    library_catalog_filename: str = ".library.catalog"
+    journal_filename: str = ".filecluster.journal"
     image_extensions: list[str] = [
         ".jpg",
         ".jpeg",
@@ -108,7 +152,46 @@ class FileClusterSettings(BaseSettings):
     force_deep_scan: bool = False
     assign_to_clusters_existing_in_libs: bool = False
     skip_duplicated_existing_in_libs: bool = False
+    skip_duplicated_in_inbox: bool = False
     restore_original_names: bool = False
+    use_library_prescreen: bool = False
+    detect_near_duplicates: bool = False
+
+    # Near-duplicate search: max number of differing bits of perceptual hashes
+    near_duplicate_max_distance: int = 6
+
+    # Number of worker processes, 0 - number of CPUs
+    worker_pool_size: int = 0
+
+    # Number of concurrent copy/move operations per destination device
+    copy_jobs_per_device: int = 4
+    copy_method: CopyMethod = CopyMethod.COPY
+
+    # Copy engine: buffer used when the kernel can't copy the data, whether to
+    # drop copied files from the page cache (keeps the metadata cached, but
+    # every copied file is synced to the disk)
+    copy_buffer_size: int = 8 * 2**20
+    copy_drop_cache: bool = False
+
+    # Verify copies against the sha1 of the inbox files, repeat failed copies
+    verify_copies: bool = False
+    copy_verify_retries: int = 2
+
+    # Limits of the load of each destination device during the execution
+    # (bytes/s, file operations/s, 0 - unlimited), lower CPU and I/O priority
+    io_bandwidth_limit: float = 0
+    io_ops_limit: float = 0
+    background_mode: bool = False
+    background_niceness: int = 10
+
+    # Reorder the planned operations: by destination folder, reading the
+    # sources in inode order (fewer seeks on rotational disks)
+    optimize_plan_order: bool = True
+
+    # Free space left on destination devices by an execution of the plan, data
+    # written by the throughput probe of the devices in dry runs
+    free_space_reserve: int = 64 * 2**20
+    throughput_probe_size: int = 16 * 2**20
 
     # Time settings
     time_granularity_minutes: int = 60
@@ -178,6 +261,28 @@ class Config:
         skip_duplicated_existing_in_libs: Whether to skip duplicated files
         restore_original_names: Whether to revert copy-suffixed file names to
             their originals when moving/copying into cluster folders
+        use_library_prescreen: Whether to reject definitely-new inbox files
+            with the Bloom filter persisted in each library before the
+            duplicate search
+        skip_duplicated_in_inbox: Whether to move only one copy of files
+            present in the inbox several times and skip the other copies
+        detect_near_duplicates: Whether to look for library images similar to
+            inbox images (recompressed or resized copies)
+        near_duplicate_max_distance: Max Hamming distance of perceptual hashes
+            of near-duplicate images
+        worker_pool_size: Number of worker processes shared by the pipeline
+            stages (0 - number of CPUs)
+        copy_jobs_per_device: Number of concurrent copy/move operations per
+            destination device
+        copy_method: How files are copied in the COPY mode (data copy, hard
+            link or reflink)
+        verify_copies: Whether copied data is hashed and compared with the
+            hash of the inbox file
+        io_bandwidth_limit: Max bytes per second written to each destination
+            device (0 - unlimited)
+        io_ops_limit: Max file operations per second on each destination
+            device (0 - unlimited)
+        background_mode: Whether to run with lowered CPU and I/O priority
     """
 
     in_dir_name: Path
@@ -193,6 +298,17 @@ class Config:
     assign_to_clusters_existing_in_libs: bool
     skip_duplicated_existing_in_libs: bool
     restore_original_names: bool = False
+    use_library_prescreen: bool = False
+    skip_duplicated_in_inbox: bool = False
+    detect_near_duplicates: bool = False
+    near_duplicate_max_distance: int = 6
+    worker_pool_size: int = 0
+    copy_jobs_per_device: int = 4
+    copy_method: CopyMethod = CopyMethod.COPY
+    verify_copies: bool = False
+    io_bandwidth_limit: float = 0
+    io_ops_limit: float = 0
+    background_mode: bool = False
 
     def __repr__(self) -> str:
         rep = [f"{p}:\t{self.__getattribute__(p)}" for p in self.__dataclass_fields__]
@@ -298,6 +414,17 @@ class ConfigFactory:
             assign_to_clusters_existing_in_libs=self.settings.assign_to_clusters_existing_in_libs,
             skip_duplicated_existing_in_libs=self.settings.skip_duplicated_existing_in_libs,
             restore_original_names=self.settings.restore_original_names,
+            use_library_prescreen=self.settings.use_library_prescreen,
+            skip_duplicated_in_inbox=self.settings.skip_duplicated_in_inbox,
+            detect_near_duplicates=self.settings.detect_near_duplicates,
+            near_duplicate_max_distance=self.settings.near_duplicate_max_distance,
+            worker_pool_size=self.settings.worker_pool_size,
+            copy_jobs_per_device=self.settings.copy_jobs_per_device,
+            copy_method=self.settings.copy_method,
+            verify_copies=self.settings.verify_copies,
+            io_bandwidth_limit=self.settings.io_bandwidth_limit,
+            io_ops_limit=self.settings.io_ops_limit,
+            background_mode=self.settings.background_mode,
         )
 
     @staticmethod
@@ -0,0 +1,256 @@
+"""Copying of file data for the plan executor.
+
+Media files are large (videos of several GB), so the data is copied by the
+kernel where possible instead of Python-level buffered reads:
+
+1. copy_file_range (Linux, also across filesystems on recent kernels),
+2. sendfile (Linux, file to file),
+3. read/write through a large page-aligned buffer (other platforms).
+
+Each method continues from where the previous one failed or stopped short of
+the source size. A copy that still doesn't match the source size raises
+OSError, so a move never removes the source of an incomplete copy.
+
+With drop_cache, the kernel is told that the files are read sequentially and
+their pages are dropped from the page cache after the copy, so a bulk video
+import doesn't evict the cached metadata (directories, ini files) of the other
+stages.
+
+Copies can be verified against the known sha1 of the source: the data then
+passes through the buffer and is hashed on the way (no extra read pass).
+
+With a throttle (see filecluster.throttle) the data is copied in chunks of the
+buffer size and every chunk is accounted to the bandwidth limit.
+"""
+
+from __future__ import annotations
+
+import errno
+import hashlib
+import io
+import mmap
+import os
+from contextlib import suppress
+from pathlib import Path
+from shutil import SameFileError, copystat
+from typing import TYPE_CHECKING
+
+from filecluster import logger
+from filecluster.configuration import default_settings
+
+if TYPE_CHECKING:
+    from filecluster.throttle import DeviceThrottle
+
+# chunk passed to a single kernel copy call
+KERNEL_COPY_CHUNK = 2**30
+
+
+def _fadvise(fd: int, advice_name: str) -> None:
+    """Give a hint on the file access pattern, ignored where not supported."""
+    advice = getattr(os, advice_name, None)
+    if advice is None:
+        return
+    with suppress(OSError):
+        os.posix_fadvise(fd, 0, 0, advice)
+
+
+def _copy_file_range(
+    fd_in: int,
+    fd_out: int,
+    chunk: int = KERNEL_COPY_CHUNK,
+    throttle: DeviceThrottle | None = None,
+) -> int:
+    """Copy from the current positions to the end, return number of bytes."""
+    copied = 0
+    while n := os.copy_file_range(fd_in, fd_out, chunk):
+        copied += n
+        if throttle is not None:
+            throttle.transfer(n)
+    return copied
+
+
+def _sendfile(
+    fd_in: int,
+    fd_out: int,
+    offset: int,
+    chunk: int = KERNEL_COPY_CHUNK,
+    throttle: DeviceThrottle | None = None,
+) -> int:
+    copied = 0
+    while n := os.sendfile(fd_out, fd_in, offset + copied, chunk):
+        copied += n
+        if throttle is not None:
+            throttle.transfer(n)
+    return copied
+
+
+def _buffered_copy(
+    fsrc: io.FileIO,
+    fdst: io.FileIO,
+    buffer_size: int,
+    hasher=None,
+    throttle: DeviceThrottle | None = None,
+) -> None:
+    # anonymous mmap is page-aligned
+    with mmap.mmap(-1, buffer_size) as buffer:
+        view = memoryview(buffer)
+        try:
+            while n := fsrc.readinto(view):
+                if hasher is not None:
+                    hasher.update(view[:n])
+                written = 0
+                while written < n:
+                    written += fdst.write(view[written:n])
+                if throttle is not None:
+                    throttle.transfer(n)
+        finally:
+            view.release()
+
+
+def _copy_data(
+    fsrc: io.FileIO,
+    fdst: io.FileIO,
+    buffer_size: int,
+    hasher=None,
+    throttle: DeviceThrottle | None = None,
+) -> None:
+    """Copy the data with the fastest method supported by the platform.
+
+    The data passes through the buffer when it has to be hashed. Throttled
+    kernel copies are split into chunks of the buffer size. A kernel copy that
+    fails or stops short of the source size is continued by the next method.
+
+    Raises:
+        OSError: the copied data doesn't match the source size
+    """
+    fd_in, fd_out = fsrc.fileno(), fdst.fileno()
+    size = os.fstat(fd_in).st_size
+    if hasher is not None:
+        _buffered_copy(fsrc, fdst, buffer_size, hasher, throttle)
+        _check_copied(fsrc, fdst, size)
+        return
+    chunk = KERNEL_COPY_CHUNK if throttle is None else buffer_size
+    offset = 0
+    if hasattr(os, "copy_file_range"):
+        # e.g. EXDEV on older kernels, continue from the current position
+        with suppress(OSError):
+            _copy_file_range(fd_in, fd_out, chunk, throttle)
+        offset = fdst.tell()
+        if offset == size:
+            return
+    if hasattr(os, "sendfile"):
+        with suppress(OSError):
+            _sendfile(fd_in, fd_out, offset, chunk, throttle)
+        offset = fdst.tell()
+        if offset == size:
+            return
+    if offset:
+        logger.debug(f"Kernel copied {offset} of {size} bytes of {fsrc.name}")
+    fsrc.seek(offset)
+    _buffered_copy(fsrc, fdst, buffer_size, throttle=throttle)
+    _check_copied(fsrc, fdst, size)
+
+
+def _check_copied(fsrc: io.FileIO, fdst: io.FileIO, size: int) -> None:
+    copied = fdst.tell()
+    if copied != size:
+        raise OSError(
+            errno.EIO, f"Short copy: {copied} of {size} bytes copied", fsrc.name
+        )
+
+
+def same_file(src: str | Path, dst: str | Path) -> bool:
+    """Check if both paths are the same file (e.g. hard links of one inode)."""
+    try:
+        return os.path.samefile(src, dst)
+    except OSError:
+        return False
+
+
+def copy_file(
+    src: str | Path,
+    dst: str | Path,
+    buffer_size: int | None = None,
+    drop_cache: bool | None = None,
+    hasher=None,
+    throttle: DeviceThrottle | None = None,
+) -> None:
+    """Copy the file data and metadata (like shutil.copy2).
+
+    Args:
+        src: source file
+        dst: destination file (overwritten if exists)
+        buffer_size: buffer used when the kernel can't copy the data (default
+            from settings)
+        drop_cache: drop pages of both files from the page cache after the
+            copy (default from settings)
+        hasher: hashlib object updated with the copied data
+        throttle: bandwidth limit of the destination device
+
+    Raises:
+        SameFileError: src and dst are the same file (opening dst for writing
+            would truncate the source)
+    """
+    if same_file(src, dst):
+        raise SameFileError(f"{src!r} and {dst!r} are the same file")
+    if buffer_size is None:
+        buffer_size = default_settings.copy_buffer_size
+    if drop_cache is None:
+        drop_cache = default_settings.copy_drop_cache
+    # whole pages, so the buffer stays aligned
+    buffer_size = max(mmap.PAGESIZE, buffer_size - buffer_size % mmap.PAGESIZE)
+
+    with open(src, "rb", buffering=0) as fsrc, open(dst, "wb", buffering=0) as fdst:
+        if drop_cache:
+            _fadvise(fsrc.fileno(), "POSIX_FADV_SEQUENTIAL")
+        _copy_data(fsrc, fdst, buffer_size, hasher, throttle)
+        if drop_cache:
+            _fadvise(fsrc.fileno(), "POSIX_FADV_DONTNEED")
+            # dirty pages can't be dropped before they are written
+            getattr(os, "fdatasync", os.fsync)(fdst.fileno())
+            _fadvise(fdst.fileno(), "POSIX_FADV_DONTNEED")
+    copystat(src, dst)
+
+
+def copy_file_verified(
+    src: str | Path,
+    dst: str | Path,
+    expected_hash: str,
+    retries: int | None = None,
+    throttle: DeviceThrottle | None = None,
+) -> bool:
+    """Copy the file, comparing sha1 of the copied data with the expected one.
+
+    The data is hashed while it is copied, neither file is read again. A copy
+    with a different hash is repeated, the destination is removed if all
+    attempts fail.
+
+    Args:
+        src: source file
+        dst: destination file
+        expected_hash: sha1 of the source file (hex digest)
+        retries: number of repeated copies after a mismatch (default from
+            settings)
+        throttle: bandwidth limit of the destination device
+
+    Returns:
+        True if the copy matches the expected hash.
+
+    Raises:
+        SameFileError: src and dst are the same file
+    """
+    if same_file(src, dst):
+        raise SameFileError(f"{src!r} and {dst!r} are the same file")
+    if retries is None:
+        retries = default_settings.copy_verify_retries
+    for attempt in range(retries + 1):
+        hasher = hashlib.sha1()
+        copy_file(src, dst, hasher=hasher, throttle=throttle)
+        if hasher.hexdigest() == expected_hash:
+            return True
+        logger.warning(
+            f"Copy of {src} doesn't match its hash (attempt {attempt + 1} of "
+            f"{retries + 1})"
+        )
+    Path(dst).unlink(missing_ok=True)
+    return False
@@ -1,7 +1,10 @@
 """Module for handling operations on both databases: media and clusters."""
 
 import itertools
-import multiprocessing
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from multiprocessing.pool import Pool
 from pathlib import Path
 
 import pandas as pd
@@ -12,6 +15,8 @@ from filecluster import logger
 from filecluster.configuration import default_settings
 from filecluster.filecluster_types import ClustersDataFrame
 from filecluster.update_clusters import get_or_create_library_cluster_ini_as_dataframe
+from filecluster.utlis import get_device_id
+from filecluster.workers import create_worker_pool
 
 
 def get_existing_clusters_info(
@@ -19,9 +24,17 @@ def get_existing_clusters_info(
     skip_duplicated_existing_in_libs: bool,
     assign_to_clusters_existing_in_libs: bool,
     force_deep_scan: bool,
+    pool: Pool | None = None,
 ) -> tuple[ClustersDataFrame, list[Path], list[str]]:
     """Scan the library, find existing clusters and empty or non-compliant folders.
 
+    Args:
+        watch_folders: library folders to be scanned
+        skip_duplicated_existing_in_libs: whether duplicates will be searched
+        assign_to_clusters_existing_in_libs: whether existing clusters are used
+        force_deep_scan: rescan folders changed since their ini was saved
+        pool: worker pool of the pipeline, a temporary pool is created if None
+
     Returns:
         Tuple of:
             - ClustersDataFrame object with columns: ['cluster_id', 'start_date', 'end_date', 'median', 'is_continuous',
@@ -31,17 +44,14 @@ def get_existing_clusters_info(
 
             - list of empty folders
             - list of non-compliant folders (folders that contain only subfolders
-                instead of media files) - not implemented yet
+                instead of media files)
     """
     # TODO: Any non-empty subfolder of year folder should contain .cluster.ini
     #  file (see: Runmageddon example). Non-empty means - contains media files
 
-    n_cpu = multiprocessing.cpu_count()
-    logger.debug(f"Setting-up multiprocessing pool with {n_cpu} processes")
-
     # NOTE: this requires refactoring in scan_library_dir()
 
-    # TODO: KS: 2020-12-26: non-compliant - folders than contains no media files but subfolders
+    # non-compliant - folders that contain no media files but subfolders
     non_compliant_folders = []
 
     # totally empty folders (no files, no dirs)
@@ -55,15 +65,11 @@ def get_existing_clusters_info(
 
     # Start scanning watch folders to get cluster information
     if use_watch_folders and len(watch_folders):
-        with multiprocessing.Pool(processes=n_cpu) as pool:
-            logger.debug("Pool ready to use")
-            tuples = [
-                get_or_create_library_cluster_ini_as_dataframe(
-                    lib, pool, force_deep_scan
-                )
-                for lib in watch_folders
-            ]
-        dfs, empty_folder_list = map(list, zip(*tuples, strict=False))
+        with nullcontext(pool) if pool else create_worker_pool() as scan_pool:
+            tuples = scan_libraries(watch_folders, scan_pool, force_deep_scan)
+        dfs, empty_folder_list, non_compliant_lists = map(
+            list, zip(*tuples, strict=False)
+        )
         df = pd.concat(dfs, axis=0)
         df.index = range(len(df))
         df = df.reset_index()
@@ -71,11 +77,47 @@ def get_existing_clusters_info(
 
         # Flatten the list of empty directories:
         empty_folder_list = list(itertools.chain(*empty_folder_list))
+        non_compliant_folders = list(itertools.chain(*non_compliant_lists))
     else:
         df = pd.DataFrame(columns=pd.Index(default_settings.cluster_df_columns))
     return ClustersDataFrame(df), empty_folder_list, non_compliant_folders
 
 
+def scan_libraries(
+    watch_folders: list[Path], pool: Pool, force_deep_scan: bool
+) -> list[tuple[pd.DataFrame, list[Path], list[str]]]:
+    """Scan the libraries concurrently, one thread per disk.
+
+    Libraries on the same device are scanned one after another, so each disk
+    gets a single stream of directory walks and ini reads. All threads share
+    the worker pool.
+
+    Returns:
+        Results of get_or_create_library_cluster_ini_as_dataframe with the
+        non-compliant folders found by the same walk, in the order of
+        watch_folders.
+    """
+    by_device: dict[int, list[int]] = defaultdict(list)
+    for i, lib in enumerate(watch_folders):
+        by_device[get_device_id(lib)].append(i)
+    logger.debug(f"Scanning {len(watch_folders)} libraries on {len(by_device)} disks")
+
+    results: list = [None] * len(watch_folders)
+
+    def scan_device(indices: list[int]) -> None:
+        for i in indices:
+            non_compliant: list[str] = []
+            df, empty_dirs = get_or_create_library_cluster_ini_as_dataframe(
+                watch_folders[i], pool, force_deep_scan, non_compliant=non_compliant
+            )
+            results[i] = (df, empty_dirs, sorted(non_compliant))
+
+    with ThreadPoolExecutor(max_workers=len(by_device) or 1) as threads:
+        # list() re-raises errors of the scans
+        list(threads.map(scan_device, by_device.values()))
+    return results
+
+
 def get_new_cluster_id_from_dataframe(df_clusters: DataFrame) -> int64 | int:
     """Return cluster id value that is greater than all already used cluster ids.
 
@@ -0,0 +1,71 @@
+"""Tiered detection of byte-identical files.
+
+Files are compared lazily, each tier only for the files that still collide:
+
+1. size,
+2. partial hash (head of the file),
+3. full hash.
+"""
+
+from __future__ import annotations
+
+from collections import defaultdict
+from collections.abc import Hashable, Iterable
+from pathlib import Path
+
+from filecluster.utlis import hash_file, partial_hash_file
+
+
+def _split_by(items: list, key_func) -> list[list]:
+    """Split items into groups of equal key, drop singletons and None keys."""
+    groups: dict = defaultdict(list)
+    for item in items:
+        key = key_func(item)
+        if key is not None:
+            groups[key].append(item)
+    return [g for g in groups.values() if len(g) > 1]
+
+
+def _full_hash_is_known(known_hash) -> bool:
+    return isinstance(known_hash, str) and bool(known_hash)
+
+
+def _full_hash(path: Path, known_hash: str | None) -> str | None:
+    if _full_hash_is_known(known_hash):
+        return known_hash
+    try:
+        return hash_file(path)
+    except OSError:
+        return None
+
+
+def group_identical_files(
+    files: Iterable[tuple[Hashable, str | Path, int]],
+    known_hashes: dict[Hashable, str] | None = None,
+) -> list[list[Hashable]]:
+    """Find groups of byte-identical files.
+
+    Args:
+        files: tuples (key, path, size) describing the files to compare
+        known_hashes: already computed full hashes (sha1), by key
+
+    Returns:
+        Groups (with at least two members) of keys of identical files, members
+        in the input order.
+    """
+    known_hashes = known_hashes or {}
+    items = [(key, Path(path), int(size)) for key, path, size in files]
+
+    identical = []
+    for same_size in _split_by(items, lambda it: it[2]):
+        # no need to read file heads when all full hashes are already known
+        if all(_full_hash_is_known(known_hashes.get(it[0])) for it in same_size):
+            identical.extend(_split_by(same_size, lambda it: known_hashes[it[0]]))
+            continue
+        for same_head in _split_by(same_size, lambda it: partial_hash_file(it[1])):
+            identical.extend(
+                _split_by(
+                    same_head, lambda it: _full_hash(it[1], known_hashes.get(it[0]))
+                )
+            )
+    return [[key for key, _, _ in group] for group in identical]
@@ -13,3 +13,26 @@ class MissingDfClusterColumnError(Exception):
 
     def __init__(self, column_name):
         self.message = f"Column {column_name} is missing in data frame."
+
+
+class UnfinishedPlanError(Exception):
+    """Exception for the case when the previous run was interrupted."""
+
+    def __init__(self, journal_path):
+        self.message = (
+            f"Execution of the previous plan was interrupted ({journal_path}), "
+            "finish it with --resume first."
+        )
+        super().__init__(self.message)
+
+
+class InsufficientDiskSpaceError(Exception):
+    """Exception for the case when a destination device lacks free space."""
+
+    def __init__(self, path, required_bytes, free_bytes):
+        self.message = (
+            f"Not enough free space on the device of {path}: "
+            f"{required_bytes / 2**20:.1f} MiB required, "
+            f"{free_bytes / 2**20:.1f} MiB free."
+        )
+        super().__init__(self.message)
@@ -11,12 +11,26 @@ from typing import Any
 
 from filecluster import logger
 from filecluster.configuration import (
+    Config,
+    CopyMethod,
     CopyMode,
     default_factory,
+    default_settings,
 )
 from filecluster.dbase import get_existing_clusters_info
+from filecluster.exceptions import UnfinishedPlanError
+from filecluster.file_operations import CopyOp, execute_plan, save_plan
 from filecluster.image_grouper import ImageGrouper
 from filecluster.image_reader import InboxReader
+from filecluster.journal import PlanJournal
+from filecluster.plan_cost import (
+    DeviceCost,
+    check_free_space,
+    estimate_plan_cost,
+    format_plan_cost,
+)
+from filecluster.throttle import set_background_priority
+from filecluster.workers import create_worker_pool
 
 
 def main(
@@ -30,6 +44,18 @@ def main(
     drop_duplicates: bool | None = None,
     use_existing_clusters: bool | None = None,
     restore_original_names: bool | None = None,
+    library_prescreen: bool | None = None,
+    dedupe_inbox: bool | None = None,
+    near_duplicates: bool | None = None,
+    jobs: int | None = None,
+    copy_jobs: int | None = None,
+    copy_method: CopyMethod | None = None,
+    resume: bool = False,
+    plan_file: str | None = None,
+    verify: bool | None = None,
+    bandwidth_limit: float | None = None,
+    ops_limit: float | None = None,
+    background: bool | None = None,
 ) -> dict[str, Any]:
     """Run clustering on the media files provided as inbox.
 
@@ -43,17 +69,42 @@ def main(
         development_mode: Whether to use development configuration
         no_operation: Perform a dry run without making changes to the filesystem
         copy_mode: Copy files instead of moving them
-        force_deep_scan: Force recalculation of cluster info for existing clusters
+        force_deep_scan: Recalculate cluster info for existing clusters changed
+            since their .cluster.ini was saved
         drop_duplicates: Skip clustering duplicates and store them in a separate folder
         use_existing_clusters: Try to assign media to existing clusters in watch folders
         restore_original_names: Revert copy-suffixed file names (e.g. "-Kopiuj(1)")
             to their originals when moving/copying into cluster folders
+        library_prescreen: Reject definitely-new inbox files with the Bloom
+            filter persisted in each watch folder before the duplicate search
+        dedupe_inbox: Move only one copy of files present in the inbox more
+            than once, leave the other copies in the inbox
+        near_duplicates: Report library images perceptually similar to inbox
+            images (recompressed or resized copies)
+        jobs: Number of worker processes used to scan libraries and read the
+            inbox (0 - number of CPUs)
+        copy_jobs: Number of concurrent copy/move operations per destination
+            device
+        copy_method: Hard link or reflink files instead of copying their data
+            where possible (implies copy_mode)
+        resume: Finish the plan of an interrupted run (from the journal in the
+            output directory) instead of clustering the inbox
+        plan_file: Save the file operation plan to this file instead of
+            executing it (execute later with run_plan.py)
+        verify: Hash copied data and compare it with the hash of the inbox file
+        bandwidth_limit: Max bytes per second written to each destination
+            device
+        ops_limit: Max file operations per second on each destination device
+        background: Run with lowered CPU and I/O priority
 
     Returns:
         Dictionary with diagnostic data from the clustering process
     """
     # Get appropriate configuration based on mode
     config = default_factory.get_config(is_development_mode=development_mode)
+    copy_mode = copy_mode or copy_method in (CopyMethod.HARDLINK, CopyMethod.REFLINK)
+    # mode of the execution, its cost is estimated by the dry run
+    executed_mode = CopyMode.COPY if copy_mode else config.mode
 
     # Override configuration with CLI parameters
     logger.info("Applying CLI parameter overrides to configuration")
@@ -68,27 +119,48 @@ def main(
         drop_duplicates=drop_duplicates,
         use_existing_clusters=use_existing_clusters,
         restore_original_names=restore_original_names,
+        use_library_prescreen=library_prescreen,
+        skip_duplicated_in_inbox=dedupe_inbox,
+        detect_near_duplicates=near_duplicates,
+        worker_pool_size=jobs,
+        copy_jobs_per_device=copy_jobs,
+        copy_method=copy_method,
+        verify_copies=verify,
+        io_bandwidth_limit=bandwidth_limit,
+        io_ops_limit=ops_limit,
+        background_mode=background,
     )
+    if config.background_mode:
+        set_background_priority()
+
+    journal_path = Path(config.out_dir_name) / default_settings.journal_filename
+    if resume:
+        return resume_plan(config, journal_path)
+    refuse_unfinished_plan(config, plan_file, journal_path)
+
+    # One worker pool shared by the library scan and the inbox reading
+    with create_worker_pool(config.worker_pool_size) as pool:
+        # Read cluster info from libraries (or get empty DataFrame if none found)
+        logger.info("Reading cluster information from watch directories")
+        df_clusters, empty_folders, non_compliant_folders = get_existing_clusters_info(
+            config.watch_folders,
+            config.skip_duplicated_existing_in_libs,
+            config.assign_to_clusters_existing_in_libs,
+            config.force_deep_scan,
+            pool=pool,
+        )
+
+        # Configure image reader and initialize media database
+        image_reader = InboxReader(in_dir_name=config.in_dir_name, pool=pool)
+        logger.info("Reading media information from inbox files")
+        image_reader.get_media_files_info()
 
-    # Read cluster info from libraries (or get empty DataFrame if none found)
-    logger.info("Reading cluster information from watch directories")
-    df_clusters, empty_folders, non_compliant_folders = get_existing_clusters_info(
-        config.watch_folders,
-        config.skip_duplicated_existing_in_libs,
-        config.assign_to_clusters_existing_in_libs,
-        config.force_deep_scan,
-    )
     results: dict[str, Any] = {
         "df_clusters": df_clusters,
         "empty": empty_folders,
         "non_compliant": non_compliant_folders,
     }
 
-    # Configure image reader and initialize media database
-    image_reader = InboxReader(in_dir_name=config.in_dir_name)
-    logger.info("Reading media information from inbox files")
-    image_reader.get_media_files_info()
-
     # Configure media grouper and initialize internal dataframes
     image_grouper = ImageGrouper(
         configuration=config,
@@ -96,6 +168,12 @@ def main(
         inbox_media_df=image_reader.media_df.copy(),  # inbox media
     )
 
+    # Mark extra copies of the same file within the inbox if enabled
+    results["inbox_dup_files"] = []
+    if config.skip_duplicated_in_inbox:
+        logger.info("Identifying duplicates within the inbox")
+        results["inbox_dup_files"] = image_grouper.mark_inbox_internal_duplicates()
+
     # Mark duplicates if enabled
     if config.skip_duplicated_existing_in_libs and config.watch_folders:
         logger.info("Identifying duplicates against watch directories")
@@ -104,6 +182,12 @@ def main(
     else:
         results.update({"dup_files": 0, "dup_clusters": 0})
 
+    # Find perceptually similar library images if enabled
+    results["near_dup_files"] = []
+    if config.detect_near_duplicates and config.watch_folders:
+        logger.info("Identifying near-duplicates against watch directories")
+        results["near_dup_files"] = image_grouper.mark_inbox_near_duplicates()
+
     # Assign to existing clusters if enabled
     results.update({"files_existing_cl": None, "existing_cluster_names": None})
     if config.assign_to_clusters_existing_in_libs and config.watch_folders:
@@ -150,20 +234,28 @@ def main(
         image_grouper.add_target_dir_for_duplicates()
 
     # Build file operation plan (always, for diagnostics)
-    from filecluster.file_operations import execute_plan
-
     plan = image_grouper.build_file_operation_plan()
     results["file_operation_plan"] = plan
     logger.info(plan.summary())
 
-    # Execute the plan (unless NOP)
-    if config.mode != CopyMode.NOP:
+    # Execute the plan (unless NOP or saved for later)
+    if plan_file is not None:
+        save_plan(plan, plan_file)
+        logger.info(f"Plan saved to {plan_file}, execute it with run_plan.py")
+    elif config.mode != CopyMode.NOP:
         logger.info(
             f"{'Copying' if config.mode == CopyMode.COPY else 'Moving'} files to cluster folders"
         )
-        execute_plan(plan)
+        check_free_space(estimate_plan_cost(plan, config.copy_method))
+        journal = PlanJournal.create(journal_path, plan)
+        results["unverified_copies"] = run_journaled_plan(journal, config)
+        logger.info("Updating cluster info of the destination folders")
+        results["updated_cluster_folders"] = image_grouper.update_target_cluster_info(
+            plan, results["unverified_copies"]
+        )
     else:
         logger.info("Dry run mode - no files were moved or copied")
+        results["plan_cost"] = estimate_dry_run(image_grouper, config, executed_mode)
 
     # Print structured results summary
     _print_results_summary(results, config)
@@ -171,6 +263,94 @@ def main(
     return results
 
 
+def refuse_unfinished_plan(
+    config: Config, plan_file: str | None, journal_path: Path
+) -> None:
+    """Refuse to execute a new plan while the previous one is unfinished.
+
+    Raises:
+        UnfinishedPlanError: the run would execute a plan and the journal of an
+            interrupted run exists
+    """
+    executes_plan = config.mode != CopyMode.NOP and plan_file is None
+    if executes_plan and journal_path.exists():
+        raise UnfinishedPlanError(journal_path)
+
+
+def resume_plan(config: Config, journal_path: Path) -> dict[str, Any]:
+    """Execute the remaining operations of the plan of an interrupted run.
+
+    Args:
+        config: configuration (copy settings are used)
+        journal_path: journal of the interrupted run
+
+    Returns:
+        Dictionary with the resumed plan
+    """
+    if not journal_path.exists():
+        logger.warning(f"No interrupted run to resume ({journal_path} not found)")
+        return {}
+    journal = PlanJournal.load(journal_path)
+    plan = journal.plan
+    n_file_ops = plan.n_moves + plan.n_copies
+    logger.info(
+        f"Resuming: {len(journal.done)} of {n_file_ops} file operations completed"
+    )
+    check_free_space(estimate_plan_cost(plan, config.copy_method, journal.finished))
+    failed = run_journaled_plan(journal, config)
+    logger.info(
+        "Cluster info of the destination folders is updated by the next "
+        "library scan with --force-deep-scan"
+    )
+    return {"file_operation_plan": plan, "unverified_copies": failed}
+
+
+def estimate_dry_run(
+    image_grouper: ImageGrouper, config: Config, mode: CopyMode
+) -> list[DeviceCost]:
+    """Estimate the cost of the plan that the run in the given mode would execute.
+
+    The write throughput of the destination devices is probed (a temporary file
+    is written and removed).
+
+    Returns:
+        Costs of the destination devices
+    """
+    plan = image_grouper.build_file_operation_plan(mode=mode)
+    costs = estimate_plan_cost(plan, config.copy_method, probe=True)
+    logger.info(format_plan_cost(costs))
+    for cost in costs:
+        if not cost.has_space:
+            logger.warning(
+                f"Not enough free space on the device of {cost.path}, "
+                "the execution would be refused"
+            )
+    return costs
+
+
+def run_journaled_plan(journal: PlanJournal, config: Config) -> list[CopyOp]:
+    """Execute the plan of the journal, remove the journal when finished.
+
+    Copies that don't match their hash are recorded in the journal as failed,
+    the plan is finished anyway - only an interrupted run can be resumed.
+
+    Returns:
+        Copies that don't match the hash of the source file
+    """
+    with journal:
+        failed = execute_plan(
+            journal.plan,
+            jobs_per_device=config.copy_jobs_per_device,
+            copy_method=config.copy_method,
+            journal=journal,
+            verify=config.verify_copies,
+            bandwidth_limit=config.io_bandwidth_limit,
+            ops_limit=config.io_ops_limit,
+        )
+    journal.remove()
+    return failed
+
+
 def _print_results_summary(results: dict[str, Any], config) -> None:
     """Print a human-readable summary of the clustering run."""
     dup_files = results.get("dup_files", [])
@@ -198,6 +378,10 @@ def _print_results_summary(results: dict[str, Any], config) -> None:
         for name in new_folders:
             lines.append(f"    - {name}")
     lines.append(f"  Duplicates found:        {n_dups}")
+    lines.append(
+        f"  Inbox duplicates:        {len(results.get('inbox_dup_files', []))}"
+    )
+    lines.append(f"  Near-duplicates found:   {len(results.get('near_dup_files', []))}")
     lines.append(f"  Assigned to existing:    {n_existing}")
     if plan:
         lines.append(f"  Files moved:             {plan.n_moves}")
@@ -261,7 +445,10 @@ def create_argument_parser() -> argparse.ArgumentParser:
     parser.add_argument(
         "-f",
         "--force-deep-scan",
-        help="Force recalculation of cluster info for each existing cluster",
+        help=(
+            "Recalculate cluster info of existing clusters changed since their "
+            ".cluster.ini was saved"
+        ),
         action="store_true",
         default=False,
     )
@@ -289,6 +476,120 @@ def create_argument_parser() -> argparse.ArgumentParser:
         action="store_true",
         default=False,
     )
+    parser.add_argument(
+        "-u",
+        "--dedupe-inbox",
+        help="Move only one copy of files present in the inbox more than once",
+        action="store_true",
+        default=False,
+    )
+    parser.add_argument(
+        "-p",
+        "--near-duplicates",
+        help="Report library images similar to inbox images (e.g. resized copies)",
+        action="store_true",
+        default=False,
+    )
+    parser.add_argument(
+        "-b",
+        "--library-prescreen",
+        help=(
+            "Use a Bloom filter stored in each watch folder to skip the duplicate "
+            "search for inbox files that are definitely new"
+        ),
+        action="store_true",
+        default=False,
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        help=(
+            "Number of worker processes scanning libraries and reading the inbox "
+            "(0 - number of CPUs, default from settings)"
+        ),
+        type=int,
+        default=None,
+    )
+    parser.add_argument(
+        "--copy-jobs",
+        help=(
+            "Number of concurrent copy/move operations per destination disk "
+            "(default from settings)"
+        ),
+        type=int,
+        default=None,
+    )
+    link_group = parser.add_mutually_exclusive_group()
+    link_group.add_argument(
+        "--link",
+        help=(
+            "Hard link files instead of copying them when the output directory "
+            "is on the same filesystem (implies --copy-mode)"
+        ),
+        action="store_const",
+        const=CopyMethod.HARDLINK,
+        dest="copy_method",
+    )
+    link_group.add_argument(
+        "--reflink",
+        help=(
+            "Clone files (copy-on-write, e.g. btrfs, xfs) instead of copying "
+            "their data when the output directory is on the same filesystem "
+            "(implies --copy-mode)"
+        ),
+        action="store_const",
+        const=CopyMethod.REFLINK,
+        dest="copy_method",
+    )
+    parser.add_argument(
+        "--resume",
+        help=(
+            "Finish the file operations of an interrupted run (recorded in the "
+            "output directory) without scanning the inbox and the libraries"
+        ),
+        action="store_true",
+        default=False,
+    )
+    parser.add_argument(
+        "--save-plan",
+        help=(
+            "Save the file operations to this file instead of executing them "
+            "(execute later with run_plan.py)"
+        ),
+        metavar="PLAN_FILE",
+        default=None,
+    )
+    parser.add_argument(
+        "--verify",
+        help=(
+            "Compare copied data with the hash of the inbox file, repeat "
+            "mismatched copies (data is hashed while copying)"
+        ),
+        action="store_true",
+        default=None,
+    )
+    parser.add_argument(
+        "--bwlimit",
+        help="Max MiB per second written to each destination disk",
+        metavar="MIB_PER_S",
+        type=float,
+        default=None,
+    )
+    parser.add_argument(
+        "--ops-limit",
+        help="Max file operations (copies, moves, links) per second on each "
+        "destination disk",
+        metavar="OPS_PER_S",
+        type=float,
+        default=None,
+    )
+    parser.add_argument(
+        "--background",
+        help="Run with lowered CPU and I/O priority, so the disks serve other "
+        "processes first",
+        action="store_true",
+        default=None,
+    )
 
     return parser
 
@@ -337,6 +638,18 @@ def run_from_cli():
         drop_duplicates=args.drop_duplicates,
         use_existing_clusters=args.use_existing_clusters,
         restore_original_names=args.restore_original_names,
+        library_prescreen=args.library_prescreen,
+        dedupe_inbox=args.dedupe_inbox,
+        near_duplicates=args.near_duplicates,
+        jobs=args.jobs,
+        copy_jobs=args.copy_jobs,
+        copy_method=args.copy_method,
+        resume=args.resume,
+        plan_file=args.save_plan,
+        verify=args.verify,
+        bandwidth_limit=args.bwlimit * 2**20 if args.bwlimit else None,
+        ops_limit=args.ops_limit,
+        background=args.background,
     )
 
 
@@ -7,18 +7,46 @@ trivial, testing pure, and the I/O boundary explicit.
 
 from __future__ import annotations
 
+import errno
+import json
 import math
 import os
 import re
-from dataclasses import dataclass, field
+import sys
+import threading
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import ExitStack
+from dataclasses import dataclass, field, fields, replace
+from enum import Enum
+from functools import partial
 from pathlib import Path
-from shutil import copy2, move
+from shutil import copystat, move
+from typing import TYPE_CHECKING, Any
 
+import pandas as pd
 from tqdm import tqdm
 
 from filecluster import logger
-from filecluster.configuration import CopyMode
+from filecluster.configuration import CopyMethod, CopyMode, Status
+from filecluster.copy_engine import copy_file, copy_file_verified, same_file
 from filecluster.exceptions import DateStringNoneError
+from filecluster.throttle import DeviceThrottle
+from filecluster.utlis import get_device_id, hash_file, partial_hash_file
+
+if TYPE_CHECKING:
+    from filecluster.journal import PlanJournal
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# version of the saved plan file format
+PLAN_VERSION = 1
+
+# ioctl cloning a file (linux/fs.h)
+FICLONE = 0x40049409
 
 # Copy-suffix patterns appended (by file managers) just before the extension.
 # Stripped, in order, from the end of the file *stem*:
@@ -55,6 +83,28 @@ def strip_copy_suffix(name: str) -> str:
     return name
 
 
+def strip_copy_suffixes(names: pd.Series) -> pd.Series:
+    """Vectorised strip_copy_suffix: remove copy-suffixes from the file stems."""
+    names = names.astype(str)
+    # same split as Path.stem / Path.suffix
+    parts = names.str.extract(r"^(?P<stem>.+?)(?P<suffix>\.[^.]+)?$")
+    stems, suffixes = parts["stem"].fillna(names), parts["suffix"].fillna("")
+    stripped = stems.copy()
+    pending = pd.Series(True, index=names.index)
+    # only the first matching pattern is applied, as in strip_copy_suffix
+    for pattern in _COPY_SUFFIX_PATTERNS:
+        matches = pending & stems.str.contains(pattern)
+        stripped[matches] = stems[matches].str.replace(pattern, "", regex=True)
+        pending &= ~matches
+    return stripped + suffixes
+
+
+def _existing_names(dir_path: Path) -> set[str]:
+    if not dir_path.is_dir():
+        return set()
+    return {p.name.lower() for p in dir_path.iterdir() if p.is_file()}
+
+
 def resolve_destination_names(
     inbox_media_df,
     out_dir: Path,
@@ -78,65 +128,60 @@ def resolve_destination_names(
     Returns:
         Mapping of original ``file_name`` -> destination basename.
     """
+    names = inbox_media_df["file_name"]
     if not restore:
-        return {
-            row["file_name"]: row["file_name"] for _, row in inbox_media_df.iterrows()
-        }
-
-    # Per-target-dir set of already-claimed (lower-cased) names, seeded with
-    # whatever already exists on disk in that directory.
-    claimed: dict[str, set[str]] = {}
+        return dict(zip(names, names, strict=True))
 
-    def _claimed_for(target_path: str) -> set[str]:
-        if target_path not in claimed:
-            existing: set[str] = set()
-            dir_path = Path(out_dir) / str(target_path)
-            if dir_path.is_dir():
-                existing = {p.name.lower() for p in dir_path.iterdir() if p.is_file()}
-            claimed[target_path] = existing
-        return claimed[target_path]
+    df = pd.DataFrame(
+        {
+            "name": names.to_numpy(),
+            "desired": strip_copy_suffixes(names).to_numpy(),
+            "target_path": inbox_media_df["target_path"].astype(str).to_numpy(),
+        }
+    )
+    # Un-suffixed originals first so they always keep their name, then the
+    # remaining (suffixed) files in deterministic order.
+    df["is_copy"] = df["desired"] != df["name"]
+    df["order"] = df["name"].where(df["is_copy"], "")
+    df = df.sort_values(["is_copy", "order"], kind="stable")
 
     mapping: dict[str, str] = {}
-
-    # Process un-suffixed originals first so they always keep their name, then
-    # the remaining (suffixed) files in deterministic order.
-    rows = list(inbox_media_df.iterrows())
-    originals = [
-        r for _, r in rows if strip_copy_suffix(r["file_name"]) == r["file_name"]
-    ]
-    suffixed = [
-        r for _, r in rows if strip_copy_suffix(r["file_name"]) != r["file_name"]
-    ]
-    suffixed.sort(key=lambda r: str(r["file_name"]))
-
-    for row in [*originals, *suffixed]:
-        name = row["file_name"]
-        target_path = row["target_path"]
-        claimed_names = _claimed_for(str(target_path))
-
-        desired = strip_copy_suffix(name)
-        chosen = desired if desired.lower() not in claimed_names else name
-
-        claimed_names.add(chosen.lower())
-        mapping[name] = chosen
-
+    for target_path, group in df.groupby("target_path", sort=False):
+        # names claimed in the directory, seeded with the files on disk
+        claimed = _existing_names(Path(out_dir) / str(target_path))
+        for name, desired in zip(group["name"], group["desired"], strict=True):
+            chosen = desired if desired.lower() not in claimed else name
+            claimed.add(chosen.lower())
+            mapping[name] = chosen
     return mapping
 
 
 @dataclass(frozen=True)
 class MoveOp:
-    """Move a file from *src* to *dst*."""
+    """Move a file from *src* to *dst*.
+
+    Size and mtime of the source are recorded in saved plans, to detect files
+    changed between planning and execution.
+    """
 
     src: Path
     dst: Path
+    src_size: int | None = None
+    src_mtime_ns: int | None = None
 
 
 @dataclass(frozen=True)
 class CopyOp:
-    """Copy a file from *src* to *dst*."""
+    """Copy a file from *src* to *dst* (source size and mtime as in MoveOp).
+
+    The copy is verified against *expected_hash* (sha1 of the source) if known.
+    """
 
     src: Path
     dst: Path
+    src_size: int | None = None
+    src_mtime_ns: int | None = None
+    expected_hash: str | None = None
 
 
 @dataclass(frozen=True)
@@ -156,29 +201,85 @@ class MkdirOp:
 
 FileOp = MoveOp | CopyOp | SkipOp | MkdirOp
 
+_OP_TYPES: dict[str, type] = {
+    "move": MoveOp,
+    "copy": CopyOp,
+    "skip": SkipOp,
+    "mkdir": MkdirOp,
+}
+
+
+def op_to_dict(op: FileOp) -> dict[str, Any]:
+    """Represent an operation as a JSON-serializable dict."""
+    kind = next(k for k, op_type in _OP_TYPES.items() if isinstance(op, op_type))
+    record: dict[str, Any] = {"op": kind}
+    for f in fields(op):
+        value = getattr(op, f.name)
+        record[f.name] = str(value) if isinstance(value, Path) else value
+    return record
+
+
+def op_from_dict(record: dict[str, Any]) -> FileOp:
+    """Create an operation from its dict representation (see op_to_dict).
+
+    Raises:
+        KeyError: unknown operation type
+        TypeError: missing field
+    """
+    op_type = _OP_TYPES[record["op"]]
+    return op_type(
+        **{
+            f.name: Path(record[f.name]) if f.type == "Path" else record[f.name]
+            for f in fields(op_type)
+            if f.name in record
+        }
+    )
+
 
 @dataclass
 class FileOperationPlan:
-    """An ordered list of file-system operations to perform."""
+    """An ordered list of file-system operations to perform.
+
+    The counts of operation types are kept up to date incrementally: only the
+    operations appended to ``ops`` since the last access are counted (all of
+    them if ``ops`` was replaced or shortened).
+    """
 
     ops: list[FileOp] = field(default_factory=list)
+    _counts: Counter = field(
+        default_factory=Counter, init=False, repr=False, compare=False
+    )
+    _counted_ops: list[FileOp] | None = field(
+        default=None, init=False, repr=False, compare=False
+    )
+    _n_counted: int = field(default=0, init=False, repr=False, compare=False)
+
+    def _count(self, op_type: type) -> int:
+        if self.ops is not self._counted_ops or len(self.ops) < self._n_counted:
+            self._counts.clear()
+            self._counted_ops = self.ops
+            self._n_counted = 0
+        if len(self.ops) > self._n_counted:
+            self._counts.update(type(op) for op in self.ops[self._n_counted :])
+            self._n_counted = len(self.ops)
+        return self._counts[op_type]
 
     # Convenience counts
     @property
     def n_moves(self) -> int:
-        return sum(1 for op in self.ops if isinstance(op, MoveOp))
+        return self._count(MoveOp)
 
     @property
     def n_copies(self) -> int:
-        return sum(1 for op in self.ops if isinstance(op, CopyOp))
+        return self._count(CopyOp)
 
     @property
     def n_skips(self) -> int:
-        return sum(1 for op in self.ops if isinstance(op, SkipOp))
+        return self._count(SkipOp)
 
     @property
     def n_mkdirs(self) -> int:
-        return sum(1 for op in self.ops if isinstance(op, MkdirOp))
+        return self._count(MkdirOp)
 
     def summary(self) -> str:
         """Human-readable one-line summary."""
@@ -189,6 +290,143 @@ class FileOperationPlan:
         )
 
 
+class Collision(Enum):
+    """Outcome of checking the destination of a planned file.
+
+    Attributes:
+        NONE: destination is free
+        DUPLICATE: identical file from this run is already planned there - skip
+        CONFLICT: same name, different content - rename
+        IDENTICAL_TARGET: identical file already exists there - no-op
+    """
+
+    NONE = 0
+    DUPLICATE = 1
+    CONFLICT = 2
+    IDENTICAL_TARGET = 3
+
+
+def _known_hash(value: Any) -> str | None:
+    return value if isinstance(value, str) and value else None
+
+
+def is_same_content(
+    a: Path,
+    b: Path,
+    a_size: int | None = None,
+    a_hash: str | None = None,
+    b_size: int | None = None,
+    b_hash: str | None = None,
+) -> bool:
+    """Compare two files by size -> partial hash -> full hash.
+
+    Known sizes and (sha1) hashes are used instead of reading the files. Files
+    are read in full only if their sizes and partial hashes are equal.
+    """
+    try:
+        a_size = os.path.getsize(a) if a_size is None else a_size
+        b_size = os.path.getsize(b) if b_size is None else b_size
+    except OSError:
+        return False
+    if int(a_size) != int(b_size):
+        return False
+    a_hash, b_hash = _known_hash(a_hash), _known_hash(b_hash)
+    if a_hash and b_hash:
+        return a_hash == b_hash
+    if partial_hash_file(a) != partial_hash_file(b):
+        return False
+    try:
+        return (a_hash or hash_file(a)) == (b_hash or hash_file(b))
+    except OSError:
+        return False
+
+
+def classify_collision(
+    src: Path,
+    dst: Path,
+    claimed: dict[str, tuple[Path, Any, Any]],
+    src_size: Any = None,
+    src_hash: Any = None,
+) -> tuple[Collision, Path | None]:
+    """Check if *dst* is taken by a planned or an existing file.
+
+    Args:
+        src: source file
+        dst: planned destination
+        claimed: destinations already planned in this run (lower-cased path ->
+            (source, size, hash))
+        src_size: known size of the source file
+        src_hash: known full hash (sha1) of the source file
+
+    Returns:
+        Collision type and the file that occupies the destination (or None)
+    """
+    src_size = None if pd.isna(src_size) else src_size
+    if (planned := claimed.get(str(dst).lower())) is not None:
+        other, other_size, other_hash = planned
+        other_size = None if pd.isna(other_size) else other_size
+        same = is_same_content(src, other, src_size, src_hash, other_size, other_hash)
+        return (Collision.DUPLICATE if same else Collision.CONFLICT), other
+    if dst.exists():
+        same = is_same_content(src, dst, a_size=src_size, a_hash=src_hash)
+        return (Collision.IDENTICAL_TARGET if same else Collision.CONFLICT), dst
+    return Collision.NONE, None
+
+
+def conflict_free_name(dst: Path, claimed: dict[str, Any]) -> Path:
+    """Find the first free name ``stem (n).ext`` next to *dst*."""
+    n = 1
+    while True:
+        candidate = dst.with_name(f"{dst.stem} ({n}){dst.suffix}")
+        if str(candidate).lower() not in claimed and not candidate.exists():
+            return candidate
+        n += 1
+
+
+def _resolve_collision(
+    src: Path,
+    dst: Path,
+    size: Any,
+    src_hash: Any,
+    claimed: dict[str, tuple[Path, Any, Any]],
+) -> tuple[Path | None, str | None]:
+    """Return the final destination, or None and the reason to skip the file."""
+    collision, other = classify_collision(src, dst, claimed, size, src_hash)
+    if collision == Collision.DUPLICATE:
+        return None, f"identical to {other}, planned for the same destination"
+    if collision == Collision.IDENTICAL_TARGET:
+        return None, f"identical file already exists at {dst}"
+    if collision == Collision.CONFLICT:
+        new_dst = conflict_free_name(dst, claimed)
+        logger.info(f"{dst.name} differs from {other}, saving as {new_dst.name}")
+        dst = new_dst
+    claimed[str(dst).lower()] = (src, size, src_hash)
+    return dst, None
+
+
+def _column(df, name: str) -> list:
+    """Values of the column, Nones if the column is missing."""
+    return df[name].tolist() if name in df.columns else [None] * len(df)
+
+
+def _skip_inbox_duplicates(plan: FileOperationPlan, inbox_media_df, in_dir: Path):
+    """Add SkipOps for extra copies of inbox files, return the remaining rows.
+
+    Extra copies stay in the inbox, only one copy of the file is moved.
+    """
+    if "status" not in inbox_media_df.columns:
+        return inbox_media_df
+    sel_extra = inbox_media_df["status"] == Status.INBOX_DUPLICATE
+    extra = inbox_media_df[sel_extra]
+    plan.ops.extend(
+        SkipOp(src=in_dir / name, reason=f"duplicate of {original} in inbox")
+        for name, original in zip(
+            extra["file_name"], _column(extra, "duplicated_to"), strict=True
+        )
+    )
+    return inbox_media_df[~sel_extra]
+
+
 def build_file_operation_plan(
     inbox_media_df,
     in_dir: Path,
@@ -208,21 +446,23 @@ def build_file_operation_plan(
             unless doing so would collide with an existing or already-claimed
             name in the target folder.
 
+    A file whose destination is already taken is skipped when the content is
+    identical (no-op) and saved under a ``name (n).ext`` name otherwise.
+
     Returns:
         A FileOperationPlan ready to be executed (or inspected).
     """
     plan = FileOperationPlan()
 
     if mode == CopyMode.NOP:
-        for _, row in inbox_media_df.iterrows():
-            plan.ops.append(
-                SkipOp(
-                    src=Path(in_dir) / row["file_name"],
-                    reason="NOP mode",
-                )
-            )
+        plan.ops.extend(
+            SkipOp(src=Path(in_dir) / name, reason="NOP mode")
+            for name in inbox_media_df["file_name"]
+        )
         return plan
 
+    inbox_media_df = _skip_inbox_duplicates(plan, inbox_media_df, Path(in_dir))
+
     # Collect unique target directories and validate them
     dirs = inbox_media_df["target_path"].unique()
     for dir_name in dirs:
@@ -238,29 +478,465 @@ def build_file_operation_plan(
         inbox_media_df, Path(out_dir), restore=restore_original_names
     )
 
-    # Plan file operations
-    for _, row in inbox_media_df.iterrows():
-        src = Path(in_dir) / row["file_name"]
-        dst_name = dst_names[row["file_name"]]
-        dst = Path(out_dir) / str(row["target_path"]) / dst_name
-        if mode == CopyMode.COPY:
-            plan.ops.append(CopyOp(src=src, dst=dst))
+    # Plan file operations, resolving collisions at destinations
+    claimed: dict[str, tuple[Path, Any, Any]] = {}
+    columns = zip(
+        inbox_media_df["file_name"],
+        inbox_media_df["target_path"].astype(str),
+        _column(inbox_media_df, "size"),
+        _column(inbox_media_df, "hash_value"),
+        strict=True,
+    )
+    for name, target_path, size, src_hash in columns:
+        src = Path(in_dir) / name
+        dst, skip_reason = _resolve_collision(
+            src, Path(out_dir) / target_path / dst_names[name], size, src_hash, claimed
+        )
+        if dst is None:
+            plan.ops.append(SkipOp(src=src, reason=str(skip_reason)))
+        elif mode == CopyMode.COPY:
+            expected_hash = _known_hash(src_hash)
+            plan.ops.append(CopyOp(src=src, dst=dst, expected_hash=expected_hash))
         elif mode == CopyMode.MOVE:
             plan.ops.append(MoveOp(src=src, dst=dst))
 
     return plan
 
 
-def execute_plan(plan: FileOperationPlan) -> None:
-    """Execute every operation in the plan against the real filesystem."""
-    file_ops = [op for op in plan.ops if not isinstance(op, SkipOp)]
-    for op in tqdm(file_ops, total=len(file_ops), disable=len(file_ops) < 50):
+def minimal_mkdirs(paths) -> list[Path]:
+    """Directories to create so that all *paths* exist, parents first.
+
+    Directories are created with their parents, so the parents of other
+    directories in *paths* are dropped. The rest is sorted by path components,
+    directories of the same parent stay next to each other.
+    """
+    unique = {Path(p) for p in paths}
+    parents = {parent for p in unique for parent in p.parents}
+    return sorted(unique - parents, key=lambda p: p.parts)
+
+
+def _source_location(op: CopyOp | MoveOp) -> tuple[int, int]:
+    """Device and inode of the source, approximating its position on the disk."""
+    try:
+        st = op.src.stat()
+    except OSError:
+        return sys.maxsize, sys.maxsize
+    return st.st_dev, st.st_ino
+
+
+def optimize_plan(plan: FileOperationPlan) -> FileOperationPlan:
+    """Reorder the operations to reduce seeking of the disks.
+
+    The plan built from the inbox is in the time order of the files, so the
+    writes alternate between target folders and the reads jump around the
+    inbox. The optimized plan has:
+
+    1. the minimal set of MkdirOps (see minimal_mkdirs),
+    2. copies and moves grouped by destination folder, sources in inode order
+       within the folder; folders are ordered by the first inode of their
+       sources, so the inbox is read mostly forward,
+    3. SkipOps (in their original order).
+
+    Only the order of the operations changes, so the plan must not be reordered
+    after it was journaled or saved.
+    """
+    mkdirs = minimal_mkdirs(op.path for op in plan.ops if isinstance(op, MkdirOp))
+    file_ops = [op for op in plan.ops if isinstance(op, CopyOp | MoveOp)]
+    locations = [_source_location(op) for op in file_ops]
+    first_in_dir: dict[Path, tuple[int, int]] = {}
+    for op, location in zip(file_ops, locations, strict=True):
+        directory = op.dst.parent
+        first_in_dir[directory] = min(location, first_in_dir.get(directory, location))
+    order = sorted(
+        range(len(file_ops)),
+        key=lambda i: (
+            first_in_dir[file_ops[i].dst.parent],
+            str(file_ops[i].dst.parent),
+            locations[i],
+        ),
+    )
+    ops: list[FileOp] = [MkdirOp(path=path) for path in mkdirs]
+    ops.extend(file_ops[i] for i in order)
+    ops.extend(op for op in plan.ops if isinstance(op, SkipOp))
+    return FileOperationPlan(ops=ops)
+
+
+def _with_source_stats(op: FileOp) -> FileOp:
+    if not isinstance(op, CopyOp | MoveOp) or op.src_size is not None:
+        return op
+    try:
+        st = op.src.stat()
+    except OSError:
+        return op
+    return replace(op, src_size=st.st_size, src_mtime_ns=st.st_mtime_ns)
+
+
+def save_plan(plan: FileOperationPlan, path: str | Path) -> None:
+    """Save the plan as JSON Lines: header, then one operation per line.
+
+    Size and mtime of the source files are recorded, so changes made before
+    the plan is executed can be detected (see validate_plan).
+    """
+    path = Path(path)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        header = {"plan": PLAN_VERSION, "n_ops": len(plan.ops)}
+        f.write(json.dumps(header) + "\n")
+        for op in plan.ops:
+            f.write(json.dumps(op_to_dict(_with_source_stats(op))) + "\n")
+    os.replace(tmp_path, path)
+
+
+def load_plan(path: str | Path) -> FileOperationPlan:
+    """Load a plan saved with save_plan.
+
+    Raises:
+        ValueError: not a plan file, unsupported version or incomplete file
+    """
+    with open(path, encoding="utf-8") as f:
+        header = json.loads(f.readline() or "{}")
+        if header.get("plan") != PLAN_VERSION:
+            raise ValueError(f"{path} is not a plan file (version {PLAN_VERSION})")
+        ops = [op_from_dict(json.loads(line)) for line in f if line.strip()]
+    if len(ops) != header["n_ops"]:
+        raise ValueError(f"Incomplete plan file {path}")
+    return FileOperationPlan(ops=ops)
+
+
+def find_plan_problem(op: FileOp) -> str | None:
+    """Check if a saved operation can still be executed.
+
+    Returns:
+        Reason why the operation can't be executed or None.
+    """
+    if not isinstance(op, CopyOp | MoveOp):
+        return None
+    try:
+        st = op.src.stat()
+    except OSError:
+        return "source file is missing"
+    if op.src_size is not None and (st.st_size, st.st_mtime_ns) != (
+        op.src_size,
+        op.src_mtime_ns,
+    ):
+        return "source file changed since planning"
+    if op.dst.exists():
+        return f"destination {op.dst} already exists"
+    return None
+
+
+def validate_plan(
+    plan: FileOperationPlan, done: set[int] | None = None
+) -> FileOperationPlan:
+    """Replace operations that can't be executed anymore with SkipOps.
+
+    Args:
+        plan: plan loaded from a file
+        done: indices of operations already executed (not checked)
+
+    Returns:
+        Plan with the same number of operations.
+    """
+    done = done or set()
+    ops = []
+    for i, op in enumerate(plan.ops):
+        problem = None if i in done else find_plan_problem(op)
+        if problem is not None:
+            logger.warning(f"Skipping {op.src}: {problem}")
+            op = SkipOp(src=op.src, reason=problem)
+        ops.append(op)
+    return FileOperationPlan(ops=ops)
+
+
+def reflink_file(src: Path, dst: Path) -> None:
+    """Clone *src* to *dst*, the copy shares data blocks with the source.
+
+    Uses the FICLONE ioctl, then copy_file_range (which shares the extents on
+    filesystems supporting it, e.g. btrfs, xfs, and copies in the kernel
+    otherwise). File metadata is copied as with copy2.
+
+    Raises:
+        OSError: when the file can't be cloned (e.g. not supported by the
+            platform or the filesystem) or copy_file_range stops short of the
+            source size
+    """
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        try:
+            if fcntl is None:
+                raise OSError(errno.ENOTSUP, "FICLONE is not supported")
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        except OSError:
+            if not hasattr(os, "copy_file_range"):
+                raise
+            while os.copy_file_range(fsrc.fileno(), fdst.fileno(), 2**30):
+                pass
+        size, cloned = os.fstat(fsrc.fileno()).st_size, os.fstat(fdst.fileno()).st_size
+        if cloned != size:
+            raise OSError(
+                errno.EIO, f"Short clone: {cloned} of {size} bytes cloned", str(src)
+            )
+    copystat(src, dst)
+
+
+def _copy(
+    op: CopyOp,
+    same_device: bool,
+    copy_method: CopyMethod,
+    verify: bool,
+    throttle: DeviceThrottle | None = None,
+) -> bool:
+    if same_file(op.src, op.dst):
+        # linked by an earlier run whose completion record was lost
+        logger.debug(f"{op.dst} is already linked to {op.src}")
+        return True
+    if same_device and copy_method == CopyMethod.HARDLINK:
+        try:
+            os.link(op.src, op.dst)
+            return True
+        except OSError as e:
+            logger.debug(f"Cannot link {op.src}, copying ({e})")
+    elif same_device and copy_method == CopyMethod.REFLINK:
+        try:
+            reflink_file(op.src, op.dst)
+            return True
+        except OSError as e:
+            logger.debug(f"Cannot clone {op.src}, copying ({e})")
+    if verify and op.expected_hash:
+        return copy_file_verified(op.src, op.dst, op.expected_hash, throttle=throttle)
+    copy_file(op.src, op.dst, throttle=throttle)
+    return True
+
+
+def _run_file_op(
+    op: CopyOp | MoveOp,
+    same_device: bool = False,
+    copy_method: CopyMethod = CopyMethod.COPY,
+    verify: bool = False,
+    throttle: DeviceThrottle | None = None,
+) -> bool:
+    """Run a copy or move, using metadata-only operations within a device.
+
+    Returns:
+        False if the copy doesn't match the expected hash (verify mode).
+    """
+    if throttle is not None:
+        throttle.operation()
+    if isinstance(op, CopyOp):
+        return _copy(op, same_device, copy_method, verify, throttle)
+    if same_device:
+        try:
+            os.rename(op.src, op.dst)
+            return True
+        except OSError as e:
+            # e.g. bind mounts of one filesystem share the device id
+            if e.errno != errno.EXDEV:
+                raise
+            logger.debug(f"Cannot rename {op.src}, moving ({e})")
+    move(
+        str(op.src),
+        str(op.dst),
+        copy_function=partial(copy_file, throttle=throttle),
+    )
+    return True
+
+
+IndexedOp = tuple[int, CopyOp | MoveOp]
+
+
+def _slice_folder(
+    chains: list[list[IndexedOp]], n_slices: int
+) -> list[list[IndexedOp]]:
+    """Split the chains of a folder into contiguous slices, ops in plan order."""
+    n_slices = max(1, min(n_slices, len(chains)))
+    slices = []
+    for i in range(n_slices):
+        part = chains[i * len(chains) // n_slices : (i + 1) * len(chains) // n_slices]
+        slices.append(sorted(op for chain in part for op in chain))
+    return slices
+
+
+def _group_by_destination_device(
+    file_ops: list[IndexedOp], jobs_per_device: int = 1
+) -> tuple[dict[int, list[list[IndexedOp]]], dict[Path, int]]:
+    """Group ops into chains with the same destination, chains by device.
+
+    Ops of a chain keep the plan order, so they have to run one after another.
+    To keep the locality order of optimize_plan (sources in inode order within
+    a destination folder), the chains of a folder are split into one contiguous
+    slice per job instead of being interleaved by the jobs.
+
+    Args:
+        file_ops: ops with their indices in the plan
+        jobs_per_device: number of concurrent jobs per device
+
+    Returns:
+        Slices (ops run one after another) by destination device, devices of
+        source and destination folders
+    """
+    chains: dict[str, list[IndexedOp]] = {}
+    for index, op in file_ops:
+        chains.setdefault(str(op.dst).lower(), []).append((index, op))
+    # chains in the order of their first op, so the folders stay contiguous
+    folders: dict[Path, list[list[IndexedOp]]] = defaultdict(list)
+    for chain in chains.values():
+        folders[chain[0][1].dst.parent].append(chain)
+
+    devices: dict[Path, int] = {}
+    dirs = {p for _, op in file_ops for p in (op.src.parent, op.dst.parent)}
+    for directory in dirs:
+        devices[directory] = get_device_id(directory)
+    by_device: dict[int, list[list[IndexedOp]]] = defaultdict(list)
+    for folder, folder_chains in folders.items():
+        by_device[devices[folder]].extend(_slice_folder(folder_chains, jobs_per_device))
+    return by_device, devices
+
+
+def _is_completed_move(op: CopyOp | MoveOp) -> bool:
+    return isinstance(op, MoveOp) and not op.src.exists() and op.dst.exists()
+
+
+@dataclass
+class _PlanRunner:
+    """State shared by the threads executing the plan."""
+
+    devices: dict[Path, int]
+    copy_method: CopyMethod
+    progress: tqdm
+    journal: PlanJournal | None = None
+    verify: bool = False
+    throttles: dict[int, DeviceThrottle] = field(default_factory=dict)
+    failed: list[CopyOp] = field(default_factory=list)
+    # set after the first error, the running chains don't start new ops
+    stop: threading.Event = field(default_factory=threading.Event)
+
+    def run_op(self, index: int, op: CopyOp | MoveOp) -> None:
+        ok = True
+        # completion of the move was not recorded before the interruption
+        if (
+            self.journal is None
+            or not self.journal.resumed
+            or not _is_completed_move(op)
+        ):
+            device = self.devices[op.dst.parent]
+            same_device = self.devices[op.src.parent] == device
+            ok = _run_file_op(
+                op,
+                same_device,
+                self.copy_method,
+                self.verify,
+                self.throttles.get(device),
+            )
+        if not ok:
+            # list.append is atomic
+            self.failed.append(op)
+            if self.journal is not None:
+                self.journal.mark_failed(index)
+        elif self.journal is not None:
+            self.journal.mark_done(index)
+        self.progress.update()
+
+    def run_chain(self, chain: list[IndexedOp]) -> None:
+        for index, op in chain:
+            if self.stop.is_set():
+                return
+            self.run_op(index, op)
+
+
+def _run_on_devices(
+    by_device: dict[int, list[list[IndexedOp]]],
+    runner: _PlanRunner,
+    jobs_per_device: int,
+) -> None:
+    """Run the chains of ops in a thread pool per device, re-raise the first error."""
+    with ExitStack() as stack:
+        futures = []
+        for chains in by_device.values():
+            executor = stack.enter_context(
+                ThreadPoolExecutor(max_workers=max(1, jobs_per_device))
+            )
+            futures.extend(executor.submit(runner.run_chain, c) for c in chains)
+        try:
+            for future in as_completed(futures):
+                future.result()
+        except BaseException:
+            # don't start new operations, the running ones are awaited on exit
+            runner.stop.set()
+            for future in futures:
+                future.cancel()
+            raise
+
+
+def execute_plan(
+    plan: FileOperationPlan,
+    jobs_per_device: int = 1,
+    copy_method: CopyMethod = CopyMethod.COPY,
+    journal: PlanJournal | None = None,
+    verify: bool = False,
+    bandwidth_limit: float = 0,
+    ops_limit: float = 0,
+) -> list[CopyOp]:
+    """Execute every operation in the plan against the real filesystem.
+
+    Directories are created first. File operations then run in a thread pool
+    per destination device, so a slow disk (e.g. NAS) doesn't hold back the
+    others. Operations with the same destination run in the plan order, the
+    operations into a folder are split between the jobs in contiguous slices.
+
+    Moves within a device are renames. Copies within a device can be hard links
+    or reflinks (metadata-only operations), files that can't be linked are
+    copied.
+
+    The bandwidth and the rate of file operations can be limited per device,
+    so a long import doesn't saturate a shared disk (see filecluster.throttle).
+
+    Args:
+        plan: operations to perform
+        jobs_per_device: number of concurrent file operations per destination
+            device
+        copy_method: how CopyOps are performed
+        journal: journal of the plan, completed operations and failed copies
+            are recorded there, the ones already recorded are not repeated
+        verify: compare copied data with the expected hash of CopyOps (copies
+            are hashed on the way, without reading the files again)
+        bandwidth_limit: max bytes per second written to each destination
+            device (0 - unlimited)
+        ops_limit: max file operations per second on each destination device
+            (0 - unlimited)
+
+    Returns:
+        Copies that don't match their expected hash (removed from destination),
+        including the ones recorded as failed in the journal.
+    """
+    for op in plan.ops:
         if isinstance(op, MkdirOp):
             os.makedirs(op.path, exist_ok=True)
-        elif isinstance(op, CopyOp):
-            copy2(str(op.src), str(op.dst))
-        elif isinstance(op, MoveOp):
-            move(str(op.src), str(op.dst))
+
+    finished = journal.finished if journal is not None else set()
+    file_ops = [
+        (i, op)
+        for i, op in enumerate(plan.ops)
+        if isinstance(op, CopyOp | MoveOp) and i not in finished
+    ]
+    by_device, devices = _group_by_destination_device(file_ops, jobs_per_device)
+    if len(by_device) > 1 or jobs_per_device > 1:
+        logger.debug(
+            f"Running file operations on {len(by_device)} devices, "
+            f"{jobs_per_device} at a time per device"
+        )
+
+    throttles = {}
+    if bandwidth_limit or ops_limit:
+        throttles = {
+            dev: DeviceThrottle(bandwidth_limit, ops_limit) for dev in by_device
+        }
+    with tqdm(total=len(file_ops), disable=len(file_ops) < 50) as progress:
+        runner = _PlanRunner(devices, copy_method, progress, journal, verify, throttles)
+        if journal is not None:
+            runner.failed.extend(plan.ops[i] for i in sorted(journal.failed))
+        _run_on_devices(by_device, runner, jobs_per_device)
 
     if plan.n_skips:
-        logger.info(f"Skipped {plan.n_skips} files (NOP mode)")
+        logger.info(f"Skipped {plan.n_skips} files")
+    if runner.failed:
+        logger.error(f"{len(runner.failed)} copies don't match the source hash")
+    return runner.failed
@@ -1,8 +1,21 @@
 """Custom type definitions to be used in filecluster package."""
 
-from typing import NewType
+from datetime import datetime
+from pathlib import Path
+from typing import NamedTuple, NewType
 
 import pandas as pd
 
 MediaDataFrame = NewType("MediaDataFrame", pd.DataFrame)
 ClustersDataFrame = NewType("ClustersDataFrame", pd.DataFrame)
+
+
+class ClusterRow(NamedTuple):
+    """Cluster info of a single library folder (a row of ClustersDataFrame)."""
+
+    start_date: datetime | None
+    end_date: datetime | None
+    is_continuous: bool
+    median: datetime
+    file_count: int
+    path: Path
@@ -0,0 +1,356 @@
+#!/usr/bin/env python3
+"""Find duplicated files inside the media libraries.
+
+Only inbox-vs-library duplicates are detected during the clustering. This
+module scans whole libraries (e.g. all years of `zdjecia`) and reports groups of
+identical files and the number of bytes that can be reclaimed.
+
+Files are compared with the tiered size -> partial hash -> full hash strategy.
+The memory use doesn't grow with the size of the libraries:
+- the libraries are walked once, the files are stored in a temporary database
+  (on disk), only files whose size is not unique are read back,
+- they are processed in batches of whole size groups, the hashes of a batch are
+  dropped once its duplicates are found,
+- hashes are computed in a multiprocessing pool,
+- computed hashes are appended to a progress file, so an interrupted scan
+  resumes without re-reading the files (entries are checked against file size
+  and mtime, looked up in a temporary database).
+
+Usage:
+./find_duplicates.py -l tests/zdjecia -r duplicates.csv
+
+    -l path to a library (can be repeated)
+    -r report file (.csv or .parquet)
+"""
+
+import argparse
+import importlib.util
+import itertools
+import multiprocessing
+import sqlite3
+from collections import defaultdict
+from collections.abc import Iterator
+from contextlib import closing
+from multiprocessing.pool import Pool
+from pathlib import Path
+
+import pandas as pd
+from tqdm import tqdm
+
+from filecluster import logger
+from filecluster.library_filter import iter_library_files
+from filecluster.utlis import hash_file, partial_hash_file
+
+PARTIAL = "p"
+FULL = "f"
+
+# flush the progress file after this many new hashes
+PROGRESS_FLUSH_EVERY = 256
+
+# files hashed in one batch (whole size groups, so a batch can be bigger)
+BATCH_FILES = 4096
+
+# rows inserted into the temporary databases at once
+INSERT_CHUNK = 1000
+
+REPORT_COLUMNS = ["group_id", "size", "hash_value", "path", "is_kept"]
+
+
+def _hash_entry(
+    entry: tuple[str, int, int, str],
+) -> tuple[str, int, int, str, str | None]:
+    """Hash a single file in a pool worker."""
+    path, size, mtime_ns, kind = entry
+    if kind == PARTIAL:
+        hash_value = partial_hash_file(path)
+    else:
+        try:
+            hash_value = hash_file(path)
+        except OSError:
+            hash_value = None
+    return path, size, mtime_ns, kind, hash_value
+
+
+def _parse_progress_lines(lines) -> Iterator[tuple[str, str, int, int, str]]:
+    for line in lines:
+        try:
+            kind, size, mtime, hash_value, path = line.rstrip("\n").split("\t", 4)
+            yield kind, path, int(size), int(mtime), hash_value
+        except ValueError:
+            # truncated last line of an interrupted run
+            continue
+
+
+def _insert_chunks(db: sqlite3.Connection, sql: str, rows) -> None:
+    rows = iter(rows)
+    while chunk := list(itertools.islice(rows, INSERT_CHUNK)):
+        db.executemany(sql, chunk)
+
+
+class HashProgress:
+    """Append-only record of the computed hashes used to resume a scan.
+
+    Each line: kind, size, mtime_ns, hash, path (tab-separated). The stored
+    hashes are looked up in a temporary on-disk database, not kept in memory.
+    """
+
+    def __init__(self, path: str | Path | None):
+        self.path = Path(path) if path else None
+        # empty name: private temporary database, removed when closed
+        self._db = sqlite3.connect("")
+        self._db.execute(
+            "CREATE TABLE hashes (kind TEXT, path TEXT, size INTEGER, "
+            "mtime_ns INTEGER, hash TEXT, PRIMARY KEY (kind, path))"
+        )
+        self._file = None
+        self._n_pending = 0
+        if self.path is not None and self.path.exists():
+            self._load()
+
+    def _load(self) -> None:
+        with open(self.path, encoding="utf-8") as f:
+            _insert_chunks(
+                self._db,
+                "INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?, ?)",
+                _parse_progress_lines(f),
+            )
+        logger.info(f"Resuming with {len(self)} hashes from {self.path}")
+
+    def __len__(self) -> int:
+        return self._db.execute("SELECT COUNT(*) FROM hashes").fetchone()[0]
+
+    def get(self, kind: str, path: str, size: int, mtime_ns: int) -> str | None:
+        """Return the stored hash if the file was not modified since."""
+        stored = self._db.execute(
+            "SELECT hash FROM hashes WHERE kind = ? AND path = ? AND size = ? "
+            "AND mtime_ns = ?",
+            (kind, path, size, mtime_ns),
+        ).fetchone()
+        return stored[0] if stored else None
+
+    def add(self, kind: str, path: str, size: int, mtime_ns: int, hash_value) -> None:
+        """Record a computed hash."""
+        self._db.execute(
+            "INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?, ?)",
+            (kind, path, size, mtime_ns, hash_value),
+        )
+        if self.path is None:
+            return
+        if self._file is None:
+            self._file = open(self.path, "a", encoding="utf-8")  # noqa: SIM115
+        self._file.write(f"{kind}\t{size}\t{mtime_ns}\t{hash_value}\t{path}\n")
+        self._n_pending += 1
+        if self._n_pending >= PROGRESS_FLUSH_EVERY:
+            self._file.flush()
+            self._n_pending = 0
+
+    def close(self) -> None:
+        """Flush and close the progress file, drop the lookup database."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._db.close()
+
+
+def _iter_file_stats(libraries: list[str] | list[Path]):
+    for lib in libraries:
+        for path in iter_library_files(lib):
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            yield str(path), st.st_size, st.st_mtime_ns
+
+
+def store_library_files(db: sqlite3.Connection, libraries) -> int:
+    """Walk the libraries, store (path, size, mtime_ns) of the files in the db.
+
+    Returns:
+        Number of files sharing their size with another file.
+    """
+    db.execute("CREATE TABLE files (path TEXT, size INTEGER, mtime_ns INTEGER)")
+    _insert_chunks(
+        db, "INSERT INTO files VALUES (?, ?, ?)", _iter_file_stats(libraries)
+    )
+    db.execute("CREATE INDEX files_size ON files (size)")
+    return db.execute(
+        "SELECT COALESCE(SUM(n), 0) FROM "
+        "(SELECT COUNT(*) AS n FROM files GROUP BY size HAVING n > 1)"
+    ).fetchone()[0]
+
+
+def iter_size_group_batches(
+    db: sqlite3.Connection, batch_files: int | None = None
+) -> Iterator[list[tuple[str, int, int]]]:
+    """Read back the files with non-unique size, in batches of whole size groups."""
+    batch_files = batch_files or BATCH_FILES
+    rows = db.execute(
+        "SELECT path, size, mtime_ns FROM files WHERE size IN "
+        "(SELECT size FROM files GROUP BY size HAVING COUNT(*) > 1) "
+        "ORDER BY size"
+    )
+    batch: list[tuple[str, int, int]] = []
+    for _, group in itertools.groupby(rows, key=lambda row: row[1]):
+        batch.extend(group)
+        if len(batch) >= batch_files:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def hash_files(
+    files: list[tuple[str, int, int]],
+    kind: str,
+    pool: Pool,
+    progress: HashProgress,
+) -> dict[str, str]:
+    """Get hashes of the files, from progress record or computed in the pool."""
+    hashes = {}
+    todo = []
+    for path, size, mtime in files:
+        if (hash_value := progress.get(kind, path, size, mtime)) is not None:
+            hashes[path] = hash_value
+        else:
+            todo.append((path, size, mtime, kind))
+
+    results = pool.imap_unordered(_hash_entry, todo, chunksize=16)
+    for path, size, mtime, _, hash_value in tqdm(
+        results, total=len(todo), disable=len(todo) < 50
+    ):
+        if hash_value is not None:
+            progress.add(kind, path, size, mtime, hash_value)
+            hashes[path] = hash_value
+    return hashes
+
+
+def _regroup(files, hashes: dict[str, str]) -> list[list[tuple[str, int, int]]]:
+    """Split files by (size, hash), keep groups with at least two files."""
+    groups = defaultdict(list)
+    for f in files:
+        if (hash_value := hashes.get(f[0])) is not None:
+            groups[(f[1], hash_value)].append(f)
+    return [g for g in groups.values() if len(g) > 1]
+
+
+def find_library_duplicates(
+    libraries: list[str] | list[Path],
+    pool: Pool,
+    progress_path: str | Path | None = None,
+) -> pd.DataFrame:
+    """Find groups of identical files in the libraries.
+
+    Returns:
+        Dataframe with one row per duplicated file, columns: group_id, size,
+        hash_value, path, is_kept. In each group the file with the shortest
+        path is marked as kept - the others are reclaimable.
+    """
+    logger.info("Listing library files")
+    groups: list[tuple[int, str, list[str]]] = []
+    progress = HashProgress(progress_path)
+    # empty name: private temporary database, removed when closed
+    with closing(sqlite3.connect("")) as db:
+        n_candidates = store_library_files(db, libraries)
+        logger.info(f"{n_candidates} files share their size with another file")
+        try:
+            for batch in iter_size_group_batches(db):
+                groups.extend(_find_batch_duplicates(batch, pool, progress))
+        finally:
+            progress.close()
+
+    rows = []
+    groups.sort(key=lambda g: (-g[0], min(g[2])))
+    for group_id, (size, hash_value, paths) in enumerate(groups):
+        paths = sorted(paths, key=lambda p: (len(p), p))
+        for path in paths:
+            rows.append((group_id, size, hash_value, path, path == paths[0]))
+    return pd.DataFrame(rows, columns=pd.Index(REPORT_COLUMNS))
+
+
+def _find_batch_duplicates(
+    files: list[tuple[str, int, int]], pool: Pool, progress: HashProgress
+) -> list[tuple[int, str, list[str]]]:
+    """Get groups (size, hash, paths) of identical files of a batch."""
+    partials = hash_files(files, PARTIAL, pool, progress)
+    same_head = [f for g in _regroup(files, partials) for f in g]
+    fulls = hash_files(same_head, FULL, pool, progress)
+    return [
+        (group[0][1], fulls[group[0][0]], [f[0] for f in group])
+        for group in _regroup(same_head, fulls)
+    ]
+
+
+def reclaimable_bytes(report: pd.DataFrame) -> int:
+    """Total size of the duplicated files that are not kept."""
+    return int(report.loc[~report.is_kept, "size"].sum())
+
+
+def check_report_format(report_path: str | Path) -> None:
+    """Check before the scan that the report can be saved in its format.
+
+    Raises:
+        ImportError: a Parquet report without pyarrow or fastparquet installed
+    """
+    if not str(report_path).lower().endswith(".parquet"):
+        return
+    if not any(importlib.util.find_spec(m) for m in ("pyarrow", "fastparquet")):
+        raise ImportError(
+            "Parquet reports need pyarrow or fastparquet (pip install pyarrow), "
+            "save the report as .csv instead"
+        )
+
+
+def save_report(report: pd.DataFrame, report_path: str | Path) -> None:
+    """Save the report as CSV or Parquet (chosen by the file extension)."""
+    if str(report_path).lower().endswith(".parquet"):
+        report.to_parquet(report_path, index=False)
+    else:
+        report.to_csv(report_path, index=False)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Find duplicated files inside the media libraries."
+    )
+    parser.add_argument(
+        "-l",
+        "--library",
+        help="top-level directory of the media library.",
+        type=str,
+        action="append",
+        required=True,
+    )
+    parser.add_argument(
+        "-r",
+        "--report",
+        help="report file with duplicate groups (.csv or .parquet)",
+        type=str,
+        default="duplicates.csv",
+    )
+    parser.add_argument(
+        "-p",
+        "--progress",
+        help="file with computed hashes, used to resume interrupted scans "
+        "(default: report file name + .progress)",
+        type=str,
+        default=None,
+    )
+    args = parser.parse_args()
+    try:
+        check_report_format(args.report)
+    except ImportError as e:
+        parser.error(str(e))
+
+    n_cpu = multiprocessing.cpu_count()
+    logger.debug(f"Setting-up multiprocessing pool with {n_cpu} processes")
+    with multiprocessing.Pool(processes=n_cpu) as pool:
+        duplicates = find_library_duplicates(
+            args.library, pool, progress_path=args.progress or f"{args.report}.progress"
+        )
+    save_report(duplicates, args.report)
+    n_groups = duplicates.group_id.nunique()
+    mib = reclaimable_bytes(duplicates) / 2**20
+    logger.info(
+        f"Found {n_groups} groups of duplicates, {mib:.1f} MiB reclaimable. "
+        f"Report saved to {args.report}"
+    )
@@ -2,9 +2,9 @@
 
 from __future__ import annotations
 
-import hashlib
 import os
 import random
+from collections import defaultdict
 from collections.abc import Iterator
 from pathlib import Path, PosixPath
 from typing import Any
@@ -14,17 +14,35 @@ from pandas._libs.tslibs.timestamps import Timestamp
 from tqdm import tqdm
 
 from filecluster import logger
+from filecluster.catalog import LibraryCatalog
 from filecluster.configuration import (
     AssignDateToClusterMethod,
     Config,
+    CopyMode,
     Status,
     default_settings,
 )
 from filecluster.dbase import get_new_cluster_id_from_dataframe
+from filecluster.duplicates import group_identical_files
 from filecluster.exceptions import MissingDfClusterColumnError
-from filecluster.file_operations import FileOperationPlan, build_file_operation_plan
+from filecluster.file_operations import (
+    CopyOp,
+    FileOperationPlan,
+    MoveOp,
+    build_file_operation_plan,
+    optimize_plan,
+    strip_copy_suffix,
+)
 from filecluster.filecluster_types import ClustersDataFrame, MediaDataFrame
-from filecluster.utlis import hash_file
+from filecluster.library_filter import LibraryPrescreen
+from filecluster.perceptual import build_library_index, dhash
+from filecluster.update_clusters import (
+    merge_cluster_info,
+    read_cluster_row,
+    save_cluster_inis,
+    scan_cluster_folder,
+)
+from filecluster.utlis import hash_file, partial_hash_file
 
 
 class TargetPathCreator:
@@ -48,6 +66,18 @@ class TargetPathCreator:
         return str(Path("duplicated") / cluster_name)
 
 
+def _holds_other_files(folder: Path, names: set[str]) -> bool:
+    """Check if the folder holds files other than the given ones and cluster info."""
+    ini_filename = default_settings.ini_filename
+    with os.scandir(folder) as it:
+        return any(
+            entry.is_file()
+            and entry.name not in names
+            and not entry.name.startswith(ini_filename)
+            for entry in it
+        )
+
+
 class ImageGrouper:
     """Class for clustering media objects by date."""
 
@@ -84,8 +114,10 @@ class ImageGrouper:
         # sort by creation date
         self.inbox_media_df.sort_values(by=date_col, ascending=True, inplace=True)
 
-        # select not clustered items
-        sel = self.inbox_media_df.cluster_id.isna()
+        # select not clustered items (extra copies of inbox files are not moved)
+        sel = self.inbox_media_df.cluster_id.isna() & (
+            self.inbox_media_df.status != Status.INBOX_DUPLICATE
+        )
 
         # calculate breaks between the non-clustered images
         self.inbox_media_df[delta_col] = None
@@ -251,19 +283,90 @@ class ImageGrouper:
             new_folder_names.append(pth)
         return new_folder_names
 
-    def build_file_operation_plan(self) -> FileOperationPlan:
+    def build_file_operation_plan(
+        self, mode: CopyMode | None = None
+    ) -> FileOperationPlan:
         """Build a plan of file operations without executing them.
 
+        The operations are ordered for locality of the disk accesses (see
+        optimize_plan) unless disabled by the optimize_plan_order setting.
+
+        Args:
+            mode: mode of the planned operations (default from config), e.g. to
+                estimate the cost of a dry run
+
         Returns:
             A FileOperationPlan that can be inspected or executed separately.
         """
-        return build_file_operation_plan(
+        plan = build_file_operation_plan(
             inbox_media_df=self.inbox_media_df,
             in_dir=Path(self.config.in_dir_name),
             out_dir=Path(self.config.out_dir_name),
-            mode=self.config.mode,
+            mode=mode or self.config.mode,
             restore_original_names=self.config.restore_original_names,
         )
+        if default_settings.optimize_plan_order:
+            plan = optimize_plan(plan)
+        return plan
+
+    def update_target_cluster_info(
+        self, plan: FileOperationPlan, failed: list[CopyOp] | None = None
+    ) -> list[Path]:
+        """Write through cluster info of the folders that received media.
+
+        The .cluster.ini of each destination folder (of new and existing
+        clusters) is updated from the dates in inbox_media_df, merged with the
+        info already stored in the folder or, for the first files of an
+        existing cluster, with the info of the library cluster. Only a folder
+        without cluster info that holds other files than the received ones is
+        scanned again. A catalog in the output folder is updated as well.
+
+        Args:
+            plan: executed plan
+            failed: copies that failed the verification (not in the folders)
+
+        Returns:
+            Destination folders with updated cluster info.
+        """
+        out_dir = Path(self.config.out_dir_name)
+        media = self.inbox_media_df.set_index("file_name")
+        failed_ops = set(failed or [])
+        received: dict[Path, list] = defaultdict(list)
+        received_names: dict[Path, set[str]] = defaultdict(set)
+        for op in plan.ops:
+            if not isinstance(op, (CopyOp, MoveOp)) or op in failed_ops:
+                continue
+            if media.at[op.src.name, "status"] == Status.DUPLICATE:
+                continue
+            received[op.dst.parent].append(media.at[op.src.name, "date"])
+            received_names[op.dst.parent].add(op.dst.name)
+
+        library_paths = {}
+        if hasattr(self, "df_clusters") and "path" in self.df_clusters:
+            sel = self.df_clusters.target_path.notna() & self.df_clusters.path.notna()
+            for target, pth in self.df_clusters.loc[
+                sel, ["target_path", "path"]
+            ].itertuples(index=False):
+                library_paths[out_dir / str(target)] = Path(pth)
+
+        granularity = int(self.config.time_granularity.total_seconds())
+        updates = []
+        for folder, dates in received.items():
+            base = read_cluster_row(folder)
+            if base is None and _holds_other_files(folder, received_names[folder]):
+                # the merge would miss the media already in the folder
+                scan_cluster_folder(folder)
+                continue
+            if base is None and folder in library_paths:
+                base = read_cluster_row(library_paths[folder])
+            updates.append((merge_cluster_info(base, dates, granularity), folder))
+        save_cluster_inis(updates)
+        rows = [row for folder in received if (row := read_cluster_row(folder))]
+
+        if (out_dir / default_settings.library_catalog_filename).exists():
+            with LibraryCatalog(out_dir) as catalog:
+                catalog.upsert(rows)
+        return sorted(received)
 
     def move_files_to_cluster_folder(self):
         """Physical move of the file to the cluster folder.
@@ -273,7 +376,14 @@ class ImageGrouper:
         from filecluster.file_operations import execute_plan
 
         plan = self.build_file_operation_plan()
-        execute_plan(plan)
+        execute_plan(
+            plan,
+            jobs_per_device=self.config.copy_jobs_per_device,
+            copy_method=self.config.copy_method,
+            verify=self.config.verify_copies,
+            bandwidth_limit=self.config.io_bandwidth_limit,
+            ops_limit=self.config.io_ops_limit,
+        )
 
     def add_target_dir_for_duplicates(self):
         """Add a target directory for the duplicated media files."""
@@ -425,6 +535,81 @@ class ImageGrouper:
             pth = path_creator.for_existing_cluster(dir_string=cl)
             self.df_clusters.loc[sel_cluster, "target_path"] = pth
 
+    def mark_inbox_internal_duplicates(self) -> list[str]:
+        """Mark files that are present in the inbox more than once.
+
+        Uses the same size -> partial hash -> full hash tiers as the library
+        duplicate search. In each group of identical files one copy is kept
+        (preferably the one without a copy-suffix in the name), the remaining
+        copies get INBOX_DUPLICATE status and the name of the kept copy in
+        'duplicated_to'.
+
+        Returns:
+            List of inbox filenames that are extra copies of another inbox file
+        """
+        sel_unknown = self.inbox_media_df.status == Status.UNKNOWN
+        df = self.inbox_media_df[sel_unknown]
+        known_hashes = df["hash_value"].to_dict() if "hash_value" in df else {}
+        groups = group_identical_files(
+            (
+                (idx, Path(self.config.in_dir_name) / row["file_name"], row["size"])
+                for idx, row in df.iterrows()
+            ),
+            known_hashes=known_hashes,
+        )
+
+        extra_copies = []
+        for group in groups:
+            names = self.inbox_media_df.loc[group, "file_name"]
+            kept = min(
+                names.index,
+                key=lambda i: (
+                    strip_copy_suffix(names[i]) != names[i],
+                    len(names[i]),
+                    names[i],
+                ),
+            )
+            for idx in group:
+                if idx == kept:
+                    continue
+                self.inbox_media_df.loc[idx, "status"] = Status.INBOX_DUPLICATE
+                self.inbox_media_df.loc[idx, "duplicated_to"] = names[kept]
+                extra_copies.append(names[idx])
+        if extra_copies:
+            logger.info(f"Found {len(extra_copies)} extra copies of inbox files")
+        return extra_copies
+
+    def mark_inbox_near_duplicates(self) -> list[str]:
+        """Find library images perceptually similar to inbox images.
+
+        Byte-identical copies are found by mark_inbox_duplicates, this catches
+        recompressed or resized copies. The status of the files is not changed,
+        the closest library image is recorded in 'near_duplicate_of' column.
+
+        Returns:
+            List of inbox filenames that have a near-duplicate in a library
+        """
+        self.inbox_media_df["near_duplicate_of"] = None
+        if not any(self.config.watch_folders):
+            return []
+
+        index = build_library_index(self.config.watch_folders)
+        radius = self.config.near_duplicate_max_distance
+        sel = (self.inbox_media_df.status == Status.UNKNOWN) & (
+            self.inbox_media_df.is_image
+        )
+
+        near_dups = []
+        for idx, row in self.inbox_media_df[sel].iterrows():
+            hash_value = dhash(Path(self.config.in_dir_name) / row["file_name"])
+            if hash_value is None:
+                continue
+            if matches := index.query(hash_value, radius):
+                self.inbox_media_df.loc[idx, "near_duplicate_of"] = str(matches[0][0])
+                near_dups.append(row["file_name"])
+        logger.info(f"Found {len(near_dups)} inbox images similar to library images")
+        return near_dups
+
     def mark_inbox_duplicates(self) -> tuple[list[str], list[str]]:
         """Check if imported files are not in the library already, if so - skip them.
 
@@ -447,33 +632,41 @@ class ImageGrouper:
             logger.debug("No library folder defined. Skipping duplicate search.")
             return [], []
 
-        # Get files in watch folders
-        watch_file_names, watch_full_paths = get_watch_folders_files_path(
-            self.config.watch_folders
-        )
+        # Process unassigned files in inbox
+        sel_unknown = self.inbox_media_df.status == Status.UNKNOWN
+        inbox_candidates = self.inbox_media_df[sel_unknown]
+        inbox_partials: dict[Any, str | None] = {}
+
+        # 0. Optional pre-screen: drop inbox files that are definitely new
+        prescreen = None
+        if self.config.use_library_prescreen:
+            prescreen = LibraryPrescreen.for_libraries(self.config.watch_folders)
+            maybe_in_library = []
+            for idx, row in inbox_candidates.iterrows():
+                inbox_path = os.path.join(self.config.in_dir_name, row["file_name"])
+                inbox_partials[idx] = partial_hash_file(inbox_path)
+                maybe_in_library.append(
+                    prescreen.may_contain(row["size"], inbox_partials[idx])
+                )
+            inbox_candidates = inbox_candidates[maybe_in_library]
+            if inbox_candidates.empty:
+                logger.info(prescreen.report(n_confirmed=0))
+                return [], []
 
         # 1. First pass: Map library files by size to avoid unnecessary hashing
         logger.info("Building library size index")
-        library_by_size = {}
-        for path in watch_full_paths:
-            try:
-                size = os.path.getsize(path)
-                if size not in library_by_size:
-                    library_by_size[size] = []
-                library_by_size[size].append(path)
-            except OSError:
-                pass
+        library_by_size = get_library_size_index(
+            self.config.watch_folders,
+            sizes=set(inbox_candidates["size"]) if prescreen else None,
+        )
 
         logger.info("Checking for duplicates using size -> partial hash -> full hash")
 
-        # Process unassigned files in inbox
-        sel_unknown = self.inbox_media_df.status == Status.UNKNOWN
-
-        n_unknown = sum(sel_unknown)
+        n_candidates = len(inbox_candidates)
         for idx, row in tqdm(
-            self.inbox_media_df[sel_unknown].iterrows(),
-            total=n_unknown,
-            disable=n_unknown < 50,
+            inbox_candidates.iterrows(),
+            total=n_candidates,
+            disable=n_candidates < 50,
         ):
             inbox_size = row["size"]
             inbox_file_name = row["file_name"]
@@ -484,13 +677,6 @@ class ImageGrouper:
 
             potential_matches = library_by_size[inbox_size]
 
-            def get_partial_hash(filepath, size=1024 * 1024):
-                try:
-                    with open(filepath, "rb") as f:
-                        return hashlib.md5(f.read(size)).hexdigest()
-                except OSError:
-                    return None
-
             # Helper for full hashing
             # (inbox already has full hash computed in hash_value column if image_reader did it)
             inbox_hash = row.get("hash_value")
@@ -503,12 +689,14 @@ class ImageGrouper:
                     continue
 
             # Check against potential matches
-            inbox_path = os.path.join(self.config.in_dir_name, inbox_file_name)
-            inbox_partial = get_partial_hash(inbox_path)
+            if idx not in inbox_partials:
+                inbox_path = os.path.join(self.config.in_dir_name, inbox_file_name)
+                inbox_partials[idx] = partial_hash_file(inbox_path)
+            inbox_partial = inbox_partials[idx]
 
             for lib_path in potential_matches:
                 # 2. Partial hash match
-                lib_partial = get_partial_hash(lib_path)
+                lib_partial = partial_hash_file(lib_path)
 
                 if inbox_partial and lib_partial and inbox_partial == lib_partial:
                     # 3. Full hash match
@@ -538,6 +726,9 @@ class ImageGrouper:
                     except OSError:
                         continue
 
+        if prescreen is not None:
+            logger.info(prescreen.report(n_confirmed=len(set(confirmed_inbox_dups))))
+
         return list(set(confirmed_inbox_dups)), list(set(clusters_with_dups))
 
 
@@ -553,6 +744,30 @@ def get_files_from_folder(folder: str | Path) -> Iterator[Any]:
     return Path(folder).rglob("*.*")
 
 
+def get_library_size_index(
+    watch_folders: list[str] | list[Path], sizes: set[int] | None = None
+) -> dict[int, list[Path]]:
+    """Map file size to the library files of that size.
+
+    Args:
+      watch_folders: folders to be recursively listed
+      sizes: if given, only files with one of these sizes are kept
+
+    Returns:
+        Dictionary size -> list of full paths
+    """
+    library_by_size: dict[int, list[Path]] = {}
+    for w in watch_folders:
+        for path in get_files_from_folder(w):
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                continue
+            if sizes is None or size in sizes:
+                library_by_size.setdefault(size, []).append(path)
+    return library_by_size
+
+
 def get_watch_folders_files_path(
     watch_folders: list[str] | list[Path],
 ) -> tuple[list[str], list[PosixPath]]:
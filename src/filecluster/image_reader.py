@@ -3,9 +3,11 @@
 import os
 import struct
 from datetime import datetime as dt
+from multiprocessing.pool import Pool
 from pathlib import Path
 from typing import Any
 
+import numpy as np
 import pandas as pd
 from pandas import DataFrame
 from pydantic import BaseModel
@@ -22,6 +24,9 @@ from filecluster.configuration import (
 )
 from filecluster.filecluster_types import MediaDataFrame
 
+# NaT as int64 nanoseconds
+NAT_NS = np.iinfo(np.int64).min
+
 # for extracting timestamp from MOV files
 ATOM_HEADER_SIZE = 8
 # difference between Unix epoch and QuickTime epoch, in seconds
@@ -162,6 +167,14 @@ def prepare_new_row_with_meta(
     return initialize_row_dict(meta)
 
 
+def _prepare_new_row_task(args: tuple[str, list[str], Path]) -> dict[str, Any]:
+    """Read metadata of a single file in a pool worker."""
+    media_file_name, accepted_media_file_extensions, in_dir_name = args
+    return prepare_new_row_with_meta(
+        media_file_name, accepted_media_file_extensions, in_dir_name, Metadata()
+    )
+
+
 def get_mov_timestamps(filename):
     """Get the creation and modification date-time from .mov metadata.
 
@@ -212,10 +225,17 @@ def get_creation_time(struct, f):
 class InboxReader:
     """Initialize a media database with existing media dataframe or create empty one."""
 
-    def __init__(self, in_dir_name, media_df: MediaDataFrame | None = None) -> None:
+    def __init__(
+        self,
+        in_dir_name,
+        media_df: MediaDataFrame | None = None,
+        pool: Pool | None = None,
+    ) -> None:
         # read the config
 
         self.in_dir_name = in_dir_name
+        # optional worker pool for reading metadata and hashing the files
+        self.pool = pool
         self.image_extensions = default_settings.image_extensions
         self.video_extensions = default_settings.video_extensions
 
@@ -241,14 +261,21 @@ class InboxReader:
 
         logger.debug(f"Reading data from: {in_dir_name}")
         image_extensions = self.image_extensions
+        file_list = [
+            f for f in os.listdir(in_dir_name) if ut.is_supported_filetype(f, ext)
+        ]
+        if self.pool is not None:
+            tasks = [(f, image_extensions, Path(in_dir_name)) for f in file_list]
+            # imap keeps the order of the files
+            rows = self.pool.imap(_prepare_new_row_task, tasks, chunksize=8)
+            return list(tqdm(rows, total=len(tasks), disable=len(tasks) < 50))
+
         meta = Metadata()
-        file_list = list(os.listdir(in_dir_name))
         for file_name in tqdm(file_list, disable=len(file_list) < 50):
-            if ut.is_supported_filetype(file_name, ext):
-                new_row = prepare_new_row_with_meta(
-                    file_name, image_extensions, Path(in_dir_name), meta
-                )
-                list_of_rows.append(new_row)
+            new_row = prepare_new_row_with_meta(
+                file_name, image_extensions, Path(in_dir_name), meta
+            )
+            list_of_rows.append(new_row)
         return list_of_rows
 
     def get_media_files_info(self) -> None:
@@ -307,33 +334,51 @@ def get_media_df(in_dir_name: Path) -> MediaDataFrame | None:
         return None
 
 
-def get_media_stats(df: DataFrame, time_granularity: int) -> dict:
-    """Get statistics of media data represented in a data frame.
+def get_timestamps_stats(timestamps_ns: np.ndarray, time_granularity: int) -> dict:
+    """Get statistics of media timestamps given as int64 nanoseconds.
 
-        Get statistics of the media folder.
+    Computed with numpy on a single sorted copy of the timestamps. Missing
+    timestamps (NaT) are ignored in the dates but make the media not
+    time-consistent (their gap to other media is unknown).
+
+    Args:
+        timestamps_ns: media timestamps, int64 nanoseconds (NaT as iNaT)
+        time_granularity: max allowed gap (in seconds) between consecutive media
 
     Returns:
-        Dictionary describing media in a dataframe.
+        Dictionary describing the media, see get_media_stats.
     """
-    date_min = df.date.min()
-    date_max = df.date.max()
-    date_median = df["date"].median()
-
-    df = df[["file_name", "date"]].copy()
-    df["date_int"] = df["date"].apply(lambda x: x.value / 10**9)
-    df = df.sort_values("date_int")
-    df["delta"] = df.date_int.diff()
-
-    # check all media in the folder are compliant with the assumption that
-    # all the media from the same event are not more than 1 hour apart
-    # from each other
-    is_time_consistent = not (any(df.delta.values > time_granularity))
+    timestamps_ns = np.asarray(timestamps_ns, dtype=np.int64)
+    valid = np.sort(timestamps_ns[timestamps_ns != NAT_NS])
+    n_valid = len(valid)
+    if n_valid:
+        date_min, date_max = valid[0], valid[-1]
+        lower, upper = valid[(n_valid - 1) // 2], valid[n_valid // 2]
+        date_median = lower + (upper - lower) // 2
+        max_gap = np.diff(valid).max(initial=0)
+    else:
+        date_min = date_max = date_median = NAT_NS
+        max_gap = 0
 
-    file_count = len(df)
+    has_missing = n_valid not in (0, len(timestamps_ns))
     return {
-        "date_min": date_min,
-        "date_max": date_max,
-        "date_median": date_median,
-        "is_time_consistent": is_time_consistent,
-        "file_count": file_count,
+        "date_min": pd.Timestamp(date_min),
+        "date_max": pd.Timestamp(date_max),
+        "date_median": pd.Timestamp(date_median),
+        "is_time_consistent": not has_missing
+        and bool(max_gap <= time_granularity * 10**9),
+        "file_count": len(timestamps_ns),
     }
+
+
+def get_media_stats(df: DataFrame, time_granularity: int) -> dict:
+    """Get statistics of media data represented in a data frame.
+
+    Returns:
+        Dictionary describing media in a dataframe: date_min, date_max,
+        date_median, is_time_consistent (all media from the same event are not
+        more than time_granularity seconds apart from each other) and
+        file_count.
+    """
+    dates = pd.to_datetime(df["date"]).to_numpy(dtype="datetime64[ns]")
+    return get_timestamps_stats(dates.view(np.int64), time_granularity)
@@ -0,0 +1,159 @@
+"""Write-ahead journal of the plan execution.
+
+Before any file is touched, the whole plan is saved to the journal file in the
+output directory (written atomically). Then the index of every completed
+operation is appended, as well as of every copy that failed its verification
+(finished with failure, not repeated on resume). The appends are synced to the disk in batches, so an
+interrupted run loses at most the records of the last batch - those operations
+are repeated on resume (copies are overwritten, moves already done are
+recognized by the missing source and the existing destination).
+
+The journal is removed when every operation of the plan is finished, an existing
+journal means the previous run was interrupted and can be resumed without
+scanning the inbox and the libraries again.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import TextIO
+
+from filecluster import logger
+from filecluster.file_operations import (
+    FileOperationPlan,
+    op_from_dict,
+    op_to_dict,
+)
+from filecluster.update_clusters import TMP_SUFFIX, fsync_dir
+
+JOURNAL_VERSION = 1
+
+# sync the completion records after this many operations or seconds
+SYNC_EVERY_OPS = 64
+SYNC_EVERY_SECONDS = 1.0
+
+
+class PlanJournal:
+    """Plan and the indices of its completed and failed operations.
+
+    Lines (JSON): header, one line per operation, then {"done": index} and
+    {"failed": index} records.
+    """
+
+    def __init__(
+        self,
+        path: str | Path,
+        plan: FileOperationPlan,
+        done: set[int] | None = None,
+        failed: set[int] | None = None,
+    ):
+        self.path = Path(path)
+        self.plan = plan
+        self.done: set[int] = done or set()
+        self.failed: set[int] = failed or set()
+        # loaded from an existing journal (the previous run was interrupted)
+        self.resumed = done is not None
+        self._file: TextIO | None = None
+        self._lock = threading.Lock()
+        self._n_pending = 0
+        self._last_sync = time.monotonic()
+
+    @classmethod
+    def create(cls, path: str | Path, plan: FileOperationPlan) -> PlanJournal:
+        """Save the plan to a new journal file."""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(path.name + TMP_SUFFIX)
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            header = {"journal": JOURNAL_VERSION, "n_ops": len(plan.ops)}
+            f.write(json.dumps(header) + "\n")
+            for op in plan.ops:
+                f.write(json.dumps(op_to_dict(op)) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        fsync_dir(path.parent)
+        return cls(path, plan)
+
+    @classmethod
+    def load(cls, path: str | Path) -> PlanJournal:
+        """Read the plan and the completed operations from the journal file.
+
+        Raises:
+            ValueError: not a journal file or unsupported version
+        """
+        path = Path(path)
+        with open(path, encoding="utf-8") as f:
+            header = json.loads(f.readline())
+            if header.get("journal") != JOURNAL_VERSION:
+                raise ValueError(f"Unsupported journal version in {path}")
+            ops = [
+                op_from_dict(json.loads(f.readline())) for _ in range(header["n_ops"])
+            ]
+            done, failed = set(), set()
+            records = {"done": done, "failed": failed}
+            for line in f:
+                try:
+                    ((kind, index),) = json.loads(line).items()
+                    records[kind].add(int(index))
+                except (ValueError, KeyError, TypeError, AttributeError):
+                    # truncated last line of an interrupted run
+                    continue
+        return cls(path, FileOperationPlan(ops=ops), done, failed)
+
+    @property
+    def finished(self) -> set[int]:
+        """Indices of the operations not to be executed again."""
+        return self.done | self.failed
+
+    def mark_done(self, index: int) -> None:
+        """Record completion of the operation with the given index in the plan."""
+        self._append("done", index, self.done)
+
+    def mark_failed(self, index: int) -> None:
+        """Record a copy that failed its verification (not repeated on resume)."""
+        self._append("failed", index, self.failed)
+
+    def _append(self, kind: str, index: int, indices: set[int]) -> None:
+        with self._lock:
+            indices.add(index)
+            if self._file is None:
+                self._file = open(self.path, "a", encoding="utf-8")  # noqa: SIM115
+            self._file.write(f'{{"{kind}": {index}}}\n')
+            self._n_pending += 1
+            if (
+                self._n_pending >= SYNC_EVERY_OPS
+                or time.monotonic() - self._last_sync >= SYNC_EVERY_SECONDS
+            ):
+                self._sync()
+
+    def _sync(self) -> None:
+        if self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        self._n_pending = 0
+        self._last_sync = time.monotonic()
+
+    def close(self) -> None:
+        """Sync and close the journal file."""
+        with self._lock:
+            self._sync()
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def remove(self) -> None:
+        """Remove the journal of a finished plan."""
+        self.close()
+        self.path.unlink(missing_ok=True)
+        logger.debug(f"Removed journal {self.path}")
+
+    def __enter__(self) -> PlanJournal:
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
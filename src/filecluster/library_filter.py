@@ -0,0 +1,270 @@
+"""Compact probabilistic pre-screen of library membership.
+
+A Bloom filter over ``(size, partial hash)`` keys of every file in a library is
+persisted in the library root. Inbox files whose key is not in the filter are
+definitely new, so the duplicate search can reject them without building the
+size -> paths index of the library.
+
+The filter is rebuilt when the library changes. A change is detected by a
+digest of (path, size, mtime) of every library file, including the files in the
+library root - only metadata is read, so files added, removed or rewritten in
+place are noticed without reading their contents.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import math
+import os
+from dataclasses import dataclass
+from pathlib import Path
+
+from filecluster import logger
+from filecluster.configuration import default_settings
+from filecluster.utlis import partial_hash_file
+
+_MAGIC = b"FCBLOOM1\n"
+
+# rough in-memory footprint of a single entry of the size -> paths index
+# (PosixPath object with its cached parts and string, plus list slot)
+_APPROX_PATH_ENTRY_BYTES = 300
+
+
+def make_key(size: int, partial_hash: str) -> str:
+    """Build a filter key from file size and partial hash."""
+    return f"{int(size)}:{partial_hash}"
+
+
+@dataclass(frozen=True)
+class LibraryState:
+    """Cheap characterization of the library files (metadata only)."""
+
+    n_files: int = 0
+    digest: str = ""
+
+
+class LibraryBloomFilter:
+    """Bloom filter with double hashing over string keys."""
+
+    def __init__(self, n_bits: int, n_hashes: int, n_items: int = 0, bits=None):
+        self.n_bits = max(8, int(n_bits))
+        self.n_hashes = max(1, int(n_hashes))
+        self.n_items = n_items
+        self.bits = (
+            bytearray(bits) if bits is not None else bytearray((self.n_bits + 7) // 8)
+        )
+        self.state = LibraryState()
+
+    @classmethod
+    def for_capacity(cls, n_items: int, fp_rate: float = 0.01) -> LibraryBloomFilter:
+        """Create a filter sized for *n_items* keys and target false-positive rate."""
+        n = max(1, n_items)
+        n_bits = math.ceil(-n * math.log(fp_rate) / math.log(2) ** 2)
+        n_hashes = round(n_bits / n * math.log(2))
+        return cls(n_bits=n_bits, n_hashes=n_hashes)
+
+    def _indices(self, key: str):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.n_bits for i in range(self.n_hashes))
+
+    def add(self, key: str) -> None:
+        """Add a key to the filter."""
+        for idx in self._indices(key):
+            self.bits[idx >> 3] |= 1 << (idx & 7)
+        self.n_items += 1
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[idx >> 3] & (1 << (idx & 7)) for idx in self._indices(key))
+
+    @property
+    def size_bytes(self) -> int:
+        """Size of the bit array in bytes."""
+        return len(self.bits)
+
+    @property
+    def expected_fp_rate(self) -> float:
+        """Theoretical false-positive rate for the current number of items."""
+        k, m, n = self.n_hashes, self.n_bits, self.n_items
+        return (1 - math.exp(-k * n / m)) ** k
+
+    @property
+    def estimated_index_bytes(self) -> int:
+        """Estimated memory of the size -> paths index this filter replaces."""
+        return self.n_items * _APPROX_PATH_ENTRY_BYTES
+
+    def save(self, path: str | Path) -> None:
+        """Write the filter (with the library state it describes) to *path*."""
+        header = {
+            "n_bits": self.n_bits,
+            "n_hashes": self.n_hashes,
+            "n_items": self.n_items,
+            "n_files": self.state.n_files,
+            "digest": self.state.digest,
+        }
+        with open(path, "wb") as f:
+            f.write(_MAGIC)
+            f.write(json.dumps(header).encode() + b"\n")
+            f.write(self.bits)
+
+    @classmethod
+    def load(cls, path: str | Path) -> LibraryBloomFilter | None:
+        """Read the filter from *path*. Return None if missing or malformed."""
+        try:
+            with open(path, "rb") as f:
+                if f.readline() != _MAGIC:
+                    return None
+                header = json.loads(f.readline())
+                bits = f.read()
+        except (OSError, ValueError):
+            return None
+        bloom = cls(header["n_bits"], header["n_hashes"], header["n_items"], bits)
+        if len(bloom.bits) != (bloom.n_bits + 7) // 8:
+            return None
+        # filters saved by older versions have no digest, they are rebuilt
+        bloom.state = LibraryState(header.get("n_files", 0), header.get("digest", ""))
+        return bloom
+
+
+def _own_files() -> set[str]:
+    """Names of the files filecluster keeps in the libraries."""
+    return {
+        default_settings.ini_filename,
+        default_settings.library_filter_filename,
+        default_settings.library_phash_filename,
+        default_settings.library_catalog_filename,
+        f"{default_settings.library_catalog_filename}-journal",
+        default_settings.journal_filename,
+    }
+
+
+def get_library_state(library_path: str | Path) -> LibraryState:
+    """Digest (relative path, size, mtime) of every file of the library.
+
+    filecluster's own files (and their temporary copies) are skipped - e.g. the
+    filter file is stored in the library root.
+    """
+    own_files = tuple(_own_files())
+    root = Path(library_path)
+    n_files = 0
+    digest = hashlib.sha1()
+    stack = [root]
+    while stack:
+        folder = stack.pop()
+        try:
+            with os.scandir(folder) as it:
+                entries = sorted(it, key=lambda e: e.name)
+        except OSError:
+            continue
+        subfolders = []
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                subfolders.append(Path(entry.path))
+            elif not entry.name.startswith(own_files):
+                try:
+                    st = entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+                rel_path = Path(entry.path).relative_to(root).as_posix()
+                digest.update(f"{rel_path}\0{st.st_size}\0{st.st_mtime_ns}\n".encode())
+                n_files += 1
+        # depth-first in name order, the digest doesn't depend on the listing
+        stack.extend(reversed(subfolders))
+    return LibraryState(n_files=n_files, digest=digest.hexdigest())
+
+
+def iter_library_files(library_path: str | Path):
+    """Iterate over library media candidates, skipping filecluster's own files."""
+    own_files = _own_files()
+    for path in Path(library_path).rglob("*.*"):
+        if path.name not in own_files and path.is_file():
+            yield path
+
+
+def build_library_filter(
+    library_path: str | Path, fp_rate: float = 0.01
+) -> LibraryBloomFilter:
+    """Hash the head of every library file and put its key into a new filter."""
+    state = get_library_state(library_path)
+    keys = []
+    for path in iter_library_files(library_path):
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            continue
+        if (partial := partial_hash_file(path)) is not None:
+            keys.append(make_key(size, partial))
+
+    bloom = LibraryBloomFilter.for_capacity(len(keys), fp_rate)
+    for key in keys:
+        bloom.add(key)
+    bloom.state = state
+    return bloom
+
+
+def get_or_build_library_filter(
+    library_path: str | Path, fp_rate: float = 0.01
+) -> LibraryBloomFilter:
+    """Load the filter persisted in the library, rebuild it if the library changed."""
+    filter_path = Path(library_path) / default_settings.library_filter_filename
+    bloom = LibraryBloomFilter.load(filter_path)
+    if bloom is not None and bloom.state == get_library_state(library_path):
+        logger.debug(f"Using library pre-screen filter {filter_path}")
+        return bloom
+
+    logger.info(f"Building library pre-screen filter for {library_path}")
+    bloom = build_library_filter(library_path, fp_rate)
+    try:
+        bloom.save(filter_path)
+    except OSError as e:
+        logger.warning(f"Cannot save library pre-screen filter: {e}")
+    return bloom
+
+
+class LibraryPrescreen:
+    """Membership pre-screen over filters of several libraries."""
+
+    def __init__(self, filters: list[LibraryBloomFilter]):
+        self.filters = filters
+        self.n_checked = 0
+        self.n_maybe = 0
+
+    @classmethod
+    def for_libraries(
+        cls, library_paths: list[str] | list[Path], fp_rate: float = 0.01
+    ) -> LibraryPrescreen:
+        """Load (or build) the filters of all given libraries."""
+        return cls([get_or_build_library_filter(lib, fp_rate) for lib in library_paths])
+
+    def may_contain(self, size: int, partial_hash: str | None) -> bool:
+        """Return False only if the file is definitely not in any library."""
+        self.n_checked += 1
+        if partial_hash is None:
+            maybe = True
+        else:
+            key = make_key(size, partial_hash)
+            maybe = any(key in f for f in self.filters)
+        self.n_maybe += maybe
+        return maybe
+
+    @property
+    def expected_fp_rate(self) -> float:
+        """Chance that a new file passes the pre-screen of at least one library."""
+        p_pass_none = math.prod(1 - f.expected_fp_rate for f in self.filters)
+        return 1 - p_pass_none
+
+    def report(self, n_confirmed: int) -> str:
+        """Describe the pre-screen outcome: rejection, false positives and memory."""
+        n_false = max(0, self.n_maybe - n_confirmed)
+        n_new = max(1, self.n_checked - n_confirmed)
+        filter_kib = sum(f.size_bytes for f in self.filters) / 1024
+        index_kib = sum(f.estimated_index_bytes for f in self.filters) / 1024
+        return (
+            f"Library pre-screen: {self.n_checked - self.n_maybe} of "
+            f"{self.n_checked} inbox files rejected as new; "
+            f"false-positive rate {n_false / n_new:.4f} "
+            f"(expected {self.expected_fp_rate:.4f}); "
+            f"filters {filter_kib:.0f} KiB vs ~{index_kib:.0f} KiB size index"
+        )
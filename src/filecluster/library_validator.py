@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""Validate the structure of the media library.
+
+Every folder of the library is classified (year, event, sel, sub_event,
+unknown) and checked for problems:
+- folders with subfolders but no media files (non-compliant),
+- empty folders,
+- discontinuous events (from the .cluster.ini files, folders are not scanned),
+- events with corrupt .cluster.ini files.
+
+The library is walked in parallel: each folder is listed once in a thread pool,
+the listing gives both the subfolders to visit and the media count. The result
+is saved as a machine-readable report (JSON or CSV).
+
+Usage:
+./library_validator.py -l tests/zdjecia -r validation.json
+
+    -l path to a library (can be repeated)
+    -r report file (.json or .csv)
+"""
+
+import argparse
+import json
+import os
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import pandas as pd
+
+from filecluster import logger
+from filecluster.configuration import FolderIssue, default_settings
+from filecluster.update_clusters import (
+    identify_folder_types,
+    is_non_compliant,
+    read_cluster_row,
+)
+from filecluster.utlis import is_supported_filetype
+
+REPORT_COLUMNS = ["library", "path", "folder_type", "n_media", "n_subfolders", "issues"]
+
+
+@dataclass
+class FolderReport:
+    """Validation result of a single library folder.
+
+    Attributes:
+        library: path to the library
+        path: path of the folder relative to the library (posix separators)
+        folder_type: one of year, event, sel, sub_event, unknown
+        n_media: number of media files directly in the folder
+        n_subfolders: number of subfolders
+        issues: problems found in the folder
+    """
+
+    library: str
+    path: str
+    folder_type: str
+    n_media: int
+    n_subfolders: int
+    issues: list[FolderIssue] = field(default_factory=list)
+
+    def to_dict(self) -> dict:
+        """Represent the report as a JSON-serializable dict."""
+        return {
+            "library": self.library,
+            "path": self.path,
+            "folder_type": self.folder_type,
+            "n_media": self.n_media,
+            "n_subfolders": self.n_subfolders,
+            "issues": [issue.value for issue in self.issues],
+        }
+
+
+def _list_folder(folder: Path) -> tuple[list[Path], int, set[str]]:
+    """List a folder once: subfolders, number of media files and file names."""
+    media_ext = [
+        *default_settings.image_extensions,
+        *default_settings.video_extensions,
+    ]
+    subfolders, file_names = [], set()
+    with os.scandir(folder) as it:
+        for entry in it:
+            if entry.is_dir(follow_symlinks=False):
+                subfolders.append(Path(entry.path))
+            else:
+                file_names.add(entry.name)
+    n_media = sum(is_supported_filetype(name, media_ext) for name in file_names)
+    return sorted(subfolders), n_media, file_names
+
+
+def _find_issues(
+    folder: Path, folder_type: str, subfolders: list, n_media: int, file_names: set
+) -> list[FolderIssue]:
+    issues = []
+    if folder_type == "unknown":
+        issues.append(FolderIssue.UNKNOWN_TYPE)
+    if not subfolders and not file_names:
+        issues.append(FolderIssue.EMPTY)
+    elif is_non_compliant(folder_type, len(subfolders), n_media):
+        issues.append(FolderIssue.NON_COMPLIANT)
+    if folder_type == "event" and default_settings.ini_filename in file_names:
+        row = read_cluster_row(folder)
+        if row is None:
+            issues.append(FolderIssue.CORRUPT_INI)
+        elif not row.is_continuous:
+            issues.append(FolderIssue.DISCONTINUOUS)
+    return issues
+
+
+def inspect_folder(
+    library_path: Path, folder: Path
+) -> tuple[FolderReport | None, list[Path]]:
+    """Classify and check a single folder.
+
+    Args:
+        library_path: path to the library
+        folder: folder inside the library
+
+    Returns:
+        Tuple (report, subfolders). Report is None for the library root.
+    """
+    subfolders, n_media, file_names = _list_folder(folder)
+    if folder == library_path:
+        return None, subfolders
+    rel_path = folder.relative_to(library_path).as_posix()
+    folder_type = identify_folder_types([rel_path])[0][1]
+    report = FolderReport(
+        library=str(library_path),
+        path=rel_path,
+        folder_type=folder_type,
+        n_media=n_media,
+        n_subfolders=len(subfolders),
+        issues=_find_issues(folder, folder_type, subfolders, n_media, file_names),
+    )
+    return report, subfolders
+
+
+def validate_library(
+    library_path: str | Path, max_workers: int | None = None
+) -> list[FolderReport]:
+    """Classify and check all folders of the library.
+
+    Args:
+        library_path: path to the library
+        max_workers: number of threads listing the folders
+
+    Returns:
+        Reports of all folders of the library, sorted by path.
+    """
+    library_path = Path(library_path)
+    reports = []
+    with ThreadPoolExecutor(max_workers=max_workers) as threads:
+        pending: set[Future] = {
+            threads.submit(inspect_folder, library_path, library_path)
+        }
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                report, subfolders = future.result()
+                if report is not None:
+                    reports.append(report)
+                pending.update(
+                    threads.submit(inspect_folder, library_path, sub)
+                    for sub in subfolders
+                )
+    return sorted(reports, key=lambda r: r.path)
+
+
+def find_non_compliant_folders(library_path: str | Path) -> list[str]:
+    """Get folders of the library that contain subfolders but no media files."""
+    return [
+        str(Path(library_path) / r.path)
+        for r in validate_library(library_path)
+        if FolderIssue.NON_COMPLIANT in r.issues
+    ]
+
+
+def save_validation_report(
+    reports: list[FolderReport], report_path: str | Path
+) -> None:
+    """Save the reports as JSON or CSV (chosen by the file extension).
+
+    In the CSV report the issues are joined with ';'.
+    """
+    records = [r.to_dict() for r in reports]
+    if str(report_path).lower().endswith(".csv"):
+        df = pd.DataFrame(records, columns=pd.Index(REPORT_COLUMNS))
+        df["issues"] = df["issues"].map(";".join)
+        df.to_csv(report_path, index=False)
+    else:
+        with open(report_path, "w", encoding="utf-8") as f:
+            json.dump(records, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Validate the structure of the media libraries."
+    )
+    parser.add_argument(
+        "-l",
+        "--library",
+        help="top-level directory of the media library.",
+        type=str,
+        action="append",
+        required=True,
+    )
+    parser.add_argument(
+        "-r",
+        "--report",
+        help="report file with all library folders (.json or .csv)",
+        type=str,
+        default="validation.json",
+    )
+    args = parser.parse_args()
+
+    all_reports = [r for lib in args.library for r in validate_library(lib)]
+    save_validation_report(all_reports, args.report)
+    n_with_issues = sum(bool(r.issues) for r in all_reports)
+    logger.info(
+        f"Validated {len(all_reports)} folders, {n_with_issues} with issues. "
+        f"Report saved to {args.report}"
+    )
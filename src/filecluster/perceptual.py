@@ -0,0 +1,177 @@
+"""Perceptual hashing and near-duplicate search.
+
+Byte-identical hashing misses recompressed or resized copies of a photo (e.g.
+WhatsApp exports). A difference hash (dHash) of the downscaled image survives
+such transformations, so copies differ by only a few bits.
+
+- hashes are computed from JPEG draft-mode decodes (the decoder scales the image
+  down by 1/2 .. 1/8, so the full-resolution image is never decoded),
+- library hashes are cached per library in a file in the library root and are
+  recomputed only for new or modified files,
+- the search uses a BK-tree, so Hamming-radius queries visit only the branches
+  that can contain a match instead of comparing against every library image.
+"""
+
+from __future__ import annotations
+
+import os
+from collections.abc import Hashable, Iterator
+from pathlib import Path
+
+from PIL import Image, UnidentifiedImageError
+
+from filecluster import logger
+from filecluster.configuration import default_settings
+from filecluster.library_filter import iter_library_files
+
+DHASH_SIZE = 8
+
+
+def dhash(path: str | Path, hash_size: int = DHASH_SIZE) -> int | None:
+    """Compute the difference hash of an image.
+
+    Returns:
+        hash_size * hash_size bit integer or None if the image can't be decoded.
+    """
+    try:
+        with Image.open(path) as img:
+            # JPEG only: let the decoder do the downscaling (no-op otherwise)
+            img.draft("L", (hash_size * 8, hash_size * 8))
+            small = img.convert("L").resize(
+                (hash_size + 1, hash_size), Image.Resampling.BILINEAR
+            )
+            pixels = small.tobytes()
+    except (OSError, UnidentifiedImageError, ValueError):
+        return None
+
+    bits = 0
+    width = hash_size + 1
+    for row in range(hash_size):
+        offset = row * width
+        for col in range(hash_size):
+            left, right = pixels[offset + col], pixels[offset + col + 1]
+            bits = (bits << 1) | (left > right)
+    return bits
+
+
+def hamming_distance(a: int, b: int) -> int:
+    """Number of differing bits of two hashes."""
+    return (a ^ b).bit_count()
+
+
+class BKTree:
+    """Burkhard-Keller tree over integer hashes with Hamming distance metric.
+
+    Each node is a list [hash, items, children] where children maps the distance
+    to the child node hash.
+    """
+
+    def __init__(self):
+        self.root: list | None = None
+        self.n_items = 0
+
+    def __len__(self) -> int:
+        return self.n_items
+
+    def add(self, hash_value: int, item: Hashable) -> None:
+        """Add an item with a given hash (items with equal hash share a node)."""
+        self.n_items += 1
+        if self.root is None:
+            self.root = [hash_value, [item], {}]
+            return
+        node = self.root
+        while True:
+            dist = hamming_distance(hash_value, node[0])
+            if dist == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(dist)
+            if child is None:
+                node[2][dist] = [hash_value, [item], {}]
+                return
+            node = child
+
+    def query(self, hash_value: int, radius: int) -> list[tuple[Hashable, int]]:
+        """Find items with hash within *radius* bits, sorted by distance."""
+        found = []
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node = stack.pop()
+            dist = hamming_distance(hash_value, node[0])
+            if dist <= radius:
+                found.extend((item, dist) for item in node[1])
+            # triangle inequality: only children in [dist - r, dist + r] can match
+            for child_dist, child in node[2].items():
+                if dist - radius <= child_dist <= dist + radius:
+                    stack.append(child)
+        return sorted(found, key=lambda x: x[1])
+
+
+def _read_hash_cache(cache_path: Path) -> dict[str, tuple[int, int, int]]:
+    cache = {}
+    try:
+        with open(cache_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    rel, size, mtime, hash_hex = line.rstrip("\n").split("\t")
+                    cache[rel] = (int(size), int(mtime), int(hash_hex, 16))
+                except ValueError:
+                    continue
+    except OSError:
+        pass
+    return cache
+
+
+def iter_library_image_hashes(
+    library_path: str | Path,
+) -> Iterator[tuple[Path, int]]:
+    """Yield (path, dhash) for every image in the library, using the hash cache.
+
+    The cache in the library root is rewritten with the current state.
+    """
+    library_path = Path(library_path)
+    cache_path = library_path / default_settings.library_phash_filename
+    cache = _read_hash_cache(cache_path)
+    image_ext = tuple(default_settings.image_extensions)
+
+    fresh = {}
+    n_computed = 0
+    for path in iter_library_files(library_path):
+        if not path.name.lower().endswith(image_ext):
+            continue
+        try:
+            st = path.stat()
+        except OSError:
+            continue
+        rel = path.relative_to(library_path).as_posix()
+        cached = cache.get(rel)
+        if cached is not None and cached[:2] == (st.st_size, st.st_mtime_ns):
+            hash_value = cached[2]
+        else:
+            hash_value = dhash(path)
+            n_computed += 1
+            if hash_value is None:
+                continue
+        fresh[rel] = (st.st_size, st.st_mtime_ns, hash_value)
+        yield path, hash_value
+
+    if n_computed or len(fresh) != len(cache):
+        logger.debug(f"Computed {n_computed} perceptual hashes in {library_path}")
+        try:
+            tmp_path = cache_path.with_name(cache_path.name + ".tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for rel, (size, mtime, hash_value) in fresh.items():
+                    f.write(f"{rel}\t{size}\t{mtime}\t{hash_value:x}\n")
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            logger.warning(f"Cannot save perceptual hash cache: {e}")
+
+
+def build_library_index(library_paths: list[str] | list[Path]) -> BKTree:
+    """Build the BK-tree over perceptual hashes of all images in the libraries."""
+    tree = BKTree()
+    for lib in library_paths:
+        for path, hash_value in iter_library_image_hashes(lib):
+            tree.add(hash_value, path)
+    logger.info(f"Perceptual index contains {len(tree)} library images")
+    return tree
@@ -0,0 +1,210 @@
+"""Estimation of the cost of a file operation plan.
+
+For each destination device the plan is summarized as:
+- the data written to the device (copies, moves from other devices),
+- the data only renamed or linked within the device (no data written),
+- the free space of the device,
+- the expected duration, from a quick write throughput probe of the device.
+
+The dry run reports the estimate, the execution is refused up front when a
+destination device doesn't have enough free space - instead of failing in the
+middle of a long copy.
+"""
+
+from __future__ import annotations
+
+import os
+import shutil
+import tempfile
+import time
+from collections.abc import Iterable
+from dataclasses import dataclass
+from datetime import timedelta
+from pathlib import Path
+
+from filecluster import logger
+from filecluster.configuration import CopyMethod, default_settings
+from filecluster.exceptions import InsufficientDiskSpaceError
+from filecluster.file_operations import CopyOp, FileOperationPlan, MoveOp
+from filecluster.utlis import get_device_id
+
+MIB = 2**20
+
+
+@dataclass
+class DeviceCost:
+    """Estimated cost of the plan on a destination device.
+
+    Attributes:
+        path: existing folder on the device (free space is measured there)
+        n_files: number of files copied or moved to the device
+        bytes_written: data written to the device
+        bytes_renamed: data moved or linked within the device (metadata only)
+        free_bytes: free space on the device
+        throughput: measured write throughput (bytes/s), None if not probed
+    """
+
+    path: Path
+    n_files: int = 0
+    bytes_written: int = 0
+    bytes_renamed: int = 0
+    free_bytes: int = 0
+    throughput: float | None = None
+
+    @property
+    def required_bytes(self) -> int:
+        """Free space needed, including the reserve left on the device."""
+        if not self.bytes_written:
+            return 0
+        return self.bytes_written + default_settings.free_space_reserve
+
+    @property
+    def has_space(self) -> bool:
+        return self.required_bytes <= self.free_bytes
+
+    @property
+    def seconds(self) -> float | None:
+        """Expected duration of the writes."""
+        if self.throughput is None:
+            return None
+        return self.bytes_written / self.throughput
+
+
+def _existing_dir(path: Path) -> Path:
+    """Closest existing folder of the path (the destination may not exist yet)."""
+    path = Path(path).absolute()
+    for candidate in (path, *path.parents):
+        if candidate.is_dir():
+            return candidate
+    raise FileNotFoundError(path)
+
+
+def _source_size(op: CopyOp | MoveOp) -> int:
+    if op.src_size is not None:
+        return op.src_size
+    try:
+        return op.src.stat().st_size
+    except OSError:
+        # skipped by the executor anyway
+        return 0
+
+
+def probe_write_throughput(directory: Path, size: int | None = None) -> float | None:
+    """Measure the write throughput of the device holding the directory.
+
+    A temporary file of *size* bytes is written, synced to the disk and removed.
+
+    Args:
+        directory: existing folder on the device
+        size: amount of data to write (default from settings)
+
+    Returns:
+        Throughput in bytes/s, None if the folder is not writable.
+    """
+    if size is None:
+        size = default_settings.throughput_probe_size
+    # random data, so a compressing filesystem doesn't report inflated speed
+    chunk = os.urandom(min(size, MIB))
+    try:
+        with tempfile.NamedTemporaryFile(
+            dir=directory, prefix=".filecluster-probe-", buffering=0
+        ) as f:
+            start = time.perf_counter()
+            written = 0
+            while written < size:
+                written += f.write(chunk[: size - written])
+            os.fsync(f.fileno())
+            elapsed = time.perf_counter() - start
+    except OSError as e:
+        logger.debug(f"Cannot probe write throughput in {directory}: {e}")
+        return None
+    return written / elapsed if elapsed > 0 else None
+
+
+def estimate_plan_cost(
+    plan: FileOperationPlan,
+    copy_method: CopyMethod = CopyMethod.COPY,
+    done: set[int] | None = None,
+    probe: bool = False,
+) -> list[DeviceCost]:
+    """Estimate the data written to each destination device by the plan.
+
+    Moves and hard links within a device are metadata-only operations (see
+    execute_plan), they don't need free space. Reflinks are counted as copies,
+    as they fall back to copying on filesystems that don't support them.
+
+    Args:
+        plan: operations to estimate
+        copy_method: how CopyOps are performed
+        done: indices of operations already executed (not counted)
+        probe: measure the write throughput of the devices (writes a small
+            temporary file to each of them)
+
+    Returns:
+        Costs of the destination devices.
+    """
+    done = done or set()
+    devices: dict[Path, int] = {}
+
+    def device_of(directory: Path) -> int:
+        if directory not in devices:
+            devices[directory] = get_device_id(directory)
+        return devices[directory]
+
+    costs: dict[int, DeviceCost] = {}
+    for i, op in enumerate(plan.ops):
+        if not isinstance(op, CopyOp | MoveOp) or i in done:
+            continue
+        device = device_of(op.dst.parent)
+        cost = costs.get(device)
+        if cost is None:
+            cost = costs[device] = DeviceCost(path=_existing_dir(op.dst.parent))
+        cost.n_files += 1
+        size = _source_size(op)
+        metadata_only = isinstance(op, MoveOp) or copy_method == CopyMethod.HARDLINK
+        if metadata_only and device_of(op.src.parent) == device:
+            cost.bytes_renamed += size
+        else:
+            cost.bytes_written += size
+
+    for cost in costs.values():
+        cost.free_bytes = shutil.disk_usage(cost.path).free
+        if probe and cost.bytes_written:
+            cost.throughput = probe_write_throughput(cost.path)
+    return list(costs.values())
+
+
+def check_free_space(costs: Iterable[DeviceCost]) -> None:
+    """Refuse the execution when a destination device lacks free space.
+
+    Raises:
+        InsufficientDiskSpaceError: for the first device without enough space
+    """
+    for cost in costs:
+        if not cost.has_space:
+            raise InsufficientDiskSpaceError(
+                cost.path, cost.required_bytes, cost.free_bytes
+            )
+
+
+def format_plan_cost(costs: list[DeviceCost]) -> str:
+    """Describe the estimate, one line per device."""
+    lines = ["Estimated cost of the file operations:"]
+    for cost in costs:
+        if cost.seconds is None:
+            duration = "unknown duration"
+        else:
+            speed = f"{cost.throughput / MIB:.0f} MiB/s"
+            duration = f"~{timedelta(seconds=round(cost.seconds))} at {speed}"
+        lines.append(
+            f"  {cost.path}: {cost.n_files} files, "
+            f"{cost.bytes_written / MIB:.1f} MiB to write, "
+            f"{cost.bytes_renamed / MIB:.1f} MiB renamed/linked, "
+            f"{cost.free_bytes / MIB:.1f} MiB free, {duration}"
+            + ("" if cost.has_space else " - NOT ENOUGH SPACE")
+        )
+    # the devices are written in parallel
+    known = [c.seconds for c in costs if c.seconds is not None]
+    if known:
+        lines.append(f"  Expected duration: ~{timedelta(seconds=round(max(known)))}")
+    return "\n".join(lines)
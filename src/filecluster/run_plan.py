@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""Execute a plan saved with `file_cluster.py --save-plan`.
+
+The expensive analysis (reading the inbox, scanning the libraries) can run on
+one machine and the plan can be executed later, e.g. on the NAS host, without
+reading any media again. Operations whose source was removed or changed, or
+whose destination was taken since planning, are skipped.
+
+The execution is journaled next to the plan file - running the command again
+resumes an interrupted execution.
+
+Usage:
+./run_plan.py -p plan.jsonl
+./run_plan.py -p plan.jsonl --bwlimit 20 --background
+
+    -p plan file saved with file_cluster.py --save-plan
+    --bwlimit max MiB per second written to each destination disk
+    --background lowered CPU and I/O priority
+"""
+
+import argparse
+from pathlib import Path
+
+from filecluster import logger
+from filecluster.configuration import CopyMethod, default_settings
+from filecluster.file_operations import (
+    FileOperationPlan,
+    execute_plan,
+    load_plan,
+    validate_plan,
+)
+from filecluster.journal import PlanJournal
+from filecluster.plan_cost import check_free_space, estimate_plan_cost
+from filecluster.throttle import set_background_priority
+
+
+def run_saved_plan(
+    plan_path: str | Path,
+    jobs_per_device: int = default_settings.copy_jobs_per_device,
+    copy_method: CopyMethod = default_settings.copy_method,
+    verify: bool = default_settings.verify_copies,
+    bandwidth_limit: float = default_settings.io_bandwidth_limit,
+    ops_limit: float = default_settings.io_ops_limit,
+) -> FileOperationPlan:
+    """Validate and execute the saved plan, resuming an interrupted execution.
+
+    Args:
+        plan_path: plan file
+        jobs_per_device: number of concurrent file operations per destination
+            device
+        copy_method: how CopyOps are performed
+        verify: compare copied data with the hash recorded in the plan
+        bandwidth_limit: max bytes per second written to each destination
+            device (0 - unlimited)
+        ops_limit: max file operations per second on each destination device
+            (0 - unlimited)
+
+    Returns:
+        Executed plan (operations that couldn't be executed replaced by SkipOps)
+
+    Raises:
+        InsufficientDiskSpaceError: a destination device lacks free space for
+            the remaining operations (nothing is executed)
+    """
+    journal_path = Path(f"{plan_path}.journal")
+    if journal_path.exists():
+        # the plan in the journal is already validated
+        journal = PlanJournal.load(journal_path)
+        logger.info(f"Resuming: {len(journal.done)} operations already completed")
+    else:
+        plan = validate_plan(load_plan(plan_path))
+        journal = PlanJournal.create(journal_path, plan)
+    logger.info(journal.plan.summary())
+    check_free_space(estimate_plan_cost(journal.plan, copy_method, journal.finished))
+    with journal:
+        execute_plan(
+            journal.plan,
+            jobs_per_device=jobs_per_device,
+            copy_method=copy_method,
+            journal=journal,
+            verify=verify,
+            bandwidth_limit=bandwidth_limit,
+            ops_limit=ops_limit,
+        )
+    # copies that failed verification are reported by execute_plan
+    journal.remove()
+    return journal.plan
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Execute a plan saved with file_cluster.py --save-plan."
+    )
+    parser.add_argument(
+        "-p", "--plan", help="plan file (.jsonl)", type=str, required=True
+    )
+    parser.add_argument(
+        "--copy-jobs",
+        help="number of concurrent copy/move operations per destination disk",
+        type=int,
+        default=default_settings.copy_jobs_per_device,
+    )
+    link_group = parser.add_mutually_exclusive_group()
+    link_group.add_argument(
+        "--link",
+        help="hard link instead of copying files within a filesystem",
+        action="store_const",
+        const=CopyMethod.HARDLINK,
+        dest="copy_method",
+    )
+    link_group.add_argument(
+        "--reflink",
+        help="clone (copy-on-write) instead of copying files within a filesystem",
+        action="store_const",
+        const=CopyMethod.REFLINK,
+        dest="copy_method",
+    )
+    parser.add_argument(
+        "--verify",
+        help="compare copied data with the hash of the source recorded in the plan",
+        action="store_true",
+        default=default_settings.verify_copies,
+    )
+    parser.add_argument(
+        "--bwlimit",
+        help="max MiB per second written to each destination disk",
+        type=float,
+        default=default_settings.io_bandwidth_limit / 2**20,
+    )
+    parser.add_argument(
+        "--ops-limit",
+        help="max file operations per second on each destination disk",
+        type=float,
+        default=default_settings.io_ops_limit,
+    )
+    parser.add_argument(
+        "--background",
+        help="run with lowered CPU and I/O priority",
+        action="store_true",
+        default=default_settings.background_mode,
+    )
+    args = parser.parse_args()
+
+    if args.background:
+        set_background_priority()
+    run_saved_plan(
+        args.plan,
+        jobs_per_device=args.copy_jobs,
+        copy_method=args.copy_method or default_settings.copy_method,
+        verify=args.verify,
+        bandwidth_limit=args.bwlimit * 2**20,
+        ops_limit=args.ops_limit,
+    )
+    logger.info(
+        "Plan executed. Cluster info of the destination folders is updated by "
+        "the next library scan with --force-deep-scan"
+    )
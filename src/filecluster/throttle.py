@@ -0,0 +1,131 @@
+"""Limiting the load of the plan execution on the disks.
+
+A long import into a shared disk (e.g. the family NAS) shouldn't starve the
+other services using it. The executor can limit, per destination device:
+- the bandwidth of the copied data (bytes per second),
+- the rate of the file operations (copies, moves, links per second).
+
+Both limits are token buckets shared by the threads writing to the device.
+
+The background mode lowers the CPU (nice) and I/O (ioprio, Linux) priority of
+the process, the disks then serve the other processes first. The I/O priority
+is respected by the BFQ and CFQ schedulers only.
+"""
+
+from __future__ import annotations
+
+import ctypes
+import os
+import platform
+import sys
+import threading
+import time
+
+from filecluster import logger
+from filecluster.configuration import default_settings
+
+# ioprio_set syscall numbers (asm/unistd.h)
+IOPRIO_SET_SYSCALLS = {
+    "x86_64": 251,
+    "aarch64": 30,
+    "armv7l": 314,
+    "armv6l": 314,
+    "i686": 289,
+}
+IOPRIO_WHO_PROCESS = 1
+IOPRIO_CLASS_BE = 2
+IOPRIO_CLASS_SHIFT = 13
+# lowest priority of the best-effort class (the idle class could stall the
+# import indefinitely on a busy disk)
+IOPRIO_BE_LOWEST = 7
+
+
+class TokenBucket:
+    """Rate limiter shared by threads.
+
+    The bucket is refilled with *rate* tokens per second, up to *burst* tokens.
+    Tokens are taken right away and the caller waits until the bucket is out of
+    debt, so requests bigger than the burst are allowed, they just wait longer.
+    """
+
+    def __init__(self, rate: float, burst: float | None = None):
+        if rate <= 0:
+            raise ValueError(f"Rate must be positive, got {rate}")
+        self.rate = rate
+        self.burst = rate if burst is None else burst
+        self._tokens = self.burst
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self, amount: float) -> float:
+        """Take the tokens, wait while the bucket is in debt.
+
+        Returns:
+            Time waited in seconds.
+        """
+        with self._lock:
+            now = time.monotonic()
+            refill = (now - self._last) * self.rate
+            self._tokens = min(self.burst, self._tokens + refill) - amount
+            self._last = now
+            delay = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if delay:
+            time.sleep(delay)
+        return delay
+
+
+class DeviceThrottle:
+    """Limits of the data and operation rates of a device.
+
+    Args:
+        bytes_per_second: bandwidth limit, 0 - unlimited
+        ops_per_second: file operations limit, 0 - unlimited
+    """
+
+    def __init__(self, bytes_per_second: float = 0, ops_per_second: float = 0):
+        self._bandwidth = TokenBucket(bytes_per_second) if bytes_per_second else None
+        self._ops = (
+            TokenBucket(ops_per_second, burst=max(1.0, ops_per_second))
+            if ops_per_second
+            else None
+        )
+
+    def operation(self) -> None:
+        """Wait for a slot of a file operation."""
+        if self._ops is not None:
+            self._ops.consume(1)
+
+    def transfer(self, n_bytes: int) -> None:
+        """Account transferred data, wait if the bandwidth is exceeded."""
+        if self._bandwidth is not None:
+            self._bandwidth.consume(n_bytes)
+
+
+def _set_lowest_io_priority() -> bool:
+    nr = IOPRIO_SET_SYSCALLS.get(platform.machine())
+    if not sys.platform.startswith("linux") or nr is None:
+        return False
+    libc = ctypes.CDLL(None, use_errno=True)
+    ioprio = (IOPRIO_CLASS_BE << IOPRIO_CLASS_SHIFT) | IOPRIO_BE_LOWEST
+    # who=0: the calling thread, inherited by threads and processes started later
+    if libc.syscall(nr, IOPRIO_WHO_PROCESS, 0, ioprio) != 0:
+        logger.debug(f"ioprio_set failed: {os.strerror(ctypes.get_errno())}")
+        return False
+    return True
+
+
+def set_background_priority(niceness: int | None = None) -> None:
+    """Lower the CPU and I/O priority of the process.
+
+    Call it before the worker threads and processes are started, they inherit
+    the priorities.
+
+    Args:
+        niceness: increment of the nice value (default from settings)
+    """
+    if niceness is None:
+        niceness = default_settings.background_niceness
+    if hasattr(os, "nice"):
+        os.nice(niceness)
+    io_priority = "lowest" if _set_lowest_io_priority() else "unchanged"
+    logger.info(f"Background mode: niceness +{niceness}, I/O priority {io_priority}")
@@ -7,31 +7,59 @@ by reading or creating .cluster.ini files.
 Usage:
 ./update_clusters.py -f -l tests/zdjecia
 
-    -f force recalculation of cluster info ini files
+    -f recalculate cluster info of folders changed since the ini was saved
+    -r only regenerate ini files that can't be read
     -l path to a library
+
+Each .cluster.ini keeps a cheap fingerprint of the folder contents (names,
+sizes and mtimes of the files). With force_deep_scan only folders whose
+fingerprint no longer matches are scanned again (EXIF read of every file).
+
+Ini files are written atomically (temporary file, fsync, rename), so an
+interrupted run never leaves a truncated ini. Ini files that can't be read
+anyway are regenerated by scanning only their folders.
 """
 # TODO: KS: 2020-12-28: Consider changing data format from ini to yaml
 
 import argparse
-import multiprocessing
+import configparser
+import hashlib
 import os
 import re
+import sqlite3
+from collections.abc import Callable, Iterator
+from concurrent.futures import Future, ThreadPoolExecutor
 from configparser import ConfigParser
 from datetime import datetime
-from multiprocessing.pool import Pool
+from functools import partial
+from multiprocessing.pool import AsyncResult, Pool
 from pathlib import Path
 
+import numpy as np
 import pandas as pd
 
 from filecluster import logger
-
-# from filecluster.configuration import ini_filename
-from filecluster.configuration import FileClusterSettings
+from filecluster.catalog import LibraryCatalog, open_library_catalog
+from filecluster.filecluster_types import ClusterRow
 from filecluster.image_reader import (
     configure_inbox_reader,
     get_media_df,
     get_media_stats,
+    get_timestamps_stats,
 )
+from filecluster.utlis import is_supported_filetype
+from filecluster.workers import create_worker_pool, get_worker_settings
+
+FINGERPRINT_SECTION = "Fingerprint"
+# fingerprint items compared to decide if the folder changed, dir_mtime is only
+# recorded - saving the ini file itself changes the mtime of the folder
+FINGERPRINT_KEYS = ("file_count", "total_bytes", "digest")
+# errors of reading a truncated or otherwise damaged ini file
+CORRUPT_INI_ERRORS = (configparser.Error, KeyError, ValueError, TypeError)
+# suffix of the temporary file an ini file is written to before the rename
+TMP_SUFFIX = ".tmp"
+# folder types that are expected to contain media files
+MEDIA_FOLDER_TYPES = ("event", "sel", "sub_event")
 
 
 def str_to_bool(s: str) -> bool:
@@ -45,7 +73,11 @@ def str_to_bool(s: str) -> bool:
 
 
 def get_or_create_library_cluster_ini_as_dataframe(
-    library_path: str | Path, pool: Pool, force_deep_scan: bool = False
+    library_path: str | Path,
+    pool: Pool,
+    force_deep_scan: bool = False,
+    use_catalog: bool = True,
+    non_compliant: list[str] | None = None,
 ) -> tuple[pd.DataFrame, list[Path]]:
     """Scan the folder for cluster info and return the dataframe with clusters.
 
@@ -53,6 +85,10 @@ def get_or_create_library_cluster_ini_as_dataframe(
         library_path:
         force_deep_scan:
         pool:
+        use_catalog: take the info of folders with unchanged ini files from the
+            library catalog instead of reading every ini file
+        non_compliant: if given, non-compliant folders found by the walk of the
+            library are appended (see is_non_compliant)
 
     Returns:
         Tuple of:
@@ -63,27 +99,25 @@ def get_or_create_library_cluster_ini_as_dataframe(
     library_path = str(library_path).rstrip("/").rstrip("\\")
     logger.info(f"Scanning ini files in {library_path}")
 
-    subfolders = fast_scandir(library_path)
-
-    # remove the library path part from the library subfolders paths
-    subfolders_root = [s.replace(f"{library_path}/", "") for s in subfolders]
-
-    subs_labeled = identify_folder_types(subfolders_root)
-
-    # TODO: support more types of events dirs
-    # is_event or is_year_folder
-    event_dirs = list(filter(is_event, subs_labeled))
-
-    # Prepare arguments for parallel processing
-    pool_args = [(event_dir, force_deep_scan, library_path) for event_dir in event_dirs]
-
-    # Execute in parallel
-    res_list = pool.starmap(get_this_ini, pool_args)
+    catalog = open_library_catalog(library_path) if use_catalog else None
+    event_dirs, rows, res_empty_dir_list = _scan_event_dirs(
+        library_path,
+        pool,
+        force_deep_scan,
+        catalog if not force_deep_scan else None,
+        non_compliant,
+    )
 
-    res_dict_list = [d for d in res_list if isinstance(d, dict)]
-    res_empty_dir_list = [d for d in res_list if isinstance(d, Path)]
+    if catalog is not None:
+        try:
+            catalog.update(rows, event_dirs)
+        except sqlite3.Error as e:
+            logger.warning(f"Cannot update library catalog: {e}")
+        finally:
+            catalog.close()
 
-    df = pd.DataFrame(res_dict_list)
+    # results come in completion order, sort them for a deterministic output
+    df = pd.DataFrame(sorted(rows, key=lambda r: str(r.path)))
 
     df["target_path"] = None
     df["new_file_count"] = None
@@ -99,56 +133,203 @@ def get_or_create_library_cluster_ini_as_dataframe(
     return df, res_empty_dir_list
 
 
+def is_non_compliant(folder_type: str, n_subfolders: int, n_media: int) -> bool:
+    """Check if a folder expected to contain media has only subfolders."""
+    return bool(n_subfolders) and not n_media and folder_type in MEDIA_FOLDER_TYPES
+
+
+def iter_event_dirs(
+    library_path: str, non_compliant: list[str] | None = None
+) -> Iterator[tuple[str, str]]:
+    """Yield labeled event folders (relative to the library) as they are found.
+
+    Args:
+        library_path: path to the library
+        non_compliant: if given, non-compliant folders of the library are
+            appended (checked from the same walk, no folder is listed twice)
+    """
+    settings = get_worker_settings()
+    media_ext = [*settings.image_extensions, *settings.video_extensions]
+
+    def check_compliance(folder: str, subfolders: list, file_names: list) -> None:
+        if non_compliant is None or folder == library_path or not subfolders:
+            return
+        rel_path = folder.replace(f"{library_path}/", "")
+        folder_type = identify_folder_types([rel_path])[0][1]
+        n_media = sum(is_supported_filetype(name, media_ext) for name in file_names)
+        if is_non_compliant(folder_type, len(subfolders), n_media):
+            non_compliant.append(folder)
+
+    for subfolder in iter_subfolders(library_path, check_compliance):
+        rel_path = subfolder.replace(f"{library_path}/", "")
+        labeled = identify_folder_types([rel_path])[0]
+        # TODO: support more types of events dirs
+        # is_event or is_year_folder
+        if is_event(labeled):
+            yield labeled
+
+
+def _scan_event_dirs(
+    library_path: str,
+    pool: Pool,
+    force_deep_scan: bool,
+    catalog: LibraryCatalog | None,
+    non_compliant: list[str] | None = None,
+) -> tuple[list[str], list[ClusterRow], list[Path]]:
+    """Get cluster info of all event folders of the library.
+
+    Each folder goes to the next stage only if the previous one can't provide
+    its cluster info:
+    - the library catalog (folders with unchanged ini files),
+    - a thread pool reading the ini files (I/O only),
+    - the process pool scanning the media files (CPU-heavy EXIF reading).
+    Folders are scheduled while the library is being walked.
+
+    Returns:
+        Tuple of:
+            - names of all event folders (relative to the library)
+            - cluster rows, in completion order
+            - empty folders
+    """
+    event_dirs: list[str] = []
+    rows: list[ClusterRow] = []
+    scans: list[AsyncResult] = []
+
+    def on_ini_read(pth: Path, future: Future) -> None:
+        if future.exception() is not None:
+            logger.warning(f"Cannot read ini file in {pth}: {future.exception()}")
+            row = None
+        else:
+            row = future.result()
+        if row is None:
+            scans.append(pool.apply_async(scan_cluster_folder, (pth,)))
+        else:
+            rows.append(row)
+
+    n_cached = 0
+    with ThreadPoolExecutor() as threads:
+        for event_dir, _ in iter_event_dirs(library_path, non_compliant):
+            event_dirs.append(event_dir)
+            if catalog is not None and (row := catalog.get_unchanged(event_dir)):
+                rows.append(row)
+                n_cached += 1
+                continue
+            pth = Path(library_path) / event_dir
+            future = threads.submit(read_cluster_row, pth, force_deep_scan)
+            future.add_done_callback(partial(on_ini_read, pth))
+    # all ini files are read, so all the scans are already scheduled
+    results = [scan.get() for scan in scans]
+    logger.debug(
+        f"{n_cached} clusters taken from the catalog, "
+        f"{len(event_dirs) - n_cached - len(scans)} from ini files, "
+        f"{len(scans)} folders scanned"
+    )
+
+    rows.extend(r for r in results if isinstance(r, ClusterRow))
+    empty_dirs = sorted(r for r in results if isinstance(r, Path))
+    return event_dirs, rows, empty_dirs
+
+
+def read_cluster_row(pth: Path, force_deep_scan: bool = False) -> ClusterRow | None:
+    """Get cluster info from the .cluster.ini file of the folder (I/O only).
+
+    Returns:
+        Cluster info or None if the folder has to be scanned: no ini file or,
+        with force_deep_scan, the folder changed since the ini was saved.
+    """
+    settings = get_worker_settings()
+    if not os.path.isfile(Path(pth) / settings.ini_filename):
+        return None
+    if force_deep_scan and not is_cluster_ini_fresh(pth):
+        return None
+    try:
+        if cluster_ini_r := read_cluster_ini_as_dict(pth):
+            return ClusterRow(**dict_from_ini_range_section(cluster_ini_r, pth))
+    except CORRUPT_INI_ERRORS as e:
+        logger.warning(f"Corrupt ini file in {pth} ({e!r}), it will be regenerated")
+    return None
+
+
+def is_cluster_ini_corrupt(pth: Path) -> bool:
+    """Check if the folder has a .cluster.ini file that can't be read."""
+    settings = get_worker_settings()
+    if not os.path.isfile(Path(pth) / settings.ini_filename):
+        return False
+    return read_cluster_row(pth) is None
+
+
+def repair_library_cluster_inis(library_path: str | Path, pool: Pool) -> list[Path]:
+    """Regenerate only the corrupt .cluster.ini files of the library.
+
+    Leftovers of interrupted writes (temporary ini files) are removed.
+
+    Returns:
+        Folders with regenerated cluster info.
+    """
+    library_path = str(library_path).rstrip("/").rstrip("\\")
+    settings = get_worker_settings()
+    folders = [Path(library_path) / d for d, _ in iter_event_dirs(library_path)]
+    with ThreadPoolExecutor() as threads:
+        is_corrupt = list(threads.map(is_cluster_ini_corrupt, folders))
+    corrupt = [f for f, c in zip(folders, is_corrupt, strict=True) if c]
+
+    for folder in folders:
+        tmp_path = folder / (settings.ini_filename + TMP_SUFFIX)
+        if tmp_path.exists():
+            logger.debug(f"Removing {tmp_path}")
+            tmp_path.unlink()
+
+    pool.map(scan_cluster_folder, corrupt)
+    logger.info(f"Regenerated {len(corrupt)} corrupt ini files in {library_path}")
+    return corrupt
+
+
+def scan_cluster_folder(pth: Path) -> ClusterRow | Path | None:
+    """Read media of the folder and save its cluster info (CPU-heavy).
+
+    Returns
+        a single object that can be:
+        Cluster info - if the directory contains media files.
+        Path object of the cluster - if the directory is empty
+        None - if is not empty but no media files directly in that path.
+    """
+    conf = configure_inbox_reader(in_dir_name=pth)
+    if not os.listdir(pth):
+        logger.debug(f" - directory {pth} is empty.")
+        return pth
+    media_df = get_media_df(conf.in_dir_name)
+    if media_df is None:
+        return None
+
+    time_granularity = int(conf.time_granularity.total_seconds())
+    media_stats = get_media_stats(media_df, time_granularity)
+    cluster_ini = initialize_cluster_info_dict(
+        start=media_stats["date_min"],
+        stop=media_stats["date_max"],
+        is_continuous=media_stats["is_time_consistent"],
+        median=media_stats["date_median"],
+        file_count=media_stats["file_count"],
+    )
+    save_cluster_ini(cluster_ini, pth)
+    # read back, so the values are the same as read from the ini next time
+    return ClusterRow(**dict_from_ini_range_section(read_cluster_ini_as_dict(pth), pth))
+
+
 def get_this_ini(
-    event_dir: str, force_deep_scan: bool, library_path
-) -> dict | Path | None:
+    event_dir: tuple[str, str], force_deep_scan: bool, library_path
+) -> ClusterRow | Path | None:
     """Get stats of event_dir that are subdir of a library.
 
     Returns
         a single object that can be:
-        Dictionary with characterization of the cluster - if the directory is
-            not empty and as media files.
+        Cluster info - if the directory is not empty and has media files.
         Path object of the cluster - if the directory is empty
         None - if is not empty but no media files directly in that path.
     """
-    event_dir_name = event_dir[0]
-    pth = Path(library_path) / event_dir_name
-    settings = FileClusterSettings()
-
-    is_ini = os.path.isfile(Path(pth) / settings.ini_filename)
-    is_empty = False
-    if force_deep_scan or not is_ini:
-        # calculate ini
-        conf = configure_inbox_reader(in_dir_name=pth)
-
-        f_name = conf.in_dir_name
-        if os.listdir(f_name):
-            media_df = get_media_df(conf.in_dir_name)
-        else:
-            logger.debug(f" - directory {f_name} is empty.")
-            media_df = None
-            is_empty = True
-
-        if media_df is not None:
-            time_granularity = int(conf.time_granularity.total_seconds())
-            media_stats = get_media_stats(media_df, time_granularity)
-            cluster_ini = initialize_cluster_info_dict(
-                start=media_stats["date_min"],
-                stop=media_stats["date_max"],
-                is_continuous=media_stats["is_time_consistent"],
-                median=media_stats["date_median"],
-                file_count=media_stats["file_count"],
-            )
-            save_cluster_ini(cluster_ini, pth)
-
-    if cluster_ini_r := read_cluster_ini_as_dict(pth):
-        # return dict with cluster characterization
-        ret = dict_from_ini_range_section(cluster_ini_r, pth)
-    elif is_empty:
-        ret = pth
-    else:
-        return None
-    return ret
+    pth = Path(library_path) / event_dir[0]
+    if (row := read_cluster_row(pth, force_deep_scan)) is not None:
+        return row
+    return scan_cluster_folder(pth)
 
 
 def dict_from_ini_range_section(cluster_ini_r, pth):
@@ -194,12 +375,126 @@ def initialize_cluster_info_dict(
     return cluster_ini
 
 
+def merge_cluster_info(
+    base: ClusterRow | None, dates: list, time_granularity: int
+) -> ConfigParser:
+    """Get cluster info of a cluster extended with media of given dates.
+
+    The info is computed from the stored cluster info and the dates of the
+    added media only, the media already in the cluster are not read:
+    - the merged median is estimated (stored median weighted by file count),
+    - a continuous cluster stays continuous if the added media outside its
+      range are not further apart than time_granularity, a discontinuous one
+      stays discontinuous.
+
+    Args:
+        base: stored info of the cluster, None for a new cluster
+        dates: dates of the added media
+        time_granularity: max allowed gap (in seconds) in a continuous cluster
+
+    Returns:
+        configparser object with the merged cluster info
+    """
+    all_dates = pd.to_datetime(pd.Series(dates, dtype="datetime64[ns]"))
+    if base is None:
+        timestamps_ns = all_dates.to_numpy(dtype="datetime64[ns]").view(np.int64)
+        stats = get_timestamps_stats(timestamps_ns, time_granularity)
+        return initialize_cluster_info_dict(
+            start=stats["date_min"],
+            stop=stats["date_max"],
+            is_continuous=stats["is_time_consistent"],
+            median=stats["date_median"],
+            file_count=stats["file_count"],
+        )
+
+    new_dates = all_dates.dropna().sort_values()
+
+    start = pd.Timestamp(base.start_date) if base.start_date else new_dates.min()
+    end = pd.Timestamp(base.end_date) if base.end_date else new_dates.max()
+    is_continuous = base.is_continuous and pd.notna(start) and pd.notna(end)
+    if is_continuous:
+        # media inside the range can only fill gaps, check the chains of media
+        # before and after the range
+        before = pd.concat([new_dates[new_dates < start], pd.Series([start])])
+        after = pd.concat([pd.Series([end]), new_dates[new_dates > end]])
+        gaps = pd.concat([before.diff(), after.diff()]).dropna().dt.total_seconds()
+        is_continuous = not any(gaps > time_granularity)
+    if len(new_dates):
+        start = min(start, new_dates.iloc[0])
+        end = max(end, new_dates.iloc[-1])
+
+    weighted = pd.concat(
+        [pd.Series([pd.Timestamp(base.median)] * base.file_count), new_dates]
+    )
+    return initialize_cluster_info_dict(
+        start=start,
+        stop=end,
+        is_continuous=bool(is_continuous),
+        median=weighted.median(),
+        file_count=base.file_count + len(dates),
+    )
+
+
+def compute_folder_fingerprint(path: str | Path) -> dict[str, str]:
+    """Get a cheap fingerprint of the files directly in the folder.
+
+    Only directory entries and file metadata are read, not the file contents.
+
+    Returns:
+        Dictionary with the directory mtime, number and total size of files and
+        a digest of (name, size, mtime) of every file (the ini file excluded).
+    """
+    settings = get_worker_settings()
+    entries = sorted(
+        (
+            e
+            for e in os.scandir(path)
+            if e.is_file() and not e.name.startswith(settings.ini_filename)
+        ),
+        key=lambda e: e.name,
+    )
+    digest = hashlib.sha1()
+    total_bytes = 0
+    for entry in entries:
+        st = entry.stat()
+        total_bytes += st.st_size
+        digest.update(f"{entry.name}\0{st.st_size}\0{st.st_mtime_ns}\n".encode())
+    return {
+        "dir_mtime": str(os.stat(path).st_mtime_ns),
+        "file_count": str(len(entries)),
+        "total_bytes": str(total_bytes),
+        "digest": digest.hexdigest(),
+    }
+
+
+def is_cluster_ini_fresh(path: str | Path) -> bool:
+    """Check if the folder did not change since its .cluster.ini was saved.
+
+    Returns:
+        False if there is no fingerprint in the ini file or it does not match
+        the current contents of the folder.
+    """
+    settings = get_worker_settings()
+    cluster_ini = ConfigParser()
+    try:
+        cluster_ini.read(Path(path) / settings.ini_filename)
+    except Exception:
+        return False
+    if not cluster_ini.has_section(FINGERPRINT_SECTION):
+        return False
+    stored = cluster_ini[FINGERPRINT_SECTION]
+    current = compute_folder_fingerprint(path)
+    return all(stored.get(key) == current[key] for key in FINGERPRINT_KEYS)
+
+
 def save_cluster_ini(
     cluster_ini: ConfigParser,
     path: str | Path,
 ) -> None:
     """Save cluster information dictionary.
 
+    The fingerprint of the folder is saved together with the cluster info.
+
     Args:
       cluster_ini:      cluster info object to be saved on disk
       path:             path, where an object has to be saved
@@ -207,11 +502,43 @@ def save_cluster_ini(
     Returns:
         None
     """
-    settings = (
-        FileClusterSettings()
-    )  # FIXME: KS: 2025-04-24: are these proper settings?
-    with open(Path(path) / settings.ini_filename, "w") as cluster_ini_file:
+    settings = get_worker_settings()
+    cluster_ini[FINGERPRINT_SECTION] = compute_folder_fingerprint(path)
+    ini_path = Path(path) / settings.ini_filename
+    tmp_path = ini_path.with_name(ini_path.name + TMP_SUFFIX)
+    # an interrupted write leaves the old ini (or none), never a truncated one
+    with open(tmp_path, "w") as cluster_ini_file:
         cluster_ini.write(cluster_ini_file)
+        cluster_ini_file.flush()
+        os.fsync(cluster_ini_file.fileno())
+    os.replace(tmp_path, ini_path)
+    fsync_dir(path)
+
+
+def save_cluster_inis(items: list[tuple[ConfigParser, Path]]) -> None:
+    """Save cluster info of many folders, in parallel threads.
+
+    Args:
+      items: tuples (cluster info object, folder where it has to be saved)
+    """
+    with ThreadPoolExecutor() as threads:
+        # list() re-raises the first error of the writes
+        list(threads.map(lambda item: save_cluster_ini(*item), items))
+
+
+def fsync_dir(path: str | Path) -> None:
+    """Flush the directory entries (e.g. after a rename) to the disk."""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        # e.g. directories can't be opened on Windows
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
 
 
 def read_cluster_ini_as_dict(
@@ -225,7 +552,7 @@ def read_cluster_ini_as_dict(
     Returns:
         dictionary with information from the cluster ini file.
     """
-    settings = FileClusterSettings()
+    settings = get_worker_settings()
     cluster_ini = ConfigParser()
     cluster_ini.read(Path(path) / settings.ini_filename)
 
@@ -257,6 +584,37 @@ def read_cluster_ini_as_dict(
     return cluster_dict
 
 
+def iter_subfolders(
+    dirname: str,
+    on_listed: Callable[[str, list[str], list[str]], None] | None = None,
+) -> Iterator[str]:
+    """Yield all folders under a given directory, walked without recursion.
+
+    Args:
+        dirname: directory names that have to be scanned for folders
+        on_listed: called with (folder, subfolder paths, file names) for every
+            listed folder, including dirname
+
+    Yields:
+        paths of the folders, each folder before its subfolders
+    """
+    stack = [dirname] if dirname else []
+    while stack:
+        folder = stack.pop()
+        subfolders, file_names = [], []
+        with os.scandir(folder) as entries:
+            for e in entries:
+                if e.is_dir():
+                    subfolders.append(e.path)
+                else:
+                    file_names.append(e.name)
+        subfolders.sort()
+        if on_listed is not None:
+            on_listed(folder, subfolders, file_names)
+        yield from subfolders
+        stack.extend(reversed(subfolders))
+
+
 def fast_scandir(dirname: str) -> list[str]:
     """Get a list of folders of a given directory.
 
@@ -266,13 +624,7 @@ def fast_scandir(dirname: str) -> list[str]:
     Returns:
         list of folders
     """
-    if dirname:
-        subfolders = [f.path for f in os.scandir(dirname) if f.is_dir()]
-        for dirname in list(subfolders):
-            subfolders.extend(fast_scandir(dirname))
-    else:
-        subfolders = []
-    return subfolders
+    return list(iter_subfolders(dirname))
 
 
 def identify_folder_types(subfolders_list: list[str]) -> list[tuple[str, str]]:
@@ -351,16 +703,19 @@ def is_sel_folder(folder: str) -> bool:
 def is_event_subcategory_folder(folder: str) -> bool:
     """Check if a given folder is an event subfolder folder.
 
+    Event subfolder is a direct subfolder of the event folder (e.g. a part of a
+    longer trip), other than the sel-folder.
+
     Args:
       folder: path to the folder that has to be examined.
 
     Returns:
         True if the folder is an event subfolder folder.
     """
-    # TODO: KS: 2020-12-23: add separator (for given system - / or \) after year
-    # is_year_in_the_path = bool(re.match(r"(19|20)\d{2}", folder))
-    # FIXME: Implement
-    return False
+    parts = Path(folder).parts
+    if len(parts) < 3 or is_sel_folder(folder):
+        return False
+    return is_event_folder(str(Path(*parts[:-1])))
 
 
 def validate_library_structure(library_dir):
@@ -373,14 +728,17 @@ def validate_library_structure(library_dir):
     - sel
     - out (?)
 
+    See library_validator for the full report with all the detected problems.
+
     Args:
-        library_dir:
+        library_dir: path to the library
     Returns:
         True if there is no unknown folder-type in the library.
     """
-    subfolders = fast_scandir(str(library_dir))
-    labels = identify_folder_types(subfolders)
-    return all(folder_type != "unknown" for _, folder_type in labels)
+    # imported here: library_validator depends on this module
+    from filecluster.library_validator import validate_library
+
+    return all(r.folder_type != "unknown" for r in validate_library(library_dir))
 
 
 def is_event(item: tuple[str, str]) -> bool:
@@ -413,7 +771,17 @@ if __name__ == "__main__":
     parser.add_argument(
         "-f",
         "--force-recalc",
-        help="recalculate cluster info even if .cluster.ini files exists",
+        help="recalculate cluster info of folders changed since their "
+        ".cluster.ini was saved",
+        action="store_true",
+        default=False,
+    )
+
+    parser.add_argument(
+        "-r",
+        "--repair",
+        help="only regenerate .cluster.ini files that can't be read "
+        "(e.g. truncated by an interrupted run)",
         action="store_true",
         default=False,
     )
@@ -421,11 +789,12 @@ if __name__ == "__main__":
     args = parser.parse_args()
     libs = args.library
 
-    n_cpu = multiprocessing.cpu_count()
-    logger.debug(f"Setting-up multiprocessing pool with {n_cpu} processes")
-    with multiprocessing.Pool(processes=n_cpu) as pool:
+    with create_worker_pool(get_worker_settings().worker_pool_size) as pool:
         logger.debug("Pool ready to use")
         for lib in libs:
+            if args.repair:
+                repair_library_cluster_inis(lib, pool)
+                continue
             _ = get_or_create_library_cluster_ini_as_dataframe(
                 library_path=lib, pool=pool, force_deep_scan=args.force_recalc
             )
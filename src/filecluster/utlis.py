@@ -20,6 +20,8 @@ from filecluster.exceptions import DateStringNoneError
 logging.getLogger("exifread").setLevel(logging.CRITICAL)
 
 BLOCK_SIZE_FOR_HASHING = 4096 * 32
+# only the head of the file is hashed in the cheap duplicate pre-check
+PARTIAL_HASH_SIZE = 1024 * 1024
 
 
 def is_supported_filetype(file_name: str, ext_list: list[str]) -> bool:
@@ -127,8 +129,35 @@ def hash_file(fname, hash_funct=hashlib.sha1):
     return hash_value.hexdigest()
 
 
+def partial_hash_file(fname, size: int = PARTIAL_HASH_SIZE) -> str | None:
+    """Hash only the first *size* bytes of the file (md5).
+
+    Cheap pre-check used before computing the full hash. Returns None when the
+    file cannot be read.
+    """
+    try:
+        with open(fname, "rb") as f:
+            return hashlib.md5(f.read(size)).hexdigest()
+    except OSError:
+        return None
+
+
 # def read_version():
 #     with open(ROOT_DIR / "pyproject.toml", "rb") as f:
 #         pyproject = tomllib.load(f)
 #
 #     return pyproject["project"]["version"]
+
+
+def get_device_id(path: str | Path) -> int:
+    """Get id of the device (disk) holding the path.
+
+    For a path that does not exist yet the closest existing parent is used.
+    """
+    path = Path(path).absolute()
+    for candidate in (path, *path.parents):
+        try:
+            return os.stat(candidate).st_dev
+        except OSError:
+            continue
+    raise FileNotFoundError(path)
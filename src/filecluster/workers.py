@@ -0,0 +1,49 @@
+"""Shared worker pool used by the pipeline stages.
+
+A single pool is created by the pipeline and passed to library scanning and
+inbox reading, so the worker processes (and their imports of pandas, pydantic
+etc.) are started once per run. The worker initializer loads the settings once
+per process, tasks get them with get_worker_settings().
+"""
+
+from __future__ import annotations
+
+import multiprocessing
+from multiprocessing.pool import Pool
+
+from filecluster import logger
+from filecluster.configuration import FileClusterSettings
+
+_worker_settings: FileClusterSettings | None = None
+
+
+def init_worker() -> None:
+    """Pool initializer: load the settings once per worker process."""
+    global _worker_settings
+    _worker_settings = FileClusterSettings()
+
+
+def get_worker_settings() -> FileClusterSettings:
+    """Get settings loaded by the worker initializer.
+
+    Settings are loaded on first use in processes started without the
+    initializer (e.g. the main process).
+    """
+    if _worker_settings is None:
+        init_worker()
+    assert _worker_settings is not None
+    return _worker_settings
+
+
+def create_worker_pool(processes: int = 0) -> Pool:
+    """Create the pool of worker processes.
+
+    Args:
+        processes: number of worker processes, 0 - number of CPUs
+
+    Returns:
+        Pool with the settings-loading initializer.
+    """
+    n_processes = processes if processes > 0 else multiprocessing.cpu_count()
+    logger.debug(f"Setting-up multiprocessing pool with {n_processes} processes")
+    return multiprocessing.Pool(processes=n_processes, initializer=init_worker)
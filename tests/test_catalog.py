@@ -0,0 +1,72 @@
+"""Tests for the library catalog of cluster info."""
+
+import multiprocessing
+
+import pytest
+
+from filecluster.catalog import LibraryCatalog
+from filecluster.configuration import default_settings
+from filecluster.update_clusters import (
+    get_or_create_library_cluster_ini_as_dataframe,
+    initialize_cluster_info_dict,
+    read_cluster_row,
+    save_cluster_ini,
+)
+
+EVENT = "2020/[2020_01_01]_event"
+
+
+def _save_ini(path, file_count):
+    ini = initialize_cluster_info_dict(
+        start="2020-01-01 12:00:00",
+        stop="2020-01-01 14:00:00",
+        is_continuous=True,
+        median="2020-01-01 13:00:00",
+        file_count=file_count,
+    )
+    save_cluster_ini(ini, path)
+
+
+@pytest.fixture
+def library(tmp_path):
+    event = tmp_path / EVENT
+    event.mkdir(parents=True)
+    (event / "a.jpg").write_bytes(b"abc")
+    _save_ini(event, file_count=1)
+    return tmp_path
+
+
+def _read_row(library):
+    return read_cluster_row(library / EVENT)
+
+
+class TestLibraryCatalog:
+    def test_unchanged_folder_is_taken_from_catalog(self, library):
+        row = _read_row(library)
+        with LibraryCatalog(library) as catalog:
+            catalog.update([row], [EVENT])
+            rows, to_read = catalog.split_unchanged([EVENT])
+        assert to_read == []
+        assert rows == [row]
+
+    def test_modified_ini_is_read_again(self, library):
+        with LibraryCatalog(library) as catalog:
+            catalog.update([_read_row(library)], [EVENT])
+            _save_ini(library / EVENT, file_count=12345)
+            rows, to_read = catalog.split_unchanged([EVENT])
+        assert rows == []
+        assert to_read == [EVENT]
+
+    def test_removed_folder_is_forgotten(self, library):
+        with LibraryCatalog(library) as catalog:
+            catalog.update([_read_row(library)], [EVENT])
+            catalog.update([], [])
+            assert catalog.conn.execute("SELECT * FROM clusters").fetchall() == []
+
+    def test_library_scan_uses_catalog(self, library):
+        with multiprocessing.Pool(processes=1) as pool:
+            first, _ = get_or_create_library_cluster_ini_as_dataframe(library, pool)
+            second, _ = get_or_create_library_cluster_ini_as_dataframe(library, pool)
+        assert (library / default_settings.library_catalog_filename).exists()
+        assert first.to_dict() == second.to_dict()
+        assert second.file_count.tolist() == [1]
@@ -142,6 +142,7 @@ class TestEnumValues:
         assert Status.NEW_CLUSTER.value == 1
         assert Status.EXISTING_CLUSTER.value == 2
         assert Status.DUPLICATE.value == 3
+        assert Status.INBOX_DUPLICATE.value == 4
 
     def test_assign_date_methods(self):
         assert AssignDateToClusterMethod.RANDOM != AssignDateToClusterMethod.MEDIAN
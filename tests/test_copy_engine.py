@@ -0,0 +1,154 @@
+"""Tests for the copy engine."""
+
+import errno
+import hashlib
+import os
+import shutil
+
+import pytest
+
+from filecluster import copy_engine
+from filecluster.copy_engine import copy_file, copy_file_verified
+
+
+@pytest.fixture()
+def src(tmp_path):
+    path = tmp_path / "video.mp4"
+    path.write_bytes(os.urandom(3 * 2**20 + 123))
+    os.utime(path, ns=(1_000_000_000, 2_000_000_000))
+    return path
+
+
+def _assert_copied(src, dst):
+    assert dst.read_bytes() == src.read_bytes()
+    assert dst.stat().st_mtime_ns == 2_000_000_000
+
+
+class TestCopyFile:
+    @pytest.mark.parametrize("drop_cache", [False, True])
+    def test_copy(self, src, tmp_path, drop_cache):
+        dst = tmp_path / "copy.mp4"
+        copy_file(src, dst, drop_cache=drop_cache)
+        _assert_copied(src, dst)
+
+    def test_overwrites_destination(self, src, tmp_path):
+        dst = tmp_path / "copy.mp4"
+        dst.write_bytes(b"x" * (5 * 2**20))
+        copy_file(src, dst)
+        _assert_copied(src, dst)
+
+    def test_buffered_copy(self, src, tmp_path, monkeypatch):
+        monkeypatch.delattr(os, "copy_file_range", raising=False)
+        monkeypatch.delattr(os, "sendfile", raising=False)
+        dst = tmp_path / "copy.mp4"
+        # not a multiple of the page size, rounded down
+        copy_file(src, dst, buffer_size=100_000)
+        _assert_copied(src, dst)
+
+    @pytest.mark.skipif(not hasattr(os, "sendfile"), reason="no sendfile")
+    @pytest.mark.parametrize("kernel_copy", [True, False])
+    def test_throttled_copy_in_chunks(self, src, tmp_path, monkeypatch, kernel_copy):
+        if not kernel_copy:
+            monkeypatch.delattr(os, "copy_file_range", raising=False)
+            monkeypatch.delattr(os, "sendfile", raising=False)
+        transfers = []
+
+        class RecordingThrottle:
+            def transfer(self, n_bytes):
+                transfers.append(n_bytes)
+
+        dst = tmp_path / "copy.mp4"
+        copy_file(src, dst, buffer_size=2**20, throttle=RecordingThrottle())
+        _assert_copied(src, dst)
+        assert sum(transfers) == src.stat().st_size
+        assert max(transfers) <= 2**20
+
+    def test_falls_back_after_partial_kernel_copy(self, src, tmp_path, monkeypatch):
+        real_copy_file_range = os.copy_file_range
+        calls = []
+
+        def failing_copy_file_range(fd_in, fd_out, count):
+            if calls:
+                raise OSError(errno.EXDEV, "cross-device")
+            calls.append(count)
+            return real_copy_file_range(fd_in, fd_out, 2**20)
+
+        monkeypatch.setattr(os, "copy_file_range", failing_copy_file_range)
+        monkeypatch.setattr(copy_engine, "KERNEL_COPY_CHUNK", 2**20)
+        dst = tmp_path / "copy.mp4"
+        copy_file(src, dst)
+        _assert_copied(src, dst)
+
+    @pytest.mark.parametrize("short_call", ["copy_file_range", "sendfile"])
+    def test_falls_back_after_short_kernel_copy(
+        self, src, tmp_path, monkeypatch, short_call
+    ):
+        """A kernel copy reporting end of data too early is continued."""
+        if not hasattr(os, short_call):
+            pytest.skip(f"no {short_call}")
+        if short_call == "sendfile":
+            monkeypatch.delattr(os, "copy_file_range", raising=False)
+        kernel_call = getattr(os, short_call)
+        calls = []
+
+        def short_kernel_call(*args):
+            calls.append(args)
+            return kernel_call(*args) if len(calls) == 1 else 0
+
+        monkeypatch.setattr(os, short_call, short_kernel_call)
+        monkeypatch.setattr(copy_engine, "KERNEL_COPY_CHUNK", 2**20)
+        dst = tmp_path / "copy.mp4"
+        copy_file(src, dst)
+        _assert_copied(src, dst)
+
+    def test_short_copy_raises(self, src, tmp_path, monkeypatch):
+        monkeypatch.delattr(os, "copy_file_range", raising=False)
+        monkeypatch.delattr(os, "sendfile", raising=False)
+        monkeypatch.setattr(copy_engine, "_buffered_copy", lambda *args, **kw: None)
+        with pytest.raises(OSError, match="Short copy"):
+            copy_file(src, tmp_path / "copy.mp4")
+
+    def test_same_file_is_refused(self, src, tmp_path):
+        """Copying onto a hard link of the source would truncate the source."""
+        link = tmp_path / "link.mp4"
+        os.link(src, link)
+        data = src.read_bytes()
+        with pytest.raises(shutil.SameFileError):
+            copy_file(src, link)
+        with pytest.raises(shutil.SameFileError):
+            copy_file_verified(src, link, hashlib.sha1(data).hexdigest())
+        assert src.read_bytes() == data
+
+    def test_empty_file(self, tmp_path):
+        src = tmp_path / "empty.jpg"
+        src.touch()
+        copy_file(src, tmp_path / "copy.jpg")
+        assert (tmp_path / "copy.jpg").read_bytes() == b""
+
+
+class TestCopyFileVerified:
+    def test_matching_copy(self, src, tmp_path):
+        dst = tmp_path / "copy.mp4"
+        sha1 = hashlib.sha1(src.read_bytes()).hexdigest()
+        assert copy_file_verified(src, dst, sha1) is True
+        _assert_copied(src, dst)
+
+    def test_mismatch_removes_destination(self, src, tmp_path):
+        dst = tmp_path / "copy.mp4"
+        assert copy_file_verified(src, dst, "0" * 40, retries=1) is False
+        assert not dst.exists()
+
+    def test_failed_attempt_is_repeated(self, src, tmp_path, monkeypatch):
+        real_copy_file = copy_engine.copy_file
+        attempts = []
+
+        def flaky_copy_file(src, dst, hasher, throttle=None):
+            attempts.append(dst)
+            real_copy_file(src, dst, hasher=hasher, throttle=throttle)
+            if len(attempts) == 1:
+                hasher.update(b"corrupted")
+
+        monkeypatch.setattr(copy_engine, "copy_file", flaky_copy_file)
+        sha1 = hashlib.sha1(src.read_bytes()).hexdigest()
+        assert copy_file_verified(src, tmp_path / "copy.mp4", sha1, retries=2)
+        assert len(attempts) == 2
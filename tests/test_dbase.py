@@ -11,6 +11,8 @@ from filecluster.dbase import (
     get_existing_clusters_info,
     get_new_cluster_id_from_dataframe,
 )
+from filecluster.library_validator import find_non_compliant_folders
+from filecluster.update_clusters import initialize_cluster_info_dict, save_cluster_ini
 
 
 # ---------------------------------------------------------------------------
@@ -144,3 +146,56 @@ class TestGetExistingClustersInfo:
             force_deep_scan=True,
         )
         assert len(df) > 0
+
+    def test_libraries_are_merged_in_watch_folder_order(self, tmp_path):
+        """Libraries scanned concurrently are merged in a deterministic order."""
+        libraries = []
+        for name, count in [("lib_b", 2), ("lib_a", 3)]:
+            event = tmp_path / name / "2020" / f"[2020_01_0{count}]_event"
+            event.mkdir(parents=True)
+            ini = initialize_cluster_info_dict(
+                start="2020-01-01 10:00:00",
+                stop="2020-01-01 11:00:00",
+                is_continuous=True,
+                median="2020-01-01 10:30:00",
+                file_count=count,
+            )
+            save_cluster_ini(ini, event)
+            libraries.append(tmp_path / name)
+
+        df, _, _ = get_existing_clusters_info(
+            watch_folders=libraries,
+            skip_duplicated_existing_in_libs=False,
+            assign_to_clusters_existing_in_libs=True,
+            force_deep_scan=False,
+        )
+        assert df.file_count.tolist() == [2, 3]
+        assert df.cluster_id.tolist() == [0, 1]
+
+    def test_non_compliant_folders_found_by_the_library_walk(self, tmp_path):
+        """Events with only subfolders are reported, like by the validator."""
+        library = tmp_path / "lib"
+        event = library / "2020" / "[2020_01_01]_event"
+        (event / "part_1").mkdir(parents=True)
+        (event / "part_1" / "a.jpg").write_bytes(b"a")
+        other = library / "2020" / "[2020_02_01]_other"
+        other.mkdir(parents=True)
+        save_cluster_ini(
+            initialize_cluster_info_dict(
+                start="2020-02-01 10:00:00",
+                stop="2020-02-01 11:00:00",
+                is_continuous=True,
+                median="2020-02-01 10:30:00",
+                file_count=1,
+            ),
+            other,
+        )
+
+        _, _, non_compliant = get_existing_clusters_info(
+            watch_folders=[library],
+            skip_duplicated_existing_in_libs=False,
+            assign_to_clusters_existing_in_libs=True,
+            force_deep_scan=False,
+        )
+        assert non_compliant == [str(event)]
+        assert non_compliant == find_non_compliant_folders(library)
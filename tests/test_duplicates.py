@@ -0,0 +1,34 @@
+"""Tests for the duplicates module (tiered identical-file grouping)."""
+
+from filecluster.duplicates import group_identical_files
+
+
+class TestGroupIdenticalFiles:
+    """Tests for size -> partial hash -> full hash grouping."""
+
+    def test_identical_files_are_grouped(self, tmp_path):
+        (tmp_path / "a.jpg").write_bytes(b"x" * 50)
+        (tmp_path / "b.jpg").write_bytes(b"x" * 50)
+        (tmp_path / "c.jpg").write_bytes(b"y" * 50)
+        files = [(n, tmp_path / n, 50) for n in ["a.jpg", "b.jpg", "c.jpg"]]
+        assert group_identical_files(files) == [["a.jpg", "b.jpg"]]
+
+    def test_different_sizes_are_not_read(self, tmp_path):
+        """Files of unique size are rejected without opening them."""
+        files = [("a", tmp_path / "missing_a", 1), ("b", tmp_path / "missing_b", 2)]
+        assert group_identical_files(files) == []
+
+    def test_known_hashes_are_used(self, tmp_path):
+        """When all full hashes are known the files are not read at all."""
+        files = [("a", tmp_path / "missing_a", 5), ("b", tmp_path / "missing_b", 5)]
+        groups = group_identical_files(files, known_hashes={"a": "h1", "b": "h1"})
+        assert groups == [["a", "b"]]
+
+    def test_same_head_different_tail(self, tmp_path):
+        """Partial hash collision is resolved by the full hash."""
+        head = b"h" * (1024 * 1024)
+        (tmp_path / "a").write_bytes(head + b"1")
+        (tmp_path / "b").write_bytes(head + b"2")
+        size = len(head) + 1
+        files = [("a", tmp_path / "a", size), ("b", tmp_path / "b", size)]
+        assert group_identical_files(files) == []
@@ -6,7 +6,12 @@ as expected by consuming code.
 
 import pytest
 
-from filecluster.exceptions import DateStringNoneError, MissingDfClusterColumnError
+from filecluster.exceptions import (
+    DateStringNoneError,
+    InsufficientDiskSpaceError,
+    MissingDfClusterColumnError,
+    UnfinishedPlanError,
+)
 
 
 class TestDateStringNoneError:
@@ -46,3 +51,24 @@ class TestMissingDfClusterColumnError:
         """Verify the error integrates with standard exception handling."""
         err = MissingDfClusterColumnError("x")
         assert isinstance(err, Exception)
+
+
+class TestUnfinishedPlanError:
+    """Tests for UnfinishedPlanError exception."""
+
+    def test_message_points_to_journal_and_resume(self):
+        """Verify the message names the journal and the way to finish the run."""
+        err = UnfinishedPlanError("out/.filecluster.journal")
+        assert "out/.filecluster.journal" in err.message
+        assert "--resume" in str(err)
+
+
+class TestInsufficientDiskSpaceError:
+    """Tests for InsufficientDiskSpaceError exception."""
+
+    def test_message_names_device_and_sizes(self):
+        """Verify the message names the destination and the missing space."""
+        err = InsufficientDiskSpaceError("/mnt/nas/zdjecia", 3 * 2**30, 2**30)
+        assert "/mnt/nas/zdjecia" in err.message
+        assert "3072.0 MiB required" in str(err)
+        assert "1024.0 MiB free" in err.message
@@ -7,11 +7,16 @@ feature flag combinations.
 No mocking — these are integration tests using real files from test assets.
 """
 
+import hashlib
 import tempfile
 
 import pytest
 
+from filecluster.configuration import default_settings
+from filecluster.exceptions import InsufficientDiskSpaceError, UnfinishedPlanError
 from filecluster.file_cluster import create_argument_parser, main, process_watch_dirs
+from filecluster.file_operations import CopyOp, FileOperationPlan, MkdirOp, MoveOp
+from filecluster.journal import PlanJournal
 
 
 # ---------------------------------------------------------------------------
@@ -198,3 +203,90 @@ class TestMainOrchestration:
         assert len(output_contents) == 0
         # But results should still be computed
         assert len(results["new_cluster_df"]) > 0
+
+
+# ---------------------------------------------------------------------------
+# main() — resuming an interrupted run
+# ---------------------------------------------------------------------------
+class TestResume:
+    """Tests for finishing the plan of an interrupted run from its journal."""
+
+    @pytest.fixture()
+    def interrupted(self, tmp_path):
+        inbox, out = tmp_path / "inbox", tmp_path / "out"
+        inbox.mkdir()
+        (inbox / "a.jpg").write_text("a")
+        plan = FileOperationPlan(
+            ops=[
+                MkdirOp(path=out / "ev"),
+                MoveOp(src=inbox / "a.jpg", dst=out / "ev" / "a.jpg"),
+            ]
+        )
+        PlanJournal.create(out / default_settings.journal_filename, plan).close()
+        return inbox, out
+
+    def test_run_with_unfinished_plan_is_refused(self, interrupted):
+        inbox, out = interrupted
+        with pytest.raises(UnfinishedPlanError):
+            main(inbox_dir=str(inbox), output_dir=str(out), watch_dir_list=[])
+
+    def test_resume_finishes_the_plan(self, interrupted):
+        inbox, out = interrupted
+        results = main(
+            inbox_dir=str(inbox), output_dir=str(out), watch_dir_list=[], resume=True
+        )
+        assert results["file_operation_plan"].n_moves == 1
+        assert (out / "ev" / "a.jpg").read_text() == "a"
+        assert not (out / default_settings.journal_filename).exists()
+
+    def test_failed_verification_finishes_the_plan(self, tmp_path):
+        inbox, out = tmp_path / "inbox", tmp_path / "out"
+        inbox.mkdir()
+        (inbox / "a.jpg").write_text("changed since planning")
+        plan = FileOperationPlan(
+            ops=[
+                MkdirOp(path=out / "ev"),
+                CopyOp(
+                    src=inbox / "a.jpg",
+                    dst=out / "ev" / "a.jpg",
+                    expected_hash=hashlib.sha1(b"a").hexdigest(),
+                ),
+            ]
+        )
+        journal_path = out / default_settings.journal_filename
+        PlanJournal.create(journal_path, plan).close()
+        results = main(
+            inbox_dir=str(inbox),
+            output_dir=str(out),
+            watch_dir_list=[],
+            resume=True,
+            verify=True,
+        )
+        assert results["unverified_copies"] == [plan.ops[1]]
+        # a later run isn't refused
+        assert not journal_path.exists()
+
+    def test_resume_refused_without_free_space(self, tmp_path, monkeypatch):
+        inbox, out = tmp_path / "inbox", tmp_path / "out"
+        inbox.mkdir()
+        (inbox / "a.jpg").write_text("a")
+        plan = FileOperationPlan(
+            ops=[CopyOp(src=inbox / "a.jpg", dst=out / "ev" / "a.jpg")]
+        )
+        PlanJournal.create(out / default_settings.journal_filename, plan).close()
+        monkeypatch.setattr(default_settings, "free_space_reserve", 2**62)
+        with pytest.raises(InsufficientDiskSpaceError):
+            main(
+                inbox_dir=str(inbox),
+                output_dir=str(out),
+                watch_dir_list=[],
+                resume=True,
+            )
+        assert not (out / "ev" / "a.jpg").exists()
+
+    def test_resume_flag(self):
+        assert create_argument_parser().parse_args(["--resume"]).resume is True
+
+    def test_save_plan_flag(self):
+        args = create_argument_parser().parse_args(["--save-plan", "plan.jsonl"])
+        assert args.save_plan == "plan.jsonl"
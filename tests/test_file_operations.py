@@ -4,21 +4,35 @@ Covers FileOperationPlan construction, operation counting,
 build_file_operation_plan for NOP/COPY/MOVE modes, and execute_plan.
 """
 
+import errno
+import hashlib
+import os
+import threading
+import time
+from collections import defaultdict
 from pathlib import Path
 
 import pandas as pd
 import pytest
 
-from filecluster.configuration import CopyMode
+from filecluster import file_operations
+from filecluster.configuration import CopyMethod, CopyMode, Status
 from filecluster.exceptions import DateStringNoneError
 from filecluster.file_operations import (
+    Collision,
     CopyOp,
     FileOperationPlan,
     MkdirOp,
     MoveOp,
     SkipOp,
     build_file_operation_plan,
+    classify_collision,
     execute_plan,
+    load_plan,
+    minimal_mkdirs,
+    optimize_plan,
+    save_plan,
+    validate_plan,
 )
 
 
@@ -48,6 +62,16 @@ class TestFileOperationPlan:
         assert plan.n_copies == 1
         assert plan.n_skips == 1
 
+    def test_counts_follow_appended_and_replaced_ops(self):
+        """Counts are updated after appending to or replacing the ops."""
+        plan = FileOperationPlan()
+        assert plan.n_moves == 0
+        plan.ops.append(MoveOp(src=Path("/s"), dst=Path("/d")))
+        plan.ops.extend([SkipOp(src=Path("/s"), reason="nop")] * 2)
+        assert (plan.n_moves, plan.n_skips) == (1, 2)
+        plan.ops = [CopyOp(src=Path("/s"), dst=Path("/d"))]
+        assert (plan.n_moves, plan.n_copies, plan.n_skips) == (0, 1, 0)
+
     def test_summary_string(self):
         """Summary includes all counts."""
         plan = FileOperationPlan(ops=[MoveOp(src=Path("/s"), dst=Path("/d"))])
@@ -128,6 +152,27 @@ class TestBuildFileOperationPlan:
         assert copy_ops[0].src == Path("/inbox/a.jpg")
         assert copy_ops[0].dst == Path("/out/new/cluster1/a.jpg")
 
+    def test_inbox_duplicates_are_skipped(self):
+        """Extra copies of inbox files get a SkipOp instead of a file op."""
+        df = pd.DataFrame(
+            {
+                "file_name": ["a.jpg", "a (1).jpg"],
+                "target_path": ["new/cluster1", None],
+                "status": [Status.NEW_CLUSTER, Status.INBOX_DUPLICATE],
+                "duplicated_to": [[], "a.jpg"],
+            }
+        )
+        plan = build_file_operation_plan(
+            inbox_media_df=df,
+            in_dir=Path("/inbox"),
+            out_dir=Path("/out"),
+            mode=CopyMode.MOVE,
+        )
+        assert plan.n_moves == 1
+        assert plan.n_skips == 1
+        skip = next(op for op in plan.ops if isinstance(op, SkipOp))
+        assert skip.src == Path("/inbox/a (1).jpg")
+
 
 class TestExecutePlan:
     """Tests for execute_plan with real filesystem."""
@@ -183,3 +228,356 @@ class TestExecutePlan:
         plan = FileOperationPlan(ops=[SkipOp(src=Path("/nonexistent"), reason="test")])
         execute_plan(plan)
         # If we get here without error, skip was handled correctly
+
+    def test_parallel_copy(self, tmp_path):
+        src_dir, out_dir = tmp_path / "inbox", tmp_path / "out"
+        src_dir.mkdir()
+        ops = [MkdirOp(path=out_dir / "a"), MkdirOp(path=out_dir / "b")]
+        for i in range(20):
+            (src_dir / f"{i}.jpg").write_text(str(i))
+            ops.append(
+                CopyOp(src=src_dir / f"{i}.jpg", dst=out_dir / "ab"[i % 2] / f"{i}.jpg")
+            )
+        execute_plan(FileOperationPlan(ops=ops), jobs_per_device=4)
+        assert (out_dir / "b" / "7.jpg").read_text() == "7"
+        assert len(list(out_dir.glob("*/*.jpg"))) == 20
+
+    def test_throttled_execution(self, tmp_path):
+        """Operations over the limit of the device wait for their slot."""
+        src_dir, out_dir = tmp_path / "inbox", tmp_path / "out"
+        src_dir.mkdir()
+        ops = [MkdirOp(path=out_dir)]
+        for i in range(12):
+            (src_dir / f"{i}.jpg").write_text(str(i))
+            ops.append(CopyOp(src=src_dir / f"{i}.jpg", dst=out_dir / f"{i}.jpg"))
+        start = time.monotonic()
+        execute_plan(FileOperationPlan(ops=ops), jobs_per_device=4, ops_limit=10)
+        # the burst of 10 operations, then 2 more at 10/s
+        assert time.monotonic() - start >= 0.18
+        assert len(list(out_dir.glob("*.jpg"))) == 12
+
+    def test_ops_with_same_destination_keep_plan_order(self, tmp_path):
+        for name in "abc":
+            (tmp_path / name).write_text(name)
+        dst = tmp_path / "out" / "x.jpg"
+        ops = [MkdirOp(path=dst.parent)]
+        ops += [CopyOp(src=tmp_path / name, dst=dst) for name in "abc"]
+        execute_plan(FileOperationPlan(ops=ops), jobs_per_device=3)
+        assert dst.read_text() == "c"
+
+    def test_concurrency_is_limited_per_device(self, tmp_path, monkeypatch):
+        running, peak = [0], [0]
+        lock = threading.Lock()
+
+        def fake_op(op, *args):
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            time.sleep(0.01)
+            with lock:
+                running[0] -= 1
+            return True
+
+        monkeypatch.setattr(file_operations, "_run_file_op", fake_op)
+        ops = [
+            CopyOp(src=tmp_path / f"{i}", dst=tmp_path / f"{i}.jpg") for i in range(12)
+        ]
+        execute_plan(FileOperationPlan(ops=ops), jobs_per_device=2)
+        assert peak[0] == 2
+
+    def test_folder_is_split_into_contiguous_slices(self, tmp_path, monkeypatch):
+        """Each job runs a contiguous part of the folder in the plan order."""
+        executed = defaultdict(list)
+
+        def fake_op(op, *args):
+            executed[threading.get_ident()].append(int(op.dst.stem))
+            time.sleep(0.005)
+            return True
+
+        monkeypatch.setattr(file_operations, "_run_file_op", fake_op)
+        ops = [
+            CopyOp(src=tmp_path / f"{i}", dst=tmp_path / "a" / f"{i}.jpg")
+            for i in range(12)
+        ]
+        execute_plan(FileOperationPlan(ops=ops), jobs_per_device=4)
+        assert sorted(executed.values()) == [
+            list(range(i, i + 3)) for i in range(0, 12, 3)
+        ]
+
+    def test_running_chains_stop_after_error(self, tmp_path, monkeypatch):
+        executed = []
+
+        def fake_op(op, *args):
+            if op.dst.name == "0.jpg":
+                raise OSError("disk failure")
+            executed.append(op)
+            time.sleep(0.01)
+            return True
+
+        monkeypatch.setattr(file_operations, "_run_file_op", fake_op)
+        ops = [
+            CopyOp(src=tmp_path / f"{i}", dst=tmp_path / f"{i}.jpg") for i in range(20)
+        ]
+        with pytest.raises(OSError, match="disk failure"):
+            execute_plan(FileOperationPlan(ops=ops), jobs_per_device=2)
+        # the second slice (10 ops) stopped early
+        assert len(executed) < 10
+
+    @pytest.fixture()
+    def inbox_file(self, tmp_path):
+        (tmp_path / "inbox").mkdir()
+        (tmp_path / "out").mkdir()
+        src = tmp_path / "inbox" / "photo.jpg"
+        src.write_text("data")
+        return src
+
+    def test_same_device_move_is_rename(self, inbox_file, monkeypatch):
+        monkeypatch.setattr(file_operations, "move", None)  # must not be used
+        dst = inbox_file.parent.parent / "out" / "photo.jpg"
+        execute_plan(FileOperationPlan(ops=[MoveOp(src=inbox_file, dst=dst)]))
+        assert dst.read_text() == "data"
+        assert not inbox_file.exists()
+
+    def test_hardlink(self, inbox_file):
+        dst = inbox_file.parent.parent / "out" / "photo.jpg"
+        plan = FileOperationPlan(ops=[CopyOp(src=inbox_file, dst=dst)])
+        execute_plan(plan, copy_method=CopyMethod.HARDLINK)
+        assert dst.stat().st_ino == inbox_file.stat().st_ino
+
+    def test_hardlink_to_other_device_copies(self, inbox_file, monkeypatch):
+        monkeypatch.setattr(file_operations, "get_device_id", lambda p: hash(p.name))
+        dst = inbox_file.parent.parent / "out" / "photo.jpg"
+        plan = FileOperationPlan(ops=[CopyOp(src=inbox_file, dst=dst)])
+        execute_plan(plan, copy_method=CopyMethod.HARDLINK)
+        assert dst.read_text() == "data"
+        assert dst.stat().st_ino != inbox_file.stat().st_ino
+
+    def test_reflink_keeps_content_and_mtime(self, inbox_file):
+        os.utime(inbox_file, ns=(1_000_000_000, 1_000_000_000))
+        dst = inbox_file.parent.parent / "out" / "photo.jpg"
+        plan = FileOperationPlan(ops=[CopyOp(src=inbox_file, dst=dst)])
+        execute_plan(plan, copy_method=CopyMethod.REFLINK)
+        assert dst.read_text() == "data"
+        assert dst.stat().st_mtime_ns == 1_000_000_000
+        assert dst.stat().st_ino != inbox_file.stat().st_ino
+
+    @pytest.mark.skipif(not hasattr(os, "copy_file_range"), reason="Linux only")
+    def test_short_reflink_is_copied(self, inbox_file, monkeypatch):
+        """A clone stopped short by copy_file_range falls back to a copy."""
+        monkeypatch.setattr(file_operations, "fcntl", None)
+        monkeypatch.setattr(os, "copy_file_range", lambda *args: 0)
+        dst = inbox_file.parent.parent / "out" / "photo.jpg"
+        with pytest.raises(OSError, match="Short clone"):
+            file_operations.reflink_file(inbox_file, dst)
+        plan = FileOperationPlan(ops=[CopyOp(src=inbox_file, dst=dst)])
+        execute_plan(plan, copy_method=CopyMethod.REFLINK)
+        assert dst.read_text() == "data"
+
+    def test_same_device_move_across_mounts(self, inbox_file, monkeypatch):
+        """rename fails with EXDEV between bind mounts of one filesystem."""
+
+        def cross_device_rename(src, dst):
+            raise OSError(errno.EXDEV, "Invalid cross-device link")
+
+        monkeypatch.setattr(os, "rename", cross_device_rename)
+        dst = inbox_file.parent.parent / "out" / "photo.jpg"
+        execute_plan(FileOperationPlan(ops=[MoveOp(src=inbox_file, dst=dst)]))
+        assert dst.read_text() == "data"
+        assert not inbox_file.exists()
+
+    def test_verified_copies(self, inbox_file):
+        out = inbox_file.parent.parent / "out"
+        (inbox_file.parent / "bad.jpg").write_text("other")
+        good = CopyOp(
+            src=inbox_file,
+            dst=out / "photo.jpg",
+            expected_hash=hashlib.sha1(b"data").hexdigest(),
+        )
+        bad = CopyOp(
+            src=inbox_file.parent / "bad.jpg",
+            dst=out / "bad.jpg",
+            expected_hash=hashlib.sha1(b"data").hexdigest(),
+        )
+        failed = execute_plan(FileOperationPlan(ops=[good, bad]), verify=True)
+        assert failed == [bad]
+        assert (out / "photo.jpg").exists()
+        assert not (out / "bad.jpg").exists()
+
+    def test_error_is_raised(self, tmp_path):
+        plan = FileOperationPlan(
+            ops=[CopyOp(src=tmp_path / "missing.jpg", dst=tmp_path / "x.jpg")]
+        )
+        with pytest.raises(FileNotFoundError):
+            execute_plan(plan, jobs_per_device=2)
+
+
+class TestCollisionResolution:
+    """Tests for handling files whose destination name is already taken."""
+
+    @pytest.fixture()
+    def dirs(self, tmp_path):
+        inbox, out = tmp_path / "inbox", tmp_path / "out"
+        (out / "new" / "c1").mkdir(parents=True)
+        inbox.mkdir()
+        return inbox, out
+
+    def _plan(self, inbox, out, **columns):
+        df = pd.DataFrame(
+            {"file_name": ["VID_1.mp4"], "target_path": ["new/c1"], **columns}
+        )
+        return build_file_operation_plan(df, inbox, out, CopyMode.MOVE)
+
+    def test_identical_target_is_noop(self, dirs):
+        inbox, out = dirs
+        (inbox / "VID_1.mp4").write_bytes(b"video")
+        (out / "new" / "c1" / "VID_1.mp4").write_bytes(b"video")
+        plan = self._plan(inbox, out)
+        assert plan.n_moves == 0
+        assert plan.n_skips == 1
+
+    def test_same_name_different_size_is_renamed(self, dirs):
+        """Same file name but different content must not be treated as duplicate."""
+        inbox, out = dirs
+        (inbox / "VID_1.mp4").write_bytes(b"video one")
+        (out / "new" / "c1" / "VID_1.mp4").write_bytes(b"video")
+        plan = self._plan(inbox, out)
+        move = next(op for op in plan.ops if isinstance(op, MoveOp))
+        assert move.dst == out / "new" / "c1" / "VID_1 (1).mp4"
+
+    def test_equal_size_different_content_is_conflict(self, dirs):
+        """Equal sizes, content differs -> rename."""
+        inbox, out = dirs
+        (inbox / "VID_1.mp4").write_bytes(b"AAAA")
+        (out / "new" / "c1" / "VID_1.mp4").write_bytes(b"AAAB")
+        plan = self._plan(inbox, out, size=[4], hash_value=["inbox-sha1"])
+        assert plan.n_moves == 1
+        assert plan.n_skips == 0
+
+    def test_copy_gets_expected_hash(self, dirs):
+        inbox, out = dirs
+        (inbox / "VID_1.mp4").write_bytes(b"AAAA")
+        df = pd.DataFrame(
+            {
+                "file_name": ["VID_1.mp4"],
+                "target_path": ["new/c1"],
+                "hash_value": ["inbox-sha1"],
+            }
+        )
+        plan = build_file_operation_plan(df, inbox, out, CopyMode.COPY)
+        copy = next(op for op in plan.ops if isinstance(op, CopyOp))
+        assert copy.expected_hash == "inbox-sha1"
+
+    def test_free_destination(self, dirs):
+        inbox, out = dirs
+        collision, other = classify_collision(
+            inbox / "a.jpg", out / "new" / "c1" / "a.jpg", claimed={}
+        )
+        assert collision == Collision.NONE
+        assert other is None
+
+    def test_identical_file_planned_twice_is_duplicate(self, dirs):
+        inbox, out = dirs
+        dst = out / "new" / "c1" / "a.jpg"
+        claimed = {str(dst).lower(): (inbox / "x.jpg", 10, "h")}
+        collision, _ = classify_collision(inbox / "y.jpg", dst, claimed, 10, "h")
+        assert collision == Collision.DUPLICATE
+
+
+class TestSavedPlan:
+    """Tests for saving, loading and validating plans."""
+
+    @pytest.fixture()
+    def plan(self, tmp_path):
+        (tmp_path / "inbox").mkdir()
+        for name in ("a.jpg", "b.jpg"):
+            (tmp_path / "inbox" / name).write_text(name)
+        out = tmp_path / "out" / "[2020_01_01]_event"
+        return FileOperationPlan(
+            ops=[
+                MkdirOp(path=out),
+                MoveOp(src=tmp_path / "inbox" / "a.jpg", dst=out / "a.jpg"),
+                CopyOp(src=tmp_path / "inbox" / "b.jpg", dst=out / "b.jpg"),
+                SkipOp(src=tmp_path / "inbox" / "c.jpg", reason="NOP mode"),
+            ]
+        )
+
+    def test_round_trip_records_source_stats(self, plan, tmp_path):
+        save_plan(plan, tmp_path / "plan.jsonl")
+        loaded = load_plan(tmp_path / "plan.jsonl")
+        assert [type(op) for op in loaded.ops] == [type(op) for op in plan.ops]
+        assert loaded.ops[1].src == plan.ops[1].src
+        assert loaded.ops[1].src_size == 5
+        assert loaded.ops[2].src_mtime_ns == plan.ops[2].src.stat().st_mtime_ns
+
+    def test_incomplete_file_is_rejected(self, plan, tmp_path):
+        path = tmp_path / "plan.jsonl"
+        save_plan(plan, path)
+        path.write_text("".join(path.read_text().splitlines(True)[:-1]))
+        with pytest.raises(ValueError):
+            load_plan(path)
+
+    def test_validation_skips_changed_and_missing_sources(self, plan, tmp_path):
+        save_plan(plan, tmp_path / "plan.jsonl")
+        plan.ops[1].src.unlink()
+        plan.ops[2].src.write_text("modified")
+        validated = validate_plan(load_plan(tmp_path / "plan.jsonl"))
+        assert validated.ops[0] == plan.ops[0]
+        assert validated.ops[1].reason == "source file is missing"
+        assert validated.ops[2].reason == "source file changed since planning"
+        assert validated.n_skips == 3
+
+    def test_validation_skips_taken_destination(self, plan, tmp_path):
+        plan.ops[1].dst.parent.mkdir(parents=True)
+        plan.ops[1].dst.write_text("other")
+        validated = validate_plan(plan)
+        assert isinstance(validated.ops[1], SkipOp)
+        assert validated.ops[2] == plan.ops[2]
+
+
+class TestOptimizePlan:
+    """Tests for the locality-aware ordering of the plan."""
+
+    def test_minimal_mkdirs_drops_parents(self):
+        """Parents of other directories are created by makedirs anyway."""
+        paths = [
+            Path("/o/2020/b"),
+            Path("/o/2020"),
+            Path("/o/2019/a/x"),
+            Path("/o/2020/a"),
+        ]
+        assert minimal_mkdirs(paths) == [
+            Path("/o/2019/a/x"),
+            Path("/o/2020/a"),
+            Path("/o/2020/b"),
+        ]
+
+    def test_ops_grouped_by_destination_in_inode_order(self, tmp_path):
+        """File ops are grouped by target folder, sources read by inode."""
+        inbox = tmp_path / "inbox"
+        inbox.mkdir()
+        names = ["a.jpg", "b.jpg", "c.jpg", "d.jpg"]
+        for name in names:
+            (inbox / name).write_bytes(name.encode())
+        by_inode = sorted(names, key=lambda n: (inbox / n).stat().st_ino)
+        # destinations alternate between the folders in the inode order
+        out = tmp_path / "out"
+        dirs = [out / "x", out / "y"]
+        ops = [
+            CopyOp(src=inbox / name, dst=dirs[i % 2] / name)
+            for i, name in enumerate(by_inode)
+        ]
+        plan = FileOperationPlan(
+            ops=[
+                SkipOp(src=inbox / "e.jpg", reason="nop"),
+                *reversed(ops),
+                MkdirOp(path=dirs[1]),
+                MkdirOp(path=dirs[0]),
+                MkdirOp(path=out),
+            ]
+        )
+
+        optimized = optimize_plan(plan).ops
+
+        assert optimized[:2] == [MkdirOp(path=dirs[0]), MkdirOp(path=dirs[1])]
+        assert optimized[2:6] == [ops[0], ops[2], ops[1], ops[3]]
+        assert optimized[6:] == [SkipOp(src=inbox / "e.jpg", reason="nop")]
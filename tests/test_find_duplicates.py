@@ -0,0 +1,101 @@
+"""Tests for the library-wide duplicate finder."""
+
+import multiprocessing
+
+import pandas as pd
+import pytest
+
+from filecluster import find_duplicates
+from filecluster.find_duplicates import (
+    HashProgress,
+    check_report_format,
+    find_library_duplicates,
+    reclaimable_bytes,
+    save_report,
+)
+
+
+@pytest.fixture(scope="module")
+def pool():
+    with multiprocessing.Pool(processes=2) as p:
+        yield p
+
+
+@pytest.fixture()
+def library(tmp_path):
+    lib = tmp_path / "zdjecia"
+    for year in ["2019", "2020"]:
+        (lib / year / "[event]").mkdir(parents=True)
+    (lib / "2019" / "[event]" / "a.jpg").write_bytes(b"A" * 10)
+    (lib / "2020" / "[event]" / "a_copy.jpg").write_bytes(b"A" * 10)
+    (lib / "2020" / "[event]" / "b.jpg").write_bytes(b"B" * 10)  # same size only
+    (lib / "2020" / "[event]" / "c.jpg").write_bytes(b"C" * 7)
+    return lib
+
+
+class TestFindLibraryDuplicates:
+    def test_finds_duplicates_across_years(self, library, pool):
+        report = find_library_duplicates([library], pool)
+        assert report.group_id.nunique() == 1
+        assert {p.split("/")[-1] for p in report.path} == {"a.jpg", "a_copy.jpg"}
+        assert report.is_kept.sum() == 1
+        assert reclaimable_bytes(report) == 10
+
+    def test_no_duplicates(self, tmp_path, pool):
+        (tmp_path / "x.jpg").write_bytes(b"x")
+        report = find_library_duplicates([tmp_path], pool)
+        assert report.empty
+
+    def test_size_groups_split_into_batches(self, library, pool, monkeypatch):
+        (library / "2019" / "[event]" / "d.jpg").write_bytes(b"D" * 7)
+        (library / "2019" / "[event]" / "c_copy.jpg").write_bytes(b"C" * 7)
+        monkeypatch.setattr(find_duplicates, "BATCH_FILES", 1)
+        batches = []
+        original = find_duplicates._find_batch_duplicates
+
+        def spy(files, *args):
+            batches.append(files)
+            return original(files, *args)
+
+        monkeypatch.setattr(find_duplicates, "_find_batch_duplicates", spy)
+        report = find_duplicates.find_library_duplicates([library], pool)
+        # one batch per size group, a group is never split
+        assert sorted(len(b) for b in batches) == [3, 3]
+        assert report.group_id.nunique() == 2
+        assert list(report.drop_duplicates("group_id")["size"]) == [10, 7]
+
+    def test_resume_uses_stored_hashes(self, library, pool, tmp_path):
+        progress_path = tmp_path / "scan.progress"
+        find_library_duplicates([library], pool, progress_path=progress_path)
+        assert len(HashProgress(progress_path)) == 5  # 3 partial + 2 full hashes
+
+        # a stored hash is trusted as long as size and mtime match
+        lines = progress_path.read_text().splitlines()
+        faked = [
+            line.replace(line.split("\t")[3], "fake", 1) if "b.jpg" in line else line
+            for line in lines
+        ]
+        progress_path.write_text("\n".join(faked) + "\n")
+        report = find_library_duplicates([library], pool, progress_path=progress_path)
+        assert "b.jpg" not in " ".join(report.path)
+
+    def test_truncated_progress_line_is_ignored(self, tmp_path):
+        progress_path = tmp_path / "scan.progress"
+        progress_path.write_text("p\t10\t1\tabc\t/x.jpg\np\t10")
+        assert HashProgress(progress_path).get("p", "/x.jpg", 10, 1) == "abc"
+
+
+def test_check_report_format_without_parquet_engine(monkeypatch):
+    monkeypatch.setattr(find_duplicates.importlib.util, "find_spec", lambda m: None)
+    check_report_format("report.csv")
+    with pytest.raises(ImportError, match="pyarrow"):
+        check_report_format("report.parquet")
+
+
+def test_save_report_csv(tmp_path):
+    report = pd.DataFrame(
+        [(0, 10, "h", "/a", True)],
+        columns=["group_id", "size", "hash_value", "path", "is_kept"],
+    )
+    save_report(report, tmp_path / "r.csv")
+    assert pd.read_csv(tmp_path / "r.csv").shape == (1, 5)
@@ -6,7 +6,7 @@ file-move logic, and supporting helpers (TargetPathCreator,
 check_df_has_all_expected_columns).
 """
 
-from datetime import timedelta
+from datetime import datetime, timedelta
 from pathlib import Path
 
 import pandas as pd
@@ -21,6 +21,7 @@ from filecluster.configuration import (
 )
 from filecluster.dbase import get_existing_clusters_info
 from filecluster.exceptions import DateStringNoneError, MissingDfClusterColumnError
+from filecluster.file_operations import CopyOp, execute_plan
 from filecluster.image_grouper import (
     ImageGrouper,
     TargetPathCreator,
@@ -29,6 +30,12 @@ from filecluster.image_grouper import (
     get_watch_folders_files_path,
 )
 from filecluster.image_reader import InboxReader
+from filecluster.update_clusters import (
+    initialize_cluster_info_dict,
+    is_cluster_ini_fresh,
+    read_cluster_ini_as_dict,
+    save_cluster_ini,
+)
 
 
 # ---------------------------------------------------------------------------
@@ -475,3 +482,163 @@ class TestMoveFiles:
         grouper.config.mode = CopyMode.COPY
         with pytest.raises(DateStringNoneError):
             grouper.build_file_operation_plan()
+
+
+class TestUpdateTargetClusterInfo:
+    """Cluster info of destination folders is written after the plan execution."""
+
+    def test_existing_cluster_info_is_merged(
+        self, tmp_path, config_with_1h_granularity
+    ):
+        library_cluster = tmp_path / "lib" / "2020" / "[2020_01_01]_event"
+        library_cluster.mkdir(parents=True)
+        save_cluster_ini(
+            initialize_cluster_info_dict(
+                start="2020-01-01 10:00:00",
+                stop="2020-01-01 12:00:00",
+                is_continuous=True,
+                median="2020-01-01 11:00:00",
+                file_count=5,
+            ),
+            library_cluster,
+        )
+        inbox = tmp_path / "inbox"
+        inbox.mkdir()
+        (inbox / "IMG_1.jpg").write_bytes(b"new")
+        config_with_1h_granularity.in_dir_name = inbox
+        config_with_1h_granularity.out_dir_name = tmp_path / "out"
+        config_with_1h_granularity.mode = CopyMode.COPY
+        target = str(Path("existing") / library_cluster.name)
+        grouper = ImageGrouper(
+            configuration=config_with_1h_granularity,
+            df_clusters=pd.DataFrame(
+                {
+                    "cluster_id": ["1"],
+                    "path": [library_cluster],
+                    "target_path": [target],
+                }
+            ),
+            inbox_media_df=pd.DataFrame(
+                {
+                    "file_name": ["IMG_1.jpg"],
+                    "date": pd.to_datetime(["2020-01-01 12:30"]),
+                    "size": [3],
+                    "hash_value": [None],
+                    "status": [Status.EXISTING_CLUSTER],
+                    "target_path": [target],
+                }
+            ),
+        )
+        plan = grouper.build_file_operation_plan()
+        execute_plan(plan)
+
+        updated = grouper.update_target_cluster_info(plan)
+        out_cluster = tmp_path / "out" / target
+        assert updated == [out_cluster]
+        ini = read_cluster_ini_as_dict(out_cluster)["Range"]
+        assert ini["file_count"] == "6"
+        assert ini["end_date"] == datetime(2020, 1, 1, 12, 30)
+
+    @pytest.fixture()
+    def copy_grouper(self, tmp_path, config_with_1h_granularity):
+        inbox = tmp_path / "inbox"
+        inbox.mkdir()
+        for name in ["IMG_1.jpg", "IMG_2.jpg"]:
+            (inbox / name).write_bytes(name.encode())
+        config_with_1h_granularity.in_dir_name = inbox
+        config_with_1h_granularity.out_dir_name = tmp_path / "out"
+        config_with_1h_granularity.mode = CopyMode.COPY
+        return ImageGrouper(
+            configuration=config_with_1h_granularity,
+            df_clusters=pd.DataFrame(columns=["cluster_id", "target_path"]),
+            inbox_media_df=pd.DataFrame(
+                {
+                    "file_name": ["IMG_1.jpg", "IMG_2.jpg"],
+                    "date": pd.to_datetime(["2020-01-01 12:30", "2020-01-01 12:40"]),
+                    "size": [9, 9],
+                    "hash_value": [None, None],
+                    "status": [Status.NEW_CLUSTER] * 2,
+                    "target_path": ["event"] * 2,
+                }
+            ),
+        )
+
+    def test_folder_with_other_files_is_scanned(self, copy_grouper, tmp_path):
+        """Without cluster info, the files already in the folder are counted."""
+        out_cluster = tmp_path / "out" / "event"
+        out_cluster.mkdir(parents=True)
+        for i in range(4):
+            (out_cluster / f"OLD_{i}.jpg").write_bytes(b"old")
+        plan = copy_grouper.build_file_operation_plan()
+        execute_plan(plan)
+
+        assert copy_grouper.update_target_cluster_info(plan) == [out_cluster]
+        ini = read_cluster_ini_as_dict(out_cluster)["Range"]
+        assert ini["file_count"] == "6"
+        assert is_cluster_ini_fresh(out_cluster)
+
+    def test_failed_copies_are_not_counted(self, copy_grouper, tmp_path):
+        """Copies removed after a failed verification are left out."""
+        plan = copy_grouper.build_file_operation_plan()
+        execute_plan(plan)
+        failed = [op for op in plan.ops if isinstance(op, CopyOp)][1:]
+        failed[0].dst.unlink()
+
+        copy_grouper.update_target_cluster_info(plan, failed)
+        ini = read_cluster_ini_as_dict(tmp_path / "out" / "event")["Range"]
+        assert ini["file_count"] == "1"
+
+
+# ---------------------------------------------------------------------------
+# ImageGrouper - mark_inbox_internal_duplicates
+# ---------------------------------------------------------------------------
+class TestInboxInternalDuplicates:
+    """Tests for detection of the same file imported twice into the inbox."""
+
+    @pytest.fixture()
+    def grouper(self, tmp_path, config_with_1h_granularity, empty_clusters_df):
+        for name, content in [
+            ("IMG_1.jpg", b"same"),
+            ("IMG_1-Kopiuj(1).jpg", b"same"),
+            ("IMG_2.jpg", b"other"),
+        ]:
+            (tmp_path / name).write_bytes(content)
+        names = ["IMG_1-Kopiuj(1).jpg", "IMG_1.jpg", "IMG_2.jpg"]
+        media_df = pd.DataFrame(
+            {
+                "file_name": names,
+                "date": pd.to_datetime(["2020-01-01 10:00"] * 3),
+                "size": [4, 4, 5],
+                "hash_value": [None, None, None],
+                "is_image": [True] * 3,
+                "cluster_id": [None] * 3,
+                "status": [Status.UNKNOWN] * 3,
+                "duplicated_to": [[] for _ in range(3)],
+                "duplicated_cluster": [[] for _ in range(3)],
+            }
+        )
+        config_with_1h_granularity.in_dir_name = tmp_path
+        return ImageGrouper(
+            configuration=config_with_1h_granularity,
+            df_clusters=empty_clusters_df,
+            inbox_media_df=media_df,
+        )
+
+    def test_copy_without_suffix_is_kept(self, grouper):
+        extra = grouper.mark_inbox_internal_duplicates()
+        assert extra == ["IMG_1-Kopiuj(1).jpg"]
+        df = grouper.inbox_media_df.set_index("file_name")
+        assert df.loc["IMG_1-Kopiuj(1).jpg", "status"] == Status.INBOX_DUPLICATE
+        assert df.loc["IMG_1-Kopiuj(1).jpg", "duplicated_to"] == "IMG_1.jpg"
+        assert df.loc["IMG_1.jpg", "status"] == Status.UNKNOWN
+
+    def test_extra_copy_is_skipped_in_plan(self, grouper):
+        grouper.mark_inbox_internal_duplicates()
+        grouper.calculate_gaps()
+        grouper.run_clustering()
+        grouper.assign_target_folder_name_and_file_count_to_new_clusters()
+        grouper.add_cluster_info_from_clusters_to_media()
+        grouper.config.mode = CopyMode.COPY
+        plan = grouper.build_file_operation_plan()
+        assert plan.n_copies == 2
+        assert plan.n_skips == 1
@@ -7,6 +7,7 @@ the configure_inbox_reader helper.
 
 import os
 
+import numpy as np
 import pandas as pd
 from numpy import dtype
 
@@ -18,6 +19,7 @@ from filecluster.image_reader import (
     configure_inbox_reader,
     get_media_df,
     get_media_stats,
+    get_timestamps_stats,
     initialize_row_dict,
     multiple_timestamps_to_one,
     prepare_new_row_with_meta,
@@ -374,6 +376,37 @@ class TestGetMediaStats:
         stats = get_media_stats(df, time_granularity=3600)
         assert stats["is_time_consistent"] is True
 
+    def test_unsorted_dates_median_and_range(self):
+        """Dates don't have to be sorted, median of an even count is the midpoint."""
+        dates = pd.to_datetime(
+            [
+                "2020-01-01 10:40",
+                "2020-01-01 10:00",
+                "2020-01-01 10:30",
+                "2020-01-01 10:10",
+            ]
+        )
+        stats = get_media_stats(pd.DataFrame({"date": dates}), time_granularity=3600)
+        assert stats["date_min"] == pd.Timestamp("2020-01-01 10:00")
+        assert stats["date_max"] == pd.Timestamp("2020-01-01 10:40")
+        assert stats["date_median"] == pd.Timestamp("2020-01-01 10:20")
+        assert stats["file_count"] == 4
+
+    def test_missing_date_is_not_time_consistent(self):
+        """A file without a date can't be proven to belong to the event."""
+        dates = pd.to_datetime(["2020-01-01 10:00", None])
+        stats = get_media_stats(pd.DataFrame({"date": dates}), time_granularity=3600)
+        assert stats["is_time_consistent"] is False
+        assert stats["date_max"] == pd.Timestamp("2020-01-01 10:00")
+        assert stats["file_count"] == 2
+
+    def test_timestamps_stats_on_int64_nanoseconds(self):
+        """The numpy function works on raw int64 nanoseconds."""
+        ns = np.array([3, 1, 2], dtype=np.int64) * 60 * 10**9
+        stats = get_timestamps_stats(ns, time_granularity=60)
+        assert stats["date_median"] == pd.Timestamp(120 * 10**9)
+        assert stats["is_time_consistent"] is True
+
 
 # ---------------------------------------------------------------------------
 # configure_inbox_reader
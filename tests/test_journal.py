@@ -0,0 +1,125 @@
+"""Tests for the plan execution journal."""
+
+import hashlib
+import os
+
+import pytest
+
+from filecluster.configuration import CopyMethod
+from filecluster.file_operations import (
+    CopyOp,
+    FileOperationPlan,
+    MkdirOp,
+    MoveOp,
+    SkipOp,
+    execute_plan,
+)
+from filecluster.journal import PlanJournal
+
+
+@pytest.fixture()
+def move_plan(tmp_path):
+    inbox, out = tmp_path / "inbox", tmp_path / "out" / "[2020_01_01]_event"
+    inbox.mkdir()
+    ops = [MkdirOp(path=out)]
+    for name in ("a.jpg", "b.jpg", "c.jpg"):
+        (inbox / name).write_text(name)
+        ops.append(MoveOp(src=inbox / name, dst=out / name))
+    ops.append(SkipOp(src=inbox / "d.jpg", reason="duplicate"))
+    return FileOperationPlan(ops=ops)
+
+
+class TestPlanJournal:
+    def test_plan_and_completed_ops_are_loaded(self, tmp_path, move_plan):
+        path = tmp_path / "journal"
+        with PlanJournal.create(path, move_plan) as journal:
+            journal.mark_done(2)
+        loaded = PlanJournal.load(path)
+        assert loaded.plan.ops == move_plan.ops
+        assert loaded.done == {2}
+        assert loaded.resumed
+
+    def test_truncated_record_is_ignored(self, tmp_path, move_plan):
+        path = tmp_path / "journal"
+        with PlanJournal.create(path, move_plan) as journal:
+            journal.mark_done(1)
+        with open(path, "a") as f:
+            f.write('{"do')
+        assert PlanJournal.load(path).done == {1}
+
+    def test_failed_ops_are_loaded(self, tmp_path, move_plan):
+        path = tmp_path / "journal"
+        with PlanJournal.create(path, move_plan) as journal:
+            journal.mark_done(1)
+            journal.mark_failed(2)
+        loaded = PlanJournal.load(path)
+        assert loaded.done == {1}
+        assert loaded.failed == {2}
+        assert loaded.finished == {1, 2}
+
+    def test_copy_op_round_trip(self, tmp_path):
+        plan = FileOperationPlan(ops=[CopyOp(src=tmp_path / "a", dst=tmp_path / "b")])
+        PlanJournal.create(tmp_path / "journal", plan).close()
+        assert PlanJournal.load(tmp_path / "journal").plan.ops == plan.ops
+
+    def test_remove(self, tmp_path, move_plan):
+        journal = PlanJournal.create(tmp_path / "journal", move_plan)
+        journal.remove()
+        assert not (tmp_path / "journal").exists()
+
+
+class TestResumeExecution:
+    def test_execution_records_completed_ops(self, tmp_path, move_plan):
+        with PlanJournal.create(tmp_path / "journal", move_plan) as journal:
+            execute_plan(move_plan, journal=journal)
+        assert PlanJournal.load(tmp_path / "journal").done == {1, 2, 3}
+
+    def test_resume_after_interruption(self, tmp_path, move_plan):
+        path = tmp_path / "journal"
+        with PlanJournal.create(path, move_plan) as journal:
+            move_plan.ops[0].path.mkdir(parents=True)
+            for op in move_plan.ops[1:3]:
+                op.src.rename(op.dst)
+            # the second move was done, but its record was lost
+            journal.mark_done(1)
+
+        journal = PlanJournal.load(path)
+        with journal:
+            execute_plan(journal.plan, journal=journal)
+        out = move_plan.ops[0].path
+        assert sorted(p.name for p in out.iterdir()) == ["a.jpg", "b.jpg", "c.jpg"]
+        assert journal.done == {1, 2, 3}
+
+    def test_failed_copy_is_not_repeated(self, tmp_path):
+        src, dst = tmp_path / "a.jpg", tmp_path / "out" / "a.jpg"
+        src.write_text("changed")
+        op = CopyOp(src=src, dst=dst, expected_hash=hashlib.sha1(b"a").hexdigest())
+        plan = FileOperationPlan(ops=[MkdirOp(path=dst.parent), op])
+        path = tmp_path / "journal"
+        with PlanJournal.create(path, plan) as journal:
+            assert execute_plan(plan, journal=journal, verify=True) == [op]
+
+        journal = PlanJournal.load(path)
+        assert journal.finished == {1}
+        src.write_text("a")
+        with journal:
+            # reported again, not copied
+            assert execute_plan(journal.plan, journal=journal, verify=True) == [op]
+        assert not dst.exists()
+
+    def test_resume_of_unrecorded_hardlink(self, tmp_path):
+        """A link whose record was lost isn't copied onto itself on resume."""
+        src, dst = tmp_path / "a.jpg", tmp_path / "out" / "a.jpg"
+        src.write_text("a")
+        plan = FileOperationPlan(ops=[MkdirOp(path=dst.parent), CopyOp(src, dst)])
+        path = tmp_path / "journal"
+        with PlanJournal.create(path, plan):
+            dst.parent.mkdir()
+            os.link(src, dst)
+
+        journal = PlanJournal.load(path)
+        with journal:
+            execute_plan(journal.plan, copy_method=CopyMethod.HARDLINK, journal=journal)
+        assert src.read_text() == "a"
+        assert dst.stat().st_ino == src.stat().st_ino
+        assert journal.done == {1}
@@ -0,0 +1,153 @@
+"""Tests for the library_filter module.
+
+Covers the Bloom filter itself (membership, persistence), detection of library
+changes and the pre-screen used by the duplicate search.
+"""
+
+import os
+
+import pandas as pd
+
+from filecluster.configuration import Status, default_settings
+from filecluster.image_grouper import ImageGrouper
+from filecluster.library_filter import (
+    LibraryBloomFilter,
+    LibraryPrescreen,
+    build_library_filter,
+    get_library_state,
+    get_or_build_library_filter,
+    make_key,
+)
+from filecluster.utlis import partial_hash_file
+
+
+def _make_library(root):
+    event = root / "2020" / "[2020_01_01]_event"
+    event.mkdir(parents=True)
+    (event / "a.jpg").write_bytes(b"a" * 100)
+    (event / "b.jpg").write_bytes(b"b" * 200)
+    return event
+
+
+class TestLibraryBloomFilter:
+    """Tests for the filter data structure."""
+
+    def test_added_keys_are_members(self):
+        """A Bloom filter has no false negatives."""
+        bloom = LibraryBloomFilter.for_capacity(1000)
+        keys = [make_key(i, f"hash{i}") for i in range(1000)]
+        for key in keys:
+            bloom.add(key)
+        assert all(key in bloom for key in keys)
+
+    def test_false_positive_rate_close_to_target(self):
+        """Observed false-positive rate stays near the configured target."""
+        bloom = LibraryBloomFilter.for_capacity(2000, fp_rate=0.01)
+        for i in range(2000):
+            bloom.add(make_key(i, "x"))
+        n_false = sum(make_key(i, "y") in bloom for i in range(5000))
+        assert n_false / 5000 < 0.03
+        assert bloom.expected_fp_rate < 0.02
+
+    def test_save_load_roundtrip(self, tmp_path):
+        """Persisted filter keeps its bits and library state."""
+        bloom = LibraryBloomFilter.for_capacity(10)
+        bloom.add("1:abc")
+        path = tmp_path / "f.bloom"
+        bloom.save(path)
+        loaded = LibraryBloomFilter.load(path)
+        assert loaded is not None
+        assert "1:abc" in loaded
+        assert loaded.n_items == 1
+
+    def test_load_malformed_returns_none(self, tmp_path):
+        path = tmp_path / "f.bloom"
+        path.write_bytes(b"garbage")
+        assert LibraryBloomFilter.load(path) is None
+
+
+class TestLibraryFilterPersistence:
+    """Tests for building, reusing and invalidating the library filter."""
+
+    def test_build_contains_library_files(self, tmp_path):
+        event = _make_library(tmp_path)
+        bloom = build_library_filter(tmp_path)
+        key = make_key(100, partial_hash_file(event / "a.jpg"))
+        assert key in bloom
+        assert bloom.n_items == 2
+
+    def test_filter_is_saved_in_library_root(self, tmp_path):
+        _make_library(tmp_path)
+        get_or_build_library_filter(tmp_path)
+        assert (tmp_path / default_settings.library_filter_filename).exists()
+
+    def test_saving_filter_does_not_change_state(self, tmp_path):
+        """The filter file in the root must not invalidate the filter itself."""
+        _make_library(tmp_path)
+        state_before = get_library_state(tmp_path)
+        get_or_build_library_filter(tmp_path)
+        assert get_library_state(tmp_path) == state_before
+
+    def test_new_library_file_triggers_rebuild(self, tmp_path):
+        event = _make_library(tmp_path)
+        get_or_build_library_filter(tmp_path)
+        (event / "c.jpg").write_bytes(b"c" * 300)
+        os.utime(event, ns=(0, event.stat().st_mtime_ns + 10**9))
+        bloom = get_or_build_library_filter(tmp_path)
+        assert make_key(300, partial_hash_file(event / "c.jpg")) in bloom
+
+    def test_file_rewritten_in_place_triggers_rebuild(self, tmp_path):
+        """Same directory entries, new content: the old key must not be used."""
+        event = _make_library(tmp_path)
+        get_or_build_library_filter(tmp_path)
+        mtime_ns = event.stat().st_mtime_ns
+        (event / "a.jpg").write_bytes(b"z" * 150)
+        os.utime(event, ns=(mtime_ns, mtime_ns))
+        bloom = get_or_build_library_filter(tmp_path)
+        assert make_key(150, partial_hash_file(event / "a.jpg")) in bloom
+
+    def test_file_in_library_root_triggers_rebuild(self, tmp_path):
+        _make_library(tmp_path)
+        get_or_build_library_filter(tmp_path)
+        (tmp_path / "root.jpg").write_bytes(b"r" * 50)
+        bloom = get_or_build_library_filter(tmp_path)
+        assert make_key(50, partial_hash_file(tmp_path / "root.jpg")) in bloom
+
+
+class TestPrescreenInDuplicateSearch:
+    """The pre-screen must not change the duplicate search result."""
+
+    def test_duplicates_found_and_new_files_rejected(self, tmp_path, test_config):
+        library = tmp_path / "lib"
+        event = _make_library(library)
+        inbox = tmp_path / "inbox"
+        inbox.mkdir()
+        (inbox / "dup.jpg").write_bytes((event / "a.jpg").read_bytes())
+        (inbox / "new.jpg").write_bytes(b"n" * 100)
+
+        test_config.in_dir_name = inbox
+        test_config.watch_folders = [library]
+        test_config.skip_duplicated_existing_in_libs = True
+        test_config.use_library_prescreen = True
+        media_df = pd.DataFrame(
+            {
+                "file_name": ["dup.jpg", "new.jpg"],
+                "size": [100, 100],
+                "hash_value": [None, None],
+                "status": [Status.UNKNOWN, Status.UNKNOWN],
+                "duplicated_to": [[], []],
+                "duplicated_cluster": [[], []],
+            }
+        )
+        grouper = ImageGrouper(configuration=test_config, inbox_media_df=media_df)
+        dup_files, dup_clusters = grouper.mark_inbox_duplicates()
+        assert dup_files == ["dup.jpg"]
+        assert dup_clusters == ["[2020_01_01]_event"]
+
+
+class TestLibraryPrescreen:
+    def test_unknown_partial_hash_is_never_rejected(self, tmp_path):
+        _make_library(tmp_path)
+        prescreen = LibraryPrescreen.for_libraries([tmp_path])
+        assert prescreen.may_contain(100, None) is True
+        assert "rejected as new" in prescreen.report(n_confirmed=0)
@@ -0,0 +1,95 @@
+"""Tests for the library structure validator."""
+
+import csv
+import json
+
+import pytest
+
+from filecluster.configuration import FolderIssue
+from filecluster.library_validator import (
+    find_non_compliant_folders,
+    save_validation_report,
+    validate_library,
+)
+
+EVENT = "2020/[2020_01_01]_event"
+
+
+@pytest.fixture()
+def library(tmp_path):
+    lib = tmp_path / "lib"
+    (lib / EVENT / "sel").mkdir(parents=True)
+    (lib / EVENT / "IMG_1.jpg").write_bytes(b"x")
+    (lib / EVENT / "sel" / "IMG_1.jpg").write_bytes(b"x")
+    # event with a subfolder instead of media files
+    (lib / "2020" / "[2020_02_01]_trip" / "day_1").mkdir(parents=True)
+    (lib / "2020" / "[2020_02_01]_trip" / "day_1" / "VID_1.mp4").write_bytes(b"x")
+    (lib / "2020" / "[2020_03_01]_empty").mkdir()
+    (lib / "misc").mkdir()
+    (lib / "misc" / "notes.txt").write_text("x")
+    return lib
+
+
+class TestValidateLibrary:
+    def test_folders_are_classified(self, library):
+        types = {r.path: r.folder_type for r in validate_library(library)}
+        assert types == {
+            "2020": "year",
+            EVENT: "event",
+            f"{EVENT}/sel": "sel",
+            "2020/[2020_02_01]_trip": "event",
+            "2020/[2020_02_01]_trip/day_1": "sub_event",
+            "2020/[2020_03_01]_empty": "event",
+            "misc": "unknown",
+        }
+
+    def test_issues(self, library):
+        issues = {r.path: r.issues for r in validate_library(library) if r.issues}
+        assert issues == {
+            "2020/[2020_02_01]_trip": [FolderIssue.NON_COMPLIANT],
+            "2020/[2020_03_01]_empty": [FolderIssue.EMPTY],
+            "misc": [FolderIssue.UNKNOWN_TYPE],
+        }
+
+    def test_media_and_subfolders_are_counted(self, library):
+        report = {r.path: r for r in validate_library(library)}[EVENT]
+        assert (report.n_media, report.n_subfolders) == (1, 1)
+
+    def test_discontinuous_event_from_ini(self, library):
+        (library / EVENT / ".cluster.ini").write_text(
+            "[Range]\n"
+            "start_date = 2020-01-01 10:00:00\n"
+            "end_date = 2020-01-03 10:00:00\n"
+            "median = 2020-01-02 10:00:00\n"
+            "is_continuous = False\n"
+            "file_count = 1\n"
+        )
+        report = {r.path: r for r in validate_library(library)}[EVENT]
+        assert report.issues == [FolderIssue.DISCONTINUOUS]
+
+    def test_corrupt_ini(self, library):
+        (library / EVENT / ".cluster.ini").write_text("[Range\nbroken")
+        report = {r.path: r for r in validate_library(library)}[EVENT]
+        assert report.issues == [FolderIssue.CORRUPT_INI]
+
+    def test_find_non_compliant_folders(self, library):
+        assert find_non_compliant_folders(library) == [
+            str(library / "2020" / "[2020_02_01]_trip")
+        ]
+
+
+class TestSaveValidationReport:
+    def test_json_report(self, library, tmp_path):
+        report_path = tmp_path / "report.json"
+        save_validation_report(validate_library(library), report_path)
+        records = {r["path"]: r for r in json.loads(report_path.read_text())}
+        assert records["misc"]["issues"] == ["unknown_type"]
+        assert records[EVENT]["folder_type"] == "event"
+
+    def test_csv_report(self, library, tmp_path):
+        report_path = tmp_path / "report.csv"
+        save_validation_report(validate_library(library), report_path)
+        with open(report_path, newline="") as f:
+            rows = {r["path"]: r for r in csv.DictReader(f)}
+        assert rows["2020/[2020_03_01]_empty"]["issues"] == "empty"
+        assert rows[EVENT]["issues"] == ""
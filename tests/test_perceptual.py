@@ -0,0 +1,115 @@
+"""Tests for the perceptual module (dHash, BK-tree, library hash cache)."""
+
+import random
+
+import pandas as pd
+import pytest
+from PIL import Image
+
+from filecluster.configuration import Status, default_settings
+from filecluster.image_grouper import ImageGrouper
+from filecluster.perceptual import (
+    BKTree,
+    build_library_index,
+    dhash,
+    hamming_distance,
+    iter_library_image_hashes,
+)
+
+
+def _gradient_image(path, size=(400, 300), quality=95, flip=False):
+    img = Image.new("L", size)
+    w, h = size
+    img.putdata(
+        [((x * 255 // w) + (y * 128 // h)) % 256 for y in range(h) for x in range(w)]
+    )
+    if flip:
+        img = img.transpose(Image.Transpose.FLIP_LEFT_RIGHT)
+    img.convert("RGB").save(path, "JPEG", quality=quality)
+    return path
+
+
+class TestDhash:
+    """Tests for the difference hash."""
+
+    def test_resized_recompressed_copy_is_close(self, tmp_path):
+        original = _gradient_image(tmp_path / "a.jpg")
+        copy = tmp_path / "b.jpg"
+        Image.open(original).resize((200, 150)).save(copy, "JPEG", quality=40)
+        assert hamming_distance(dhash(original), dhash(copy)) <= 4
+
+    def test_different_image_is_far(self, tmp_path):
+        a = _gradient_image(tmp_path / "a.jpg")
+        b = _gradient_image(tmp_path / "b.jpg", flip=True)
+        assert hamming_distance(dhash(a), dhash(b)) > 20
+
+    def test_not_an_image_returns_none(self, tmp_path):
+        path = tmp_path / "x.jpg"
+        path.write_bytes(b"not a jpeg")
+        assert dhash(path) is None
+
+
+class TestBKTree:
+    """BK-tree queries must match a brute-force scan."""
+
+    def test_query_matches_brute_force(self):
+        rng = random.Random(0)
+        hashes = [rng.getrandbits(64) for _ in range(500)]
+        tree = BKTree()
+        for i, h in enumerate(hashes):
+            tree.add(h, i)
+        probe = hashes[17] ^ 0b1011
+        expected = {i for i, h in enumerate(hashes) if hamming_distance(h, probe) <= 5}
+        assert {i for i, _ in tree.query(probe, 5)} == expected
+        assert tree.query(probe, 5)[0] == (17, 3)
+
+    def test_empty_tree(self):
+        assert BKTree().query(0, 10) == []
+
+
+class TestLibraryIndex:
+    def test_hash_cache_is_written_and_reused(self, tmp_path):
+        (tmp_path / "2020").mkdir()
+        _gradient_image(tmp_path / "2020" / "a.jpg")
+        cache = tmp_path / default_settings.library_phash_filename
+        first = list(iter_library_image_hashes(tmp_path))
+        assert cache.exists()
+        # entries with matching size and mtime are taken from the cache as-is
+        rel, size, mtime, _ = cache.read_text().strip().split("\t")
+        cache.write_text(f"{rel}\t{size}\t{mtime}\tff\n")
+        assert list(iter_library_image_hashes(tmp_path)) == [(first[0][0], 0xFF)]
+
+    def test_index_finds_library_image(self, tmp_path):
+        (tmp_path / "2020").mkdir()
+        lib_img = _gradient_image(tmp_path / "2020" / "a.jpg")
+        tree = build_library_index([tmp_path])
+        assert tree.query(dhash(lib_img), 0)[0][0] == lib_img
+
+
+class TestMarkInboxNearDuplicates:
+    @pytest.fixture()
+    def grouper(self, tmp_path, config_with_1h_granularity):
+        library = tmp_path / "lib" / "2020" / "[2020_01_01]_event"
+        library.mkdir(parents=True)
+        _gradient_image(library / "IMG_1.jpg")
+        inbox = tmp_path / "inbox"
+        inbox.mkdir()
+        Image.open(library / "IMG_1.jpg").resize((100, 75)).save(inbox / "wa.jpg")
+        _gradient_image(inbox / "other.jpg", flip=True)
+
+        config_with_1h_granularity.in_dir_name = inbox
+        config_with_1h_granularity.watch_folders = [tmp_path / "lib"]
+        media_df = pd.DataFrame(
+            {
+                "file_name": ["wa.jpg", "other.jpg"],
+                "is_image": [True, True],
+                "status": [Status.UNKNOWN, Status.UNKNOWN],
+            }
+        )
+        return ImageGrouper(config_with_1h_granularity, inbox_media_df=media_df)
+
+    def test_resized_copy_is_reported(self, grouper):
+        assert grouper.mark_inbox_near_duplicates() == ["wa.jpg"]
+        df = grouper.inbox_media_df.set_index("file_name")
+        assert df.loc["wa.jpg", "near_duplicate_of"].endswith("IMG_1.jpg")
+        assert df.loc["other.jpg", "near_duplicate_of"] is None
@@ -0,0 +1,117 @@
+"""Tests for the estimation of the plan cost."""
+
+import shutil
+from collections import namedtuple
+
+import pytest
+
+from filecluster.configuration import CopyMethod, default_settings
+from filecluster.exceptions import InsufficientDiskSpaceError
+from filecluster.file_operations import (
+    CopyOp,
+    FileOperationPlan,
+    MkdirOp,
+    MoveOp,
+    SkipOp,
+)
+from filecluster.plan_cost import (
+    DeviceCost,
+    check_free_space,
+    estimate_plan_cost,
+    format_plan_cost,
+    probe_write_throughput,
+)
+
+DiskUsage = namedtuple("DiskUsage", "total used free")
+
+
+@pytest.fixture()
+def plan(tmp_path):
+    inbox = tmp_path / "inbox"
+    inbox.mkdir()
+    for name, size in [("a.jpg", 100), ("b.mp4", 1000)]:
+        (inbox / name).write_bytes(b"x" * size)
+    out = tmp_path / "out" / "2020" / "event"
+    return FileOperationPlan(
+        ops=[
+            MkdirOp(path=out),
+            CopyOp(src=inbox / "a.jpg", dst=out / "a.jpg"),
+            MoveOp(src=inbox / "b.mp4", dst=out / "b.mp4"),
+            SkipOp(src=inbox / "c.jpg", reason="duplicate"),
+        ]
+    )
+
+
+class TestEstimatePlanCost:
+    def test_copies_write_data_moves_are_renames(self, plan, tmp_path):
+        """Within a device only the copies write data."""
+        (cost,) = estimate_plan_cost(plan)
+        assert cost.path == tmp_path
+        assert cost.n_files == 2
+        assert cost.bytes_written == 100
+        assert cost.bytes_renamed == 1000
+        assert cost.free_bytes == shutil.disk_usage(tmp_path).free
+        assert cost.throughput is None
+
+    def test_hard_links_write_no_data(self, plan):
+        (cost,) = estimate_plan_cost(plan, CopyMethod.HARDLINK)
+        assert (cost.bytes_written, cost.bytes_renamed) == (0, 1100)
+        assert cost.required_bytes == 0
+
+    def test_completed_operations_not_counted(self, plan):
+        (cost,) = estimate_plan_cost(plan, done={1})
+        assert (cost.n_files, cost.bytes_written) == (1, 0)
+
+    def test_recorded_source_size_used(self, plan):
+        copy = plan.ops[1]
+        plan.ops[1] = CopyOp(src=copy.src, dst=copy.dst, src_size=5000)
+        (cost,) = estimate_plan_cost(plan)
+        assert cost.bytes_written == 5000
+
+    def test_probe(self, plan):
+        (cost,) = estimate_plan_cost(plan, probe=True)
+        assert cost.throughput > 0
+        assert cost.seconds == pytest.approx(100 / cost.throughput)
+
+
+class TestProbeWriteThroughput:
+    def test_temporary_file_removed(self, tmp_path):
+        assert probe_write_throughput(tmp_path, size=3 * 2**20 + 1) > 0
+        assert list(tmp_path.iterdir()) == []
+
+    def test_missing_folder(self, tmp_path):
+        assert probe_write_throughput(tmp_path / "missing") is None
+
+
+class TestCheckFreeSpace:
+    def test_enough_space(self, plan):
+        check_free_space(estimate_plan_cost(plan))
+
+    def test_lacking_space_refused(self, plan, monkeypatch):
+        monkeypatch.setattr(
+            shutil, "disk_usage", lambda path: DiskUsage(10**9, 10**9, 50)
+        )
+        costs = estimate_plan_cost(plan)
+        with pytest.raises(InsufficientDiskSpaceError):
+            check_free_space(costs)
+        assert "NOT ENOUGH SPACE" in format_plan_cost(costs)
+
+    def test_reserve_required(self, tmp_path):
+        reserve = default_settings.free_space_reserve
+        cost = DeviceCost(path=tmp_path, bytes_written=10, free_bytes=reserve)
+        assert not cost.has_space
+
+
+class TestFormatPlanCost:
+    def test_devices_and_duration(self, tmp_path):
+        cost = DeviceCost(
+            path=tmp_path,
+            n_files=3,
+            bytes_written=600 * 2**20,
+            free_bytes=2**30,
+            throughput=10 * 2**20,
+        )
+        text = format_plan_cost([cost])
+        assert f"{tmp_path}: 3 files, 600.0 MiB to write" in text
+        assert "~0:01:00 at 10 MiB/s" in text
+        assert "Expected duration: ~0:01:00" in text
@@ -1,7 +1,7 @@
 """Tests for the restore-original-filenames feature.
 
 Covers:
-- strip_copy_suffix (pure string helper)
+- strip_copy_suffix (pure string helper) and its vectorised strip_copy_suffixes
 - resolve_destination_names (collision-aware mapping)
 - build_file_operation_plan(restore_original_names=True) behaviour
 """
@@ -18,6 +18,7 @@ from filecluster.file_operations import (
     build_file_operation_plan,
     resolve_destination_names,
     strip_copy_suffix,
+    strip_copy_suffixes,
 )
 
 
@@ -50,6 +51,20 @@ class TestStripCopySuffix:
         """Files without an extension are handled."""
         assert strip_copy_suffix("README-Kopiuj(1)") == "README"
 
+    def test_vectorised_matches_pure_helper(self):
+        """strip_copy_suffixes gives the same names as strip_copy_suffix."""
+        names = [
+            "IMG_0017-Kopiuj(2).HEIC",
+            "photo - Copy (3).jpg",
+            "photo(1).jpg",
+            "README-Kopiuj(1)",
+            "archive.tar.gz",
+            ".hidden",
+            "vacation.jpg",
+        ]
+        stripped = strip_copy_suffixes(pd.Series(names))
+        assert stripped.tolist() == [strip_copy_suffix(n) for n in names]
+
 
 class TestResolveDestinationNames:
     """Tests for the collision-aware destination-name resolver."""
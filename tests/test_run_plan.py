@@ -0,0 +1,57 @@
+"""Tests for executing saved plans."""
+
+from pathlib import Path
+
+from filecluster.file_operations import (
+    FileOperationPlan,
+    MkdirOp,
+    MoveOp,
+    SkipOp,
+    load_plan,
+    save_plan,
+)
+from filecluster.journal import PlanJournal
+from filecluster.run_plan import run_saved_plan
+
+
+def _save_move_plan(tmp_path: Path) -> Path:
+    inbox, out = tmp_path / "inbox", tmp_path / "out"
+    inbox.mkdir()
+    ops: list = [MkdirOp(path=out)]
+    for name in ("a.jpg", "b.jpg"):
+        (inbox / name).write_text(name)
+        ops.append(MoveOp(src=inbox / name, dst=out / name))
+    plan_path = tmp_path / "plan.jsonl"
+    save_plan(FileOperationPlan(ops=ops), plan_path)
+    return plan_path
+
+
+class TestRunSavedPlan:
+    def test_plan_is_executed(self, tmp_path):
+        plan_path = _save_move_plan(tmp_path)
+        plan = run_saved_plan(plan_path)
+        assert plan.n_moves == 2
+        assert (tmp_path / "out" / "b.jpg").read_text() == "b.jpg"
+        assert not Path(f"{plan_path}.journal").exists()
+
+    def test_changed_source_is_skipped(self, tmp_path):
+        plan_path = _save_move_plan(tmp_path)
+        (tmp_path / "inbox" / "a.jpg").write_text("edited after planning")
+        plan = run_saved_plan(plan_path)
+        assert isinstance(plan.ops[1], SkipOp)
+        assert (tmp_path / "inbox" / "a.jpg").exists()
+        assert (tmp_path / "out" / "b.jpg").exists()
+
+    def test_interrupted_execution_is_resumed(self, tmp_path):
+        plan_path = _save_move_plan(tmp_path)
+        journal_path = Path(f"{plan_path}.journal")
+        with PlanJournal.create(journal_path, load_plan(plan_path)) as journal:
+            (tmp_path / "out").mkdir()
+            (tmp_path / "inbox" / "a.jpg").rename(tmp_path / "out" / "a.jpg")
+            journal.mark_done(1)
+        run_saved_plan(plan_path)
+        assert sorted(p.name for p in (tmp_path / "out").iterdir()) == [
+            "a.jpg",
+            "b.jpg",
+        ]
+        assert not journal_path.exists()
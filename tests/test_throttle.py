@@ -0,0 +1,59 @@
+"""Tests for the I/O throttling of the plan execution."""
+
+import os
+import time
+
+import pytest
+
+from filecluster import throttle
+from filecluster.throttle import DeviceThrottle, TokenBucket, set_background_priority
+
+
+class TestTokenBucket:
+    def test_burst_is_not_delayed(self):
+        bucket = TokenBucket(rate=100, burst=10)
+        assert bucket.consume(10) == 0
+
+    def test_debt_is_waited_for(self):
+        bucket = TokenBucket(rate=100, burst=10)
+        start = time.monotonic()
+        bucket.consume(10)
+        delay = bucket.consume(20)
+        assert delay == pytest.approx(0.2, abs=0.02)
+        assert time.monotonic() - start >= 0.18
+
+    def test_bucket_is_refilled(self):
+        bucket = TokenBucket(rate=1000, burst=10)
+        bucket.consume(10)
+        time.sleep(0.02)
+        assert bucket.consume(10) == 0
+
+    def test_rate_must_be_positive(self):
+        with pytest.raises(ValueError):
+            TokenBucket(rate=0)
+
+
+class TestDeviceThrottle:
+    def test_unlimited(self):
+        limits = DeviceThrottle()
+        start = time.monotonic()
+        limits.operation()
+        limits.transfer(2**40)
+        assert time.monotonic() - start < 0.1
+
+    def test_operations_limited(self):
+        limits = DeviceThrottle(ops_per_second=50)
+        start = time.monotonic()
+        for _ in range(55):
+            limits.operation()
+        # the burst of 50 operations, then 5 more at 50/s
+        assert time.monotonic() - start >= 0.08
+
+
+class TestSetBackgroundPriority:
+    def test_niceness_increased(self, monkeypatch):
+        increments = []
+        monkeypatch.setattr(os, "nice", increments.append, raising=False)
+        monkeypatch.setattr(throttle, "_set_lowest_io_priority", lambda: True)
+        set_background_priority(niceness=5)
+        assert increments == [5]
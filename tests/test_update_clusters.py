@@ -15,19 +15,30 @@ from pathlib import Path
 import pandas as pd
 import pytest
 
+from filecluster.filecluster_types import ClusterRow
 from filecluster.update_clusters import (
+    FINGERPRINT_SECTION,
+    compute_folder_fingerprint,
     dict_from_ini_range_section,
     fast_scandir,
     get_or_create_library_cluster_ini_as_dataframe,
+    get_this_ini,
     identify_folder_types,
     initialize_cluster_info_dict,
+    is_cluster_ini_corrupt,
+    is_cluster_ini_fresh,
     is_event,
     is_event_folder,
     is_event_subcategory_folder,
     is_sel_folder,
     is_year_folder,
+    iter_subfolders,
+    merge_cluster_info,
     read_cluster_ini_as_dict,
+    read_cluster_row,
+    repair_library_cluster_inis,
     save_cluster_ini,
+    save_cluster_inis,
     str_to_bool,
     validate_library_structure,
 )
@@ -149,6 +160,163 @@ class TestClusterIniRoundTrip:
         assert result["path"] == tmp_path
 
 
+# ---------------------------------------------------------------------------
+# Folder fingerprint
+# ---------------------------------------------------------------------------
+class TestFolderFingerprint:
+    """The fingerprint decides which folders are rescanned with force_deep_scan."""
+
+    @staticmethod
+    def _save_ini(path, file_count=1):
+        ini = initialize_cluster_info_dict(
+            start="2020-01-01 12:00:00",
+            stop="2020-01-01 12:00:00",
+            is_continuous=True,
+            median="2020-01-01 12:00:00",
+            file_count=file_count,
+        )
+        save_cluster_ini(ini, path)
+
+    def test_ini_file_is_excluded(self, tmp_path):
+        (tmp_path / "a.jpg").write_bytes(b"abc")
+        before = compute_folder_fingerprint(tmp_path)
+        self._save_ini(tmp_path)
+        after = compute_folder_fingerprint(tmp_path)
+        assert before["digest"] == after["digest"]
+        assert after["file_count"] == "1"
+        assert after["total_bytes"] == "3"
+
+    def test_saved_ini_contains_fingerprint(self, tmp_path):
+        (tmp_path / "a.jpg").write_bytes(b"abc")
+        self._save_ini(tmp_path)
+        assert FINGERPRINT_SECTION in read_cluster_ini_as_dict(tmp_path)
+        assert is_cluster_ini_fresh(tmp_path)
+
+    def test_new_file_makes_ini_stale(self, tmp_path):
+        (tmp_path / "a.jpg").write_bytes(b"abc")
+        self._save_ini(tmp_path)
+        (tmp_path / "b.jpg").write_bytes(b"def")
+        assert not is_cluster_ini_fresh(tmp_path)
+
+    def test_ini_without_fingerprint_is_stale(self, tmp_path):
+        (tmp_path / ".cluster.ini").write_text(
+            "[Range]\nstart_date = 2020-01-01 12:00:00\n"
+        )
+        assert not is_cluster_ini_fresh(tmp_path)
+
+    def test_force_deep_scan_keeps_fresh_ini(self, tmp_path):
+        """An unchanged folder is not rescanned - the stored values are returned."""
+        event = tmp_path / "2020" / "[2020_01_01]_event"
+        event.mkdir(parents=True)
+        (event / "a.jpg").write_bytes(b"abc")
+        self._save_ini(event, file_count=42)
+        res = get_this_ini(("2020/[2020_01_01]_event",), True, tmp_path)
+        assert res.file_count == 42
+
+
+class TestLibraryScanScheduler:
+    """Folders with ini files are read in threads, the others are scanned."""
+
+    def test_ini_read_and_scanned_folders_are_merged(self, tmp_path):
+        import multiprocessing
+
+        from PIL import Image
+
+        with_ini = tmp_path / "2020" / "[2020_01_01]_a"
+        with_ini.mkdir(parents=True)
+        TestFolderFingerprint._save_ini(with_ini, file_count=42)
+        to_scan = tmp_path / "2020" / "[2020_02_02]_b"
+        to_scan.mkdir()
+        Image.new("RGB", (8, 8)).save(to_scan / "IMG_1.jpg")
+        empty = tmp_path / "2020" / "[2020_03_03]_c"
+        empty.mkdir()
+
+        with multiprocessing.Pool(processes=1) as pool:
+            df, empty_dirs = get_or_create_library_cluster_ini_as_dataframe(
+                tmp_path, pool, use_catalog=False
+            )
+        assert df.path.tolist() == [with_ini, to_scan]
+        assert df.file_count.tolist() == [42, 1]
+        assert empty_dirs == [empty]
+        assert (to_scan / ".cluster.ini").exists()
+
+
+class TestMergeClusterInfo:
+    """Cluster info is updated from the dates of added media only."""
+
+    base = ClusterRow(
+        start_date=datetime(2020, 1, 1, 10),
+        end_date=datetime(2020, 1, 1, 12),
+        is_continuous=True,
+        median=datetime(2020, 1, 1, 11),
+        file_count=3,
+        path=Path("/lib/2020/event"),
+    )
+
+    def test_new_cluster(self):
+        dates = pd.to_datetime(["2020-01-01 10:00", "2020-01-01 10:30"])
+        ini = merge_cluster_info(None, list(dates), 3600)
+        assert ini["Range"]["start_date"] == "2020-01-01 10:00:00"
+        assert ini["Range"]["file_count"] == "2"
+        assert ini["Range"]["is_continuous"] == "True"
+
+    def test_extends_range_and_count(self):
+        dates = pd.to_datetime(["2020-01-01 12:30"])
+        ini = merge_cluster_info(self.base, list(dates), 3600)
+        assert ini["Range"]["start_date"] == "2020-01-01 10:00:00"
+        assert ini["Range"]["end_date"] == "2020-01-01 12:30:00"
+        assert ini["Range"]["file_count"] == "4"
+        assert ini["Range"]["is_continuous"] == "True"
+
+    def test_far_media_break_continuity(self):
+        dates = pd.to_datetime(["2020-01-01 15:00"])
+        ini = merge_cluster_info(self.base, list(dates), 3600)
+        assert ini["Range"]["is_continuous"] == "False"
+
+    def test_merged_info_is_saved(self, tmp_path):
+        dates = pd.to_datetime(["2020-01-01 11:30"])
+        save_cluster_inis(
+            [(merge_cluster_info(self.base, list(dates), 3600), tmp_path)]
+        )
+        assert read_cluster_row(tmp_path).file_count == 4
+        assert is_cluster_ini_fresh(tmp_path)
+
+
+class TestAtomicIniWrites:
+    """Ini files are replaced atomically, corrupt ones are regenerated."""
+
+    def test_no_temporary_file_is_left(self, tmp_path):
+        TestFolderFingerprint._save_ini(tmp_path)
+        TestFolderFingerprint._save_ini(tmp_path)
+        assert [p.name for p in tmp_path.iterdir()] == [".cluster.ini"]
+
+    def test_truncated_ini_is_corrupt(self, tmp_path):
+        TestFolderFingerprint._save_ini(tmp_path)
+        ini = tmp_path / ".cluster.ini"
+        ini.write_text(ini.read_text()[:40])
+        assert is_cluster_ini_corrupt(tmp_path)
+        assert read_cluster_row(tmp_path) is None
+
+    def test_repair_regenerates_only_corrupt_inis(self, tmp_path):
+        import multiprocessing
+
+        good = tmp_path / "2020" / "[2020_01_01]_good"
+        bad = tmp_path / "2020" / "[2020_01_02]_bad"
+        for folder in (good, bad):
+            folder.mkdir(parents=True)
+            (folder / "IMG_1.jpg").write_bytes(b"x")
+            TestFolderFingerprint._save_ini(folder, file_count=42)
+        (bad / ".cluster.ini").write_text("[Range]\nstart_da")
+        (good / ".cluster.ini.tmp").write_text("leftover")
+
+        with multiprocessing.Pool(processes=1) as pool:
+            repaired = repair_library_cluster_inis(tmp_path, pool)
+        assert repaired == [bad]
+        assert read_cluster_row(good).file_count == 42
+        assert read_cluster_row(bad).file_count == 1
+        assert not (good / ".cluster.ini.tmp").exists()
+
+
 # ---------------------------------------------------------------------------
 # dict_from_ini_range_section
 # ---------------------------------------------------------------------------
@@ -222,6 +390,14 @@ class TestFastScandir:
         """Empty dirname returns empty list."""
         assert fast_scandir("") == []
 
+    def test_iter_subfolders_is_lazy_and_ordered(self, tmp_path):
+        """Folders are yielded while walking, each folder before its subfolders."""
+        (tmp_path / "b" / "x").mkdir(parents=True)
+        (tmp_path / "a").mkdir()
+        walker = iter_subfolders(str(tmp_path))
+        assert next(walker) == str(tmp_path / "a")
+        assert list(walker) == [str(tmp_path / "b"), str(tmp_path / "b" / "x")]
+
 
 # ---------------------------------------------------------------------------
 # Folder type identification
@@ -270,9 +446,19 @@ class TestFolderTypeIdentification:
         assert is_sel_folder("selection") is False
         assert is_sel_folder("sel/subfolder") is False
 
-    def test_is_event_subcategory_folder_always_false(self):
-        """Currently unimplemented — always returns False."""
-        assert is_event_subcategory_folder("any/path") is False
+    @pytest.mark.parametrize(
+        "path, expected",
+        [
+            ("2020/[2020_01_01]_trip/day_1", True),
+            ("/home/2020/[2020_01_01]_trip/day_1", True),
+            ("2020/[2020_01_01]_trip/sel", False),
+            ("2020/[2020_01_01]_trip", False),
+            ("2020/[2020_01_01]_trip/day_1/deeper", False),
+            ("any/path", False),
+        ],
+    )
+    def test_is_event_subcategory_folder(self, path, expected):
+        assert is_event_subcategory_folder(path) is expected
 
     def test_identify_folder_types_labels_correctly(self):
         """
@@ -295,6 +481,10 @@ class TestFolderTypeIdentification:
         assert types["2020/[2020_01_01]_event/sel"] == "sel"
         assert types["random_folder"] == "unknown"
 
+    def test_event_subfolder_is_labelled_sub_event(self):
+        result = identify_folder_types(["2020/[2020_01_01]_trip/day_1"])
+        assert result == [("2020/[2020_01_01]_trip/day_1", "sub_event")]
+
     def test_is_event_filters_tuples(self):
         """is_event returns True only for event-type tuples."""
         assert is_event(("2020/event", "event")) is True
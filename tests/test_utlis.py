@@ -14,6 +14,7 @@ from filecluster.exceptions import DateStringNoneError
 from filecluster.utlis import (
     create_folder_for_cluster,
     get_date_from_file,
+    get_device_id,
     get_exif_date,
     get_thumbnail,
     hash_file,
@@ -280,3 +281,8 @@ class TestImageConversion:
         html = image_formatter(im_base64=img_pth)
         assert html.startswith('<img src="data:image/jpeg;base64,')
         assert html.endswith('">')
+
+
+class TestGetDeviceId:
+    def test_missing_path_uses_existing_parent(self, tmp_path):
+        assert get_device_id(tmp_path / "not" / "yet") == get_device_id(tmp_path)
@@ -0,0 +1,35 @@
+"""Tests for the shared worker pool."""
+
+from filecluster.configuration import FileClusterSettings
+from filecluster.image_reader import InboxReader
+from filecluster.workers import create_worker_pool, get_worker_settings
+
+
+def _settings_id(_):
+    return id(get_worker_settings())
+
+
+class TestWorkerPool:
+    def test_settings_are_reused_by_worker_tasks(self):
+        with create_worker_pool(1) as pool:
+            ids = pool.map(_settings_id, range(20))
+        assert len(set(ids)) == 1
+
+    def test_settings_in_main_process(self):
+        assert isinstance(get_worker_settings(), FileClusterSettings)
+        assert get_worker_settings() is get_worker_settings()
+
+
+class TestInboxReaderWithPool:
+    def test_pool_gives_same_rows_as_serial_read(self, tmp_path):
+        for i in range(3):
+            (tmp_path / f"IMG_{i}.jpg").write_bytes(bytes([i]) * 100)
+        (tmp_path / "notes.txt").write_text("skip me")
+
+        serial = InboxReader(tmp_path).get_data_from_files_as_list_of_rows()
+        with create_worker_pool(2) as pool:
+            parallel = InboxReader(
+                tmp_path, pool=pool
+            ).get_data_from_files_as_list_of_rows()
+        assert parallel == serial
+        assert len(parallel) == 3